@@ -1,26 +1,162 @@
-from django.contrib import admin
+import datetime
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import DateField, ExpressionWrapper, F, Prefetch, Q
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.text import smart_split, unescape_string_literal
 
 # Register your models here.
+from .autocomplete import prefix_aliases, prefix_match
 from .models import Author, Genre, Book, BookInstance, Language
+from .models import CatalogCounter
+from .pagination import EstimatedCountPaginator
+
+# Related objects shown by an inline; the rest are reached through a
+# link to the (paginated) changelist
+INLINE_LIMIT = 20
 
 # admin.site.register(Book)
 # admin.site.register(Author)
 admin.site.register(Genre)
 # admin.site.register(BookInstance)
-admin.site.register(Language)
+
+
+class PrefixSearchMixin:
+    """
+    ModelAdmin searching its '^field' search fields with prefix_match(),
+    which the PrefixIndex of the fields serves, instead of the
+    ``__istartswith`` lookup, which no index serves. '=field' fields are
+    matched exactly rather than with ``__iexact`` (UPPER(field) = ...), so
+    their plain index serves them too and the OR of both stays indexed;
+    '@field' and the other fields take the usual search and icontains.
+    """
+
+    LOOKUPS = {'=': 'exact', '@': 'search'}
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        prefixed = [field[1:] for field in search_fields
+                    if field.startswith('^')]
+        if not prefixed or not search_term:
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        lookups = [
+            '%s__%s' % (field[1:], self.LOOKUPS[field[0]])
+            if field[0] in self.LOOKUPS else '%s__icontains' % field
+            for field in search_fields if not field.startswith('^')]
+        queryset = queryset.alias(**prefix_aliases(prefixed))
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            queryset = queryset.filter(prefix_match(prefixed, bit) | Q(
+                *[(lookup, bit) for lookup in lookups], _connector=Q.OR))
+        return queryset, any(lookup_spawns_duplicates(self.opts, path)
+                             for path in prefixed + lookups)
+
+
+@admin.register(Language)
+class LanguageAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    search_fields = ('^name',)
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):
+    """Inline formset with the first INLINE_LIMIT related objects only."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not queryset.query.is_sliced:
+            queryset = self._queryset = queryset[:INLINE_LIMIT]
+        return queryset
+
+    def _existing_object(self, pk):
+        # A submitted row may have moved out of the first page since the
+        # form was rendered
+        obj = super()._existing_object(pk)
+        if obj is None:
+            obj = self.queryset.filter(pk=pk).first()
+        return obj
+
+
+class StatusCountFilter(admin.ChoicesFieldListFilter):
+    """Loan status filter showing the number of copies of every status,
+    read from the catalog counters instead of counted. The counters count
+    the whole catalog, so they are left out when other filters or a search
+    narrow the list."""
+
+    def choices(self, changelist):
+        choices = super().choices(changelist)
+        narrowed = set(changelist.get_filters_params()).difference(
+            self.expected_parameters())
+        if narrowed or changelist.query:
+            yield from choices
+            return
+        counts = CatalogCounter.objects.snapshot()
+        yield next(choices)
+        for (status, title), choice in zip(self.field.flatchoices, choices):
+            choice['display'] = '%s (%s)' % (title, counts.get(
+                CatalogCounter.status_counter(status), 0))
+            yield choice
+
+
+class CirculationActionForm(ActionForm):
+    """Action bar with the arguments of the circulation actions."""
+    days = forms.IntegerField(min_value=1, max_value=365, initial=14,
+                              required=False)
+    status = forms.ChoiceField(
+        required=False, choices=[('', '---------')] + [
+            choice for choice in BookInstance.LOAN_STATUS
+            if choice[0] != 'o'])
+
+
+def changelist_link(obj, related, lookup):
+    """Link to the changelist of the ``related`` objects of ``obj``."""
+    if obj is None or obj.pk is None:
+        return '-'
+    manager = getattr(obj, related)
+    opts = manager.model._meta
+    url = reverse('admin:%s_%s_changelist' % (opts.app_label,
+                                              opts.model_name))
+    return format_html('<a href="{}?{}={}">{} {}</a>', url, lookup, obj.pk,
+                       manager.count(), opts.verbose_name_plural)
 
 
 class BooksInline(admin.TabularInline):
     model = Book
     extra = 0
+    formset = LimitedInlineFormSet
+    ordering = ('title', 'id')
+    # Foreign keys are shown read-only (their widgets would look the
+    # current value up row by row) and edited on the book page
+    fields = ('title', 'isbn', 'language')
+    readonly_fields = ('language',)
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('language')
 # Define the admin class
 
 
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(PrefixSearchMixin, admin.ModelAdmin):
     list_display = ('last_name', 'first_name',
                     'date_of_birth', 'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
     inlines = [BooksInline]
+    search_fields = ('^last_name', '^first_name')
+    readonly_fields = ('all_books',)
+
+    def get_fields(self, request, obj=None):
+        return super().get_fields(request, obj) + ['all_books']
+
+    @admin.display(description='Books')
+    def all_books(self, obj):
+        return changelist_link(obj, 'book_set', 'author__id__exact')
 
 
 # Register the admin class with the associated model
@@ -32,18 +168,49 @@ admin.site.register(Author, AuthorAdmin)
 class BooksInstanceInline(admin.TabularInline):
     model = BookInstance
     extra = 0
+    formset = LimitedInlineFormSet
+    ordering = ('due_back', 'id')
+    fields = ('imprint', 'status', 'due_back', 'borrower')
+    readonly_fields = ('borrower',)
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('book',
+                                                            'borrower')
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(PrefixSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
     inlines = [BooksInstanceInline]
+    # Counts from the catalog counters or the planner, not COUNT(*)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('^title', '=isbn')
+    autocomplete_fields = ('author', 'language')
+    readonly_fields = ('all_copies',)
+
+    def get_queryset(self, request):
+        # The genres of the whole page in one query, for display_genre
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('genre', queryset=Genre.objects.only('name')))
+
+    @admin.display(description='Copies')
+    def all_copies(self, obj):
+        return changelist_link(obj, 'bookinstance_set', 'book__id__exact')
 
 
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('borrower',)
+    # Counts from the catalog counters or the planner, not COUNT(*)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {
@@ -53,3 +220,59 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields': ('status', 'due_back', 'borrower')
         }),
     )
+
+    action_form = CirculationActionForm
+    actions = ['mark_returned', 'extend_due_back', 'set_status']
+
+    def update_copies(self, request, queryset, message, **values):
+        """Applies ``values`` to the selected copies with one UPDATE."""
+        with transaction.atomic(using=queryset.db):
+            rows = queryset.update(**values)
+        self.message_user(request, message % rows, messages.SUCCESS)
+
+    def action_argument(self, request, name):
+        """Value of the action bar field ``name``, or None (reported to
+        the user) if it is missing or invalid."""
+        try:
+            value = self.action_form.base_fields[name].clean(
+                request.POST.get(name))
+        except ValidationError:
+            value = None
+        if value:
+            return value
+        self.message_user(request, 'Choose a valid %s.' % name,
+                          messages.ERROR)
+
+    @admin.action(permissions=['change'],
+                  description='Mark selected copies as returned')
+    def mark_returned(self, request, queryset):
+        self.update_copies(request, queryset.on_loan(),
+                           '%d copies marked as returned.',
+                           status='a', borrower=None, due_back=None)
+
+    @admin.action(permissions=['change'],
+                  description='Extend the due date of selected loans by '
+                              'the given days')
+    def extend_due_back(self, request, queryset):
+        days = self.action_argument(request, 'days')
+        if days:
+            self.update_copies(
+                request, queryset.on_loan().filter(due_back__isnull=False),
+                '%%d loans extended by %d days.' % days,
+                due_back=ExpressionWrapper(
+                    F('due_back') + datetime.timedelta(days=days),
+                    output_field=DateField()))
+
+    @admin.action(permissions=['change'],
+                  description='Set the given status on selected copies')
+    def set_status(self, request, queryset):
+        status = self.action_argument(request, 'status')
+        if status:
+            # Copies leaving a loan are no longer borrowed
+            self.update_copies(request, queryset,
+                               '%d copies updated.', status=status,
+                               borrower=None, due_back=None)
+
+    def get_list_filter(self, request):
+        return [(field, StatusCountFilter) if field == 'status' else field
+                for field in self.list_filter]
@@ -0,0 +1,319 @@
+"""
+Read-only JSON API over books, authors and copies.
+
+Lists are cursor paginated (see pagination.py) and every endpoint takes a
+``?fields=`` projection: only the columns of the requested fields are
+loaded, with .only(), so for instance a book ``summary`` is never read
+unless it is asked for. Related data (author, genres, availability, the
+books of an author) is embedded with a fixed number of queries per page.
+Responses carry an ETag, and a matching ``If-None-Match`` gets a 304.
+"""
+
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Prefetch, Q
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import urlencode
+
+from .middleware import query_budget
+from .models import Author, Book, BookInstance, Genre
+from .pagination import KeysetPaginator
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Maximum number of ISBNs plus copy ids of a batch lookup
+MAX_LOOKUP = 100
+
+
+def book_genres(queryset):
+    return queryset.prefetch_related(
+        Prefetch('genre', queryset=Genre.objects.only('name')))
+
+
+def author_books(queryset):
+    return queryset.prefetch_related(Prefetch(
+        'book_set',
+        queryset=Book.objects.order_by('title', 'id').only(
+            'id', 'title', 'author')))
+
+
+class Field:
+    """A field of an API resource: the model fields it loads, how the
+    queryset fetches its related data and how it is rendered."""
+
+    def __init__(self, only=(), related=None, render=None):
+        self.only = only
+        self.related = related
+        self.render = render
+
+
+def _related_book(copy):
+    book = copy.book
+    return book and {'id': book.id, 'title': book.title, 'isbn': book.isbn,
+                     'url': book.get_absolute_url()}
+
+
+class Resource:
+    """A model exposed by the API."""
+    model = None
+    name = None
+    keys = ('id',)
+    fields = {}
+    default_fields = ()
+
+    def get_fields(self, request):
+        """Names of the fields requested with ``?fields=`` (the primary key
+        is always included)."""
+        requested = request.GET.get('fields')
+        if not requested:
+            return ['id'] + [f for f in self.default_fields if f != 'id']
+        names = ['id'] + [name.strip() for name in requested.split(',')
+                          if name.strip() and name.strip() != 'id']
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError('Unknown fields: %s. Available: %s.' % (
+                ', '.join(unknown), ', '.join(self.fields)))
+        return list(dict.fromkeys(names))
+
+    def get_queryset(self, names):
+        only = set(key.lstrip('-') for key in self.keys)
+        queryset = self.model.objects.all()
+        related = []
+        for name in names:
+            field = self.fields[name]
+            only.update(field.only)
+            if field.related:
+                queryset = field.related(queryset)
+            related.extend(f.split('__')[0] for f in field.only if '__' in f)
+        if related:
+            # The foreign keys are loaded along with the related columns
+            only.update(related)
+            queryset = queryset.select_related(*set(related))
+        return queryset.only(*only)
+
+    def render(self, objs, names):
+        """Returns the JSON data of ``objs`` (a page)."""
+        return [
+            {name: (self.fields[name].render(obj) if self.fields[name].render
+                    else getattr(obj, name)) for name in names}
+            for obj in objs
+        ]
+
+
+class BookResource(Resource):
+    model = Book
+    name = 'books'
+    keys = ('title', 'id')
+    fields = {
+        'id': Field(['id']),
+        'title': Field(['title']),
+        'isbn': Field(['isbn']),
+        'summary': Field(['summary']),
+        'language': Field(['language__name'],
+                          render=lambda b: b.language and b.language.name),
+        'author': Field(
+            ['author__id', 'author__first_name', 'author__last_name'],
+            render=lambda b: b.author and {
+                'id': b.author.id, 'first_name': b.author.first_name,
+                'last_name': b.author.last_name}),
+        'genres': Field(related=book_genres,
+                        render=lambda b: [g.name for g in b.genre.all()]),
+        'availability': Field(render=lambda b: b.availability),
+        'url': Field(render=lambda b: b.get_absolute_url()),
+    }
+    default_fields = ('title', 'isbn', 'author', 'url')
+
+    def render(self, objs, names):
+        if 'availability' in names:
+            # Copies of the whole page in one query
+            counts = {
+                row['book']: row for row in
+                BookInstance.objects.filter(book__in=objs).order_by()
+                .values('book').annotate(
+                    total=Count('pk'),
+                    available=Count('pk', filter=Q(status='a')))
+            }
+            for book in objs:
+                row = counts.get(book.pk, {'total': 0, 'available': 0})
+                book.availability = {'total': row['total'],
+                                     'available': row['available']}
+        return super().render(objs, names)
+
+
+class AuthorResource(Resource):
+    model = Author
+    name = 'authors'
+    keys = ('last_name', 'first_name', 'id')
+    fields = {
+        'id': Field(['id']),
+        'first_name': Field(['first_name']),
+        'last_name': Field(['last_name']),
+        'date_of_birth': Field(['date_of_birth']),
+        'date_of_death': Field(['date_of_death']),
+        'books': Field(related=author_books, render=lambda a: [
+            {'id': b.id, 'title': b.title, 'url': b.get_absolute_url()}
+            for b in a.book_set.all()]),
+        'url': Field(render=lambda a: a.get_absolute_url()),
+    }
+    default_fields = ('first_name', 'last_name', 'date_of_birth',
+                      'date_of_death', 'url')
+
+
+class CopyResource(Resource):
+    model = BookInstance
+    name = 'copies'
+    keys = ('id',)
+    fields = {
+        'id': Field(['id']),
+        'book': Field(['book__id', 'book__title', 'book__isbn'],
+                      render=_related_book),
+        'imprint': Field(['imprint']),
+        'status': Field(['status']),
+        'due_back': Field(['due_back']),
+    }
+    default_fields = ('book', 'status', 'due_back')
+
+
+RESOURCES = {resource.name: resource()
+             for resource in (BookResource, AuthorResource, CopyResource)}
+
+
+def _error(status, message):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _json(request, data):
+    """JSON response with an ETag; a 304 if the client has it already."""
+    content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+    etag = '"%s"' % hashlib.md5(content.encode()).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def _resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise Http404('Unknown resource.')
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return '%s?%s' % (request.path, urlencode(sorted(params.items())))
+
+
+@query_budget(4)
+def api_list(request, resource):
+    """Cursor paginated list of a resource."""
+    resource = _resource(resource)
+    try:
+        names = resource.get_fields(request)
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        if limit < 1:
+            raise ValueError('limit must be positive.')
+    except ValueError as error:
+        return _error(400, str(error))
+    paginator = KeysetPaginator(resource.get_queryset(names), limit,
+                                resource.keys, count=False)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except Http404:
+        return _error(400, 'Invalid cursor.')
+    return _json(request, {
+        'results': resource.render(page.object_list, names),
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+    })
+
+
+@query_budget(4)
+def api_detail(request, resource, pk):
+    """A single object of a resource."""
+    resource = _resource(resource)
+    try:
+        names = resource.get_fields(request)
+    except ValueError as error:
+        return _error(400, str(error))
+    try:
+        pk = resource.model._meta.pk.to_python(pk)
+    except ValidationError:
+        return _error(404, 'Not found.')
+    obj = resource.get_queryset(names).filter(pk=pk).first()
+    if obj is None:
+        return _error(404, 'Not found.')
+    return _json(request, resource.render([obj], names)[0])
+
+
+def _values(request, name):
+    """Values of a GET parameter given repeated and/or comma-separated."""
+    return list(dict.fromkeys(
+        value.strip() for param in request.GET.getlist(name)
+        for value in param.split(',') if value.strip()))
+
+
+@query_budget(2)
+def api_lookup(request):
+    """
+    Looks up many books (``?isbn=``) and copies (``?copy=``) at once, with
+    one query per model, through the unique ISBN index and the copy
+    primary key. Values not found (or malformed) map to null.
+    """
+    isbns = _values(request, 'isbn')
+    copy_ids = _values(request, 'copy')
+    if len(isbns) + len(copy_ids) > MAX_LOOKUP:
+        return _error(400, 'At most %d values can be looked up at once.'
+                      % MAX_LOOKUP)
+    books = {}
+    if isbns:
+        books = {
+            book.isbn: {
+                'id': book.id, 'title': book.title, 'isbn': book.isbn,
+                'url': book.get_absolute_url(),
+                'availability': {'total': book.num_copies,
+                                 'available': book.num_available},
+            }
+            for book in Book.objects.filter(isbn__in=isbns).order_by()
+            .only('id', 'title', 'isbn').annotate(
+                num_copies=Count('bookinstance'),
+                num_available=Count('bookinstance', filter=Q(
+                    bookinstance__status='a')))
+        }
+    uuids = {}
+    for value in copy_ids:
+        try:
+            uuids[value] = BookInstance._meta.pk.to_python(value)
+        except ValidationError:
+            pass
+    copies = {}
+    if uuids:
+        copies = {
+            copy.pk: {'id': copy.pk, 'status': copy.status,
+                      'due_back': copy.due_back, 'book': _related_book(copy)}
+            for copy in BookInstance.objects.filter(pk__in=uuids.values())
+            .select_related('book').only(
+                'id', 'status', 'due_back', 'book__id', 'book__title',
+                'book__isbn')
+        }
+    return _json(request, {
+        'books': {isbn: books.get(isbn) for isbn in isbns},
+        'copies': {value: copies.get(uuids.get(value))
+                   for value in copy_ids},
+    })
+
+
+def api_root(request):
+    """Links to the resources."""
+    return JsonResponse({name: request.build_absolute_uri(
+        reverse('api-list', args=[name])) for name in RESOURCES})
@@ -0,0 +1,94 @@
+"""
+Prefix search of authors, genres and languages for the book form pickers.
+
+Each source filters on the leading characters of the lower cased name
+columns, which PrefixIndex indexes, and returns the first AUTOCOMPLETE_LIMIT
+matches in index order. Results are
+cached per (source, prefix) for ``CATALOG_AUTOCOMPLETE_TIMEOUT`` seconds;
+saving or deleting an object of a source bumps its cache version, so the
+next lookups see the change (see signals.py).
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .caching import cache_fill
+from .models import Author, Genre, Language
+
+# Maximum number of options returned for a prefix
+AUTOCOMPLETE_LIMIT = 20
+
+# Maximum length of a searched prefix
+MAX_PREFIX = 50
+
+
+def prefix_aliases(fields):
+    """Aliases of the lower cased ``fields``, for prefix_match()."""
+    return {'prefix_%d' % i: Lower(field) for i, field in enumerate(fields)}
+
+
+def prefix_match(fields, word):
+    """Condition of ``word`` starting one of ``fields``, ignoring case, on
+    a queryset with their prefix_aliases(). Unlike ``__istartswith`` it is
+    served by the PrefixIndex of the fields."""
+    return Q(*[Q(**{'prefix_%d__startswith' % i: word.lower()})
+               for i in range(len(fields))], _connector=Q.OR)
+
+
+class Source:
+    """Objects of ``model`` found by the prefix of ``search_fields``; with
+    ``words``, every word of the prefix must start one of the fields."""
+
+    def __init__(self, model, search_fields, ordering, words=False):
+        self.model = model
+        self.search_fields = search_fields
+        self.ordering = ordering
+        self.words = words
+
+    def search(self, prefix):
+        queryset = self.model.objects.alias(
+            **prefix_aliases(self.search_fields)).order_by(*self.ordering)
+        for word in (prefix.split() if self.words else [prefix]):
+            queryset = queryset.filter(prefix_match(self.search_fields, word))
+        return [{'id': obj.pk, 'text': str(obj)}
+                for obj in queryset[:AUTOCOMPLETE_LIMIT]]
+
+
+SOURCES = {
+    'author': Source(Author, ['last_name', 'first_name'],
+                     ['last_name', 'first_name', 'id'], words=True),
+    'genre': Source(Genre, ['name'], ['name']),
+    'language': Source(Language, ['name'], ['name', 'id']),
+}
+
+# Source of the objects of every model
+MODEL_SOURCES = {source.model: name for name, source in SOURCES.items()}
+
+
+def _version_key(name):
+    return 'catalog:autocomplete:%s:version' % name
+
+
+def autocomplete(name, prefix):
+    """Returns the options of source ``name`` starting with ``prefix``
+    (a list of {id, text}), from the cache when possible."""
+    prefix = ' '.join(prefix.split())[:MAX_PREFIX].lower()
+    version = cache.get_or_set(_version_key(name), 1, None)
+    key = 'catalog:autocomplete:%s:%s:%s' % (
+        name, version, hashlib.md5(prefix.encode()).hexdigest())
+    return cache_fill(
+        key, lambda: SOURCES[name].search(prefix),
+        getattr(settings, 'CATALOG_AUTOCOMPLETE_TIMEOUT', 300))
+
+
+def invalidate_autocomplete(name):
+    """Makes the cached options of source ``name`` stale."""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        # No version yet: nothing is cached
+        pass
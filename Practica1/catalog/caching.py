@@ -0,0 +1,220 @@
+"""
+Cache fills without stampedes, and the cached book and author detail pages.
+
+cache_fill() keeps a value with its soft expiry and the time it took to
+compute. Before the expiry it is refreshed early with a probability that
+grows as the expiry nears (the "XFetch" rule), so a hot key is usually
+recomputed once before it expires. Only the worker holding a short lock
+(an atomic cache.add(), on the cache shared by every worker;
+see CACHES in the settings) recomputes; the others serve the stale value
+meanwhile, or, when there is none, wait briefly for it. The lock is not
+released but expires, so cached values are invalidated by changing their
+key (a version token in it), not by deleting it.
+
+The object-dependent parts of a detail page are cached under a key made
+of the object, a version token and the permissions the page depends on.
+Invalidating an object drops its version token, so every cached variant
+of its page is missed at once; invalidating more than INVALIDATE_ALL_OVER
+objects drops the generation token of their kind instead, which every key
+of the kind includes too. Since the tokens live in the shared cache, the
+pages are dropped for every worker. The signals and the bulk write paths
+call invalidate_details() for the objects they change, or touch_pages()
+for the objects whose pages show them (see signals.py and CountedQuerySet),
+once the transaction commits.
+Hits and misses are counted per kind of page, in the process, and added
+to the cache every METRICS_FLUSH_INTERVAL seconds. Anonymous visitors get whole
+pages, cached under the same version tokens (see views.py); the list pages
+use the time of the last invalidation of their kind, list_changed(), as
+theirs.
+
+This module only talks to the cache, so the models can import it.
+"""
+
+import collections
+import itertools
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+KINDS = ('book', 'author')
+
+# Seconds a worker may spend recomputing a value before others may try
+LOCK_TIMEOUT = 10
+
+# Invalidating more objects than this drops every page of their kind
+INVALIDATE_ALL_OVER = 1000
+
+# Seconds a worker waits for another one to compute a missing value
+FILL_WAIT = 2
+FILL_POLL = 0.05
+
+# Seconds a process keeps its hit and miss counts before adding them to
+# the cache
+METRICS_FLUSH_INTERVAL = 60
+
+# {(kind, 'hits' or 'misses'): number} not added to the cache yet
+_metrics = collections.Counter()
+_metrics_lock = threading.Lock()
+_metrics_flushed_at = time.monotonic()
+
+
+def cache_fill(key, compute, timeout, beta=1.0):
+    """Returns the value of ``key``, computed by ``compute()`` once among
+    concurrent callers and kept ``timeout`` seconds; stale values are kept
+    as long again and served while another caller recomputes them."""
+    entry = cache.get(key)
+    if entry is not None:
+        value, expiry, delta = entry
+        # 1 - random() is in (0, 1], so the log is finite and <= 0
+        if time.time() - delta * beta * math.log(1 - random.random()) \
+                < expiry:
+            return value
+    # The lock is left to expire: the cache cannot delete it only if it is
+    # still ours, and a fill longer than LOCK_TIMEOUT may have lost it to
+    # another caller. Invalidations change the key (and so the lock) rather
+    # than delete it, so a held lock only delays the next early refresh.
+    if cache.add(key + ':lock', 1, LOCK_TIMEOUT):
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        cache.set(key, (value, time.time() + timeout, delta), timeout * 2)
+        return value
+    if entry is not None:
+        return entry[0]
+    for _ in range(int(FILL_WAIT / FILL_POLL)):
+        time.sleep(FILL_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def _version_key(kind, pk):
+    return 'catalog:detail:%s:%s' % (kind, pk)
+
+
+def _generation_key(kind):
+    return 'catalog:detail-generation:%s' % kind
+
+
+def _list_key(kind):
+    return 'catalog:list-changed:%s' % kind
+
+
+def _metric_key(kind, outcome):
+    return 'catalog:detail-metrics:%s:%s' % (kind, outcome)
+
+
+def _count(kind, outcome):
+    """Counts a hit or miss in the process, and adds the counts of the
+    process to the cache every METRICS_FLUSH_INTERVAL seconds, so a hit
+    does not write to the cache."""
+    global _metrics_flushed_at
+    now = time.monotonic()
+    with _metrics_lock:
+        _metrics[kind, outcome] += 1
+        if now - _metrics_flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        _metrics_flushed_at = now
+    _flush_metrics()
+
+
+def _flush_metrics():
+    """Adds the counts of the process to the cache. On a database cache
+    incr() reads and writes the row, so two processes adding at once may
+    lose counts; it happens once a METRICS_FLUSH_INTERVAL at most."""
+    with _metrics_lock:
+        counts = dict(_metrics)
+        _metrics.clear()
+    for (kind, outcome), num in counts.items():
+        key = _metric_key(kind, outcome)
+        try:
+            cache.incr(key, num)
+        except ValueError:
+            if not cache.add(key, num, None):
+                cache.incr(key, num)
+
+
+def detail_key(kind, pk, variant=''):
+    """Cache key of the current version of a detail page."""
+    key = _version_key(kind, pk)
+    tokens = cache.get_many([_generation_key(kind), key])
+    for token_key in (_generation_key(kind), key):
+        if token_key not in tokens:
+            cache.add(token_key, uuid.uuid4().hex, None)
+            tokens[token_key] = cache.get(token_key)
+    return '%s:%s:%s:%s' % (key, tokens[_generation_key(kind)], tokens[key],
+                            variant)
+
+
+def cached_detail(kind, pk, variant, render, counted=True):
+    """Returns (content, hit): the cached content of a detail page, or
+    the result of ``render()``, which is then cached. Only ``counted``
+    lookups go into the metrics."""
+    rendered = []
+
+    def fill():
+        rendered.append(True)
+        return render()
+
+    content = cache_fill(
+        detail_key(kind, pk, variant), fill,
+        getattr(settings, 'CATALOG_DETAIL_CACHE_TIMEOUT', 600))
+    hit = not rendered
+    if counted:
+        _count(kind, 'hits' if hit else 'misses')
+    return content, hit
+
+
+def invalidate_details(kind, pks):
+    """Makes the cached detail pages of the objects ``pks`` stale.
+
+    Only the first INVALIDATE_ALL_OVER + 1 items of ``pks`` are read: with
+    more, every page of ``kind`` is made stale.
+    """
+    pks = list(itertools.islice(pks, INVALIDATE_ALL_OVER + 1))
+    if len(pks) > INVALIDATE_ALL_OVER:
+        invalidate_all_details(kind)
+        return
+    keys = [_version_key(kind, pk) for pk in set(pks) if pk is not None]
+    if keys:
+        cache.delete_many(keys)
+        cache.set(_list_key(kind), time.time(), None)
+
+
+def invalidate_all_details(kind):
+    """Makes every cached detail page of ``kind`` stale."""
+    cache.delete(_generation_key(kind))
+    cache.set(_list_key(kind), time.time(), None)
+
+
+def list_changed(kind):
+    """Timestamp of the last invalidation of pages of ``kind``. It changes
+    with every write to the objects of the kind, including those that
+    leave their latest modification time and their number alone (a
+    deletion and a creation, an object moving between list pages)."""
+    key = _list_key(kind)
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), None)
+        changed = cache.get(key)
+    return changed
+
+
+def detail_cache_metrics():
+    """Returns {kind: {'hits': n, 'misses': n}} since the cache started;
+    other processes' counts of the last METRICS_FLUSH_INTERVAL seconds are
+    still missing."""
+    _flush_metrics()
+    values = cache.get_many([_metric_key(kind, outcome) for kind in KINDS
+                             for outcome in ('hits', 'misses')])
+    return {
+        kind: {outcome: values.get(_metric_key(kind, outcome), 0)
+               for outcome in ('hits', 'misses')}
+        for kind in KINDS
+    }
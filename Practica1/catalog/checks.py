@@ -0,0 +1,28 @@
+"""
+System checks of the catalog configuration.
+"""
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """The fill locks and the page version tokens only work across
+    workers on a cache they all share."""
+    backend = settings.CACHES['default']['BACKEND']
+    if getattr(settings, 'RUNNING_TESTS', False) \
+            or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint='Set CACHE_URL to a redis:// URL so every worker sees the '
+             'same cached pages and invalidations.',
+        id='catalog.W001',
+    )]
@@ -0,0 +1,102 @@
+"""
+Streaming exports of the catalog as CSV or JSON Lines.
+
+Rows are read with values_list() projections through
+QuerySet.iterator(chunk_size), which uses a server-side cursor on
+PostgreSQL, and sent as soon as each chunk is read, so memory use stays
+flat and the first bytes go out right away whatever the size of the
+table. Book and copy exports have the columns that import_catalog reads.
+"""
+
+import csv
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .importer import GENRE_SEPARATOR
+from .loader import chunked
+from .models import Book, BookInstance
+
+# Rows read from the database (and sent to the client) at a time
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def book_rows(using='default'):
+    rows = (Book.objects.using(using).order_by('pk').values_list(
+        'pk', 'title', 'isbn', 'summary', 'author__first_name',
+        'author__last_name', 'language__name'))
+    for chunk in chunked(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE),
+                         EXPORT_CHUNK_SIZE):
+        # The genres of the whole chunk in one query
+        genres = defaultdict(list)
+        for book_id, name in (
+                Book.genre.through.objects.using(using)
+                .filter(book_id__in=[row[0] for row in chunk])
+                .order_by('genre__name')
+                .values_list('book_id', 'genre__name')):
+            genres[book_id].append(name)
+        for pk, *values in chunk:
+            yield values + [GENRE_SEPARATOR.join(genres[pk])]
+
+
+def copy_rows(using='default'):
+    return (BookInstance.objects.using(using).order_by('pk').values_list(
+        'id', 'book__isbn', 'imprint', 'status', 'due_back',
+        'borrower__username').iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+def loan_rows(using='default'):
+    return (BookInstance.objects.using(using).on_loan()
+            .order_by('due_back', 'id').values_list(
+                'id', 'book__isbn', 'book__title', 'borrower__username',
+                'due_back').iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+# Columns and rows of every export
+EXPORTS = {
+    'books': (['title', 'isbn', 'summary', 'author_first_name',
+               'author_last_name', 'language', 'genre'], book_rows),
+    'copies': (['id', 'book', 'imprint', 'status', 'due_back', 'borrower'],
+               copy_rows),
+    'loans': (['id', 'book', 'title', 'borrower', 'due_back'], loan_rows),
+}
+
+
+class Echo:
+    """File-like object whose write() returns what is written, so
+    csv.writer() can produce lines without buffering them."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value
+                               for value in row])
+
+
+def jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder,
+                         ensure_ascii=False) + '\n'
+
+
+FORMATS = {'csv': csv_lines, 'jsonl': jsonl_lines}
+
+
+def export_lines(kind, format, using='default'):
+    """Yields the export ``kind`` in ``format``, a chunk of lines at a
+    time."""
+    columns, rows = EXPORTS[kind]
+    lines = FORMATS[format](columns, rows(using))
+    for chunk in chunked(lines, EXPORT_CHUNK_SIZE):
+        yield ''.join(chunk)
@@ -3,8 +3,11 @@ import datetime
 from django import forms
 
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from .models import Book
+
 
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(
@@ -24,3 +27,73 @@ class RenewBookForm(forms.Form):
 
         # Remember to always return the cleaned data.
         return data
+
+
+class AutocompleteMixin:
+    """
+    Select widget rendering only its selected options; the others are
+    fetched from the ``source`` autocomplete endpoint as the user types
+    (see static/js/autocomplete.js), so the form never lists a whole table.
+    """
+
+    def __init__(self, source, attrs=None):
+        super().__init__(attrs)
+        self.source = source
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(
+            'catalog-autocomplete', args=[self.source])
+        return attrs
+
+    def selected_keys(self, value):
+        """The primary keys among the submitted ``value``; a re-rendered
+        invalid form may carry values that are not keys at all."""
+        field = self.choices.queryset.model._meta.pk
+        keys = []
+        for v in value:
+            if v in ('', None):
+                continue
+            try:
+                keys.append(field.to_python(v))
+            except ValidationError:
+                pass
+        return keys
+
+    def optgroups(self, name, value, attrs=None):
+        selected = self.selected_keys(value)
+        options = []
+        if not self.is_required and not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '---------',
+                                              not selected, 0))
+        if selected:
+            queryset = self.choices.queryset.filter(pk__in=selected)
+            for obj in queryset:
+                options.append(self.create_option(
+                    name, obj.pk, str(obj), True, len(options)))
+        return [(None, options, 0)]
+
+    class Media:
+        js = ['js/autocomplete.js']
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass
+
+
+class BookForm(forms.ModelForm):
+    """Book form whose author, language and genre pickers load their
+    options on demand."""
+
+    class Meta:
+        model = Book
+        fields = ['title', 'author', 'summary', 'isbn', 'language', 'genre']
+        widgets = {
+            'author': AutocompleteSelect('author'),
+            'language': AutocompleteSelect('language'),
+            'genre': AutocompleteSelectMultiple('genre'),
+        }
@@ -0,0 +1,388 @@
+"""
+Streaming import of catalog dumps (authors, books or copies).
+
+The input (CSV with a header row, or JSON Lines) is read one row at a
+time, every row is validated, and the valid ones are written in chunks of
+``batch_size`` rows, each chunk in its own transaction, so files of any
+size are imported in constant memory. Rows that were already imported are
+skipped, so an interrupted import can simply be run again.
+
+On PostgreSQL every chunk is sent with ``COPY FROM STDIN`` into a
+temporary staging table and inserted with a single INSERT ... SELECT that
+resolves the references in the database. Other databases insert through
+CatalogLoader (bulk_create).
+
+In sync mode, authors and books that changed since the last import are
+updated too (see sync.py).
+
+Columns:
+
+- authors: first_name, last_name, date_of_birth, date_of_death
+- books: title, isbn, summary, author_first_name, author_last_name,
+  language, genre (names separated by ``;``)
+- copies: id, book (the ISBN), imprint, status, due_back, borrower (the
+  username)
+
+Dates are ISO 8601. Unknown languages and genres are created; books and
+copies whose author, book or borrower does not exist are imported without
+it, as the models allow.
+"""
+
+import csv
+import io
+import json
+import time
+import uuid
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+
+from .loader import DEFAULT_BATCH_SIZE, CatalogLoader
+from .models import (
+    Author, Book, BookInstance, CatalogCounter, touch_pages
+)
+from .search import update_index
+from .sync import CatalogSync
+
+KINDS = ('authors', 'books', 'copies')
+
+GENRE_SEPARATOR = ';'
+
+
+class RejectedRow(ValueError):
+    """A row of the input that cannot be imported."""
+
+
+def read_csv(stream):
+    """Yields the rows of a CSV file with a header row as dicts."""
+    yield from csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    """Yields the objects of a JSON Lines file (None for invalid lines)."""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _text(row, field, max_length, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RejectedRow('%s is required' % field)
+    if len(value) > max_length:
+        raise RejectedRow('%s is longer than %d characters'
+                          % (field, max_length))
+    return value
+
+
+def _date(row, field):
+    value = row.get(field)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise RejectedRow('%s is not a date: %r' % (field, value))
+
+
+def _isbn(row, field):
+    isbn = _text(row, field, 100, required=True)
+    # Same rule as BookCreate.form_valid
+    if len(isbn) != 13:
+        raise RejectedRow('%s must have exactly 13 characters: %r'
+                          % (field, isbn))
+    return isbn
+
+
+def _genres(row, field):
+    genres = row.get(field) or []
+    if isinstance(genres, str):
+        genres = genres.split(GENRE_SEPARATOR)
+    if not isinstance(genres, list) \
+            or not all(isinstance(name, str) for name in genres):
+        raise RejectedRow('%s must be a text or a list of texts: %r'
+                          % (field, row.get(field)))
+    return [name.strip() for name in genres if name.strip()]
+
+
+def clean_author(row):
+    return {
+        'first_name': _text(row, 'first_name', 100, required=True),
+        'last_name': _text(row, 'last_name', 100, required=True),
+        'date_of_birth': _date(row, 'date_of_birth'),
+        'date_of_death': _date(row, 'date_of_death'),
+    }
+
+
+def clean_book(row):
+    author = {
+        'first_name': _text(row, 'author_first_name', 100),
+        'last_name': _text(row, 'author_last_name', 100),
+    }
+    return {
+        'title': _text(row, 'title', 200, required=True),
+        'isbn': _isbn(row, 'isbn'),
+        'summary': _text(row, 'summary', 1000),
+        'author': author if author['last_name'] else None,
+        'language': _text(row, 'language', 200) or None,
+        'genre': _genres(row, 'genre'),
+    }
+
+
+def clean_copy(row):
+    try:
+        pk = uuid.UUID(str(row.get('id')))
+    except ValueError:
+        raise RejectedRow('id is not a UUID: %r' % row.get('id'))
+    status = _text(row, 'status', 1) or 'm'
+    if status not in dict(BookInstance.LOAN_STATUS):
+        raise RejectedRow('unknown status: %r' % status)
+    return {
+        'id': pk,
+        'book': _isbn(row, 'book'),
+        'imprint': _text(row, 'imprint', 200),
+        'status': status,
+        'due_back': _date(row, 'due_back'),
+        'borrower': _text(row, 'borrower', 150) or None,
+    }
+
+
+CLEANERS = {'authors': clean_author, 'books': clean_book,
+            'copies': clean_copy}
+
+
+class ImportReport:
+    """Outcome of an import. ``counts`` are the SyncCounts of a sync."""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.counts = None
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        if self.counts is None:
+            written = '%d imported' % self.imported
+        else:
+            written = '%d inserted, %d updated, %d unchanged, %d deleted' % (
+                self.counts.inserted, self.counts.updated,
+                self.counts.unchanged, self.counts.deleted)
+        return '%d rows read, %s, %d rejected in %.1f s (%.0f rows/s)' % (
+            self.rows, written, self.rejected, self.seconds,
+            self.rows_per_second)
+
+
+class CatalogImporter:
+    """
+    Imports the rows of one ``kind`` of record. ``on_reject(number,
+    reason)`` is called for every rejected row (numbered from 1).
+
+    With ``sync`` the authors or books are synced instead (see sync.py):
+    changed rows are updated too and, with ``delete``, the rows absent
+    from the input are deleted (only if no row was rejected).
+    """
+
+    def __init__(self, kind, batch_size=DEFAULT_BATCH_SIZE, using='default',
+                 on_reject=None, use_copy=None, sync=False, delete=False):
+        if kind not in KINDS:
+            raise ValueError('Unknown kind: %r' % kind)
+        if sync and kind == 'copies':
+            raise ValueError('Only authors and books can be synced.')
+        self.kind = kind
+        self.batch_size = batch_size
+        self.using = using
+        self.on_reject = on_reject
+        self.connection = connections[using]
+        if use_copy is None:
+            use_copy = self.connection.vendor == 'postgresql'
+        self.use_copy = use_copy
+        self.loader = CatalogLoader(batch_size, using)
+        self.sync = (CatalogSync(using, delete, self.loader) if sync
+                     else None)
+
+    def run(self, rows):
+        """Imports the rows of an iterable of dicts; returns the report."""
+        report = ImportReport()
+        start = time.perf_counter()
+        clean = CLEANERS[self.kind]
+        chunk = []
+        for number, row in enumerate(rows, 1):
+            report.rows += 1
+            try:
+                if row is None:
+                    raise RejectedRow('not a JSON object')
+                chunk.append(clean(row))
+            except RejectedRow as error:
+                report.rejected += 1
+                if self.on_reject:
+                    self.on_reject(number, str(error))
+            if len(chunk) >= self.batch_size:
+                report.imported += self.write(chunk)
+                chunk = []
+        if chunk:
+            report.imported += self.write(chunk)
+        if self.sync:
+            if self.sync.delete and not report.rejected:
+                with transaction.atomic(using=self.using):
+                    self.sync.delete_unseen(self.kind, self.batch_size)
+            report.counts = self.sync.counts
+            report.imported = report.counts.inserted
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def import_file(self, stream, format='csv'):
+        return self.run(READERS[format](stream))
+
+    def write(self, records):
+        """Writes one chunk in its own transaction; returns the number of
+        new rows."""
+        with transaction.atomic(using=self.using):
+            if self.kind == 'books':
+                self.loader.load_languages(
+                    {r['language'] for r in records if r['language']})
+                self.loader.load_genres(
+                    {name for r in records for name in r['genre']})
+            elif self.kind == 'copies':
+                self.resolve_borrowers(records)
+            if self.sync:
+                getattr(self.sync, 'sync_%s' % self.kind)(records)
+                return 0
+            if self.use_copy:
+                return getattr(self, 'copy_%s' % self.kind)(records)
+            before = self.loader.created[self.kind]
+            getattr(self.loader, 'load_%s' % self.kind)(records)
+            return self.loader.created[self.kind] - before
+
+    def resolve_borrowers(self, records):
+        names = {r['borrower'] for r in records if r['borrower']}
+        ids = dict(User.objects.db_manager(self.using)
+                   .filter(username__in=names)
+                   .values_list('username', 'id'))
+        for record in records:
+            record['borrower_id'] = ids.get(record.pop('borrower'))
+
+    # PostgreSQL: COPY into a staging table, then INSERT ... SELECT
+
+    def stage(self, cursor, table, columns, rows):
+        """(Re)fills the temporary staging ``table`` with ``rows``."""
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS %s (%s)'
+            % (table, ', '.join('%s %s' % column for column in columns)))
+        cursor.execute('TRUNCATE %s' % table)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value
+                             for value in row])
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+            % (table, ', '.join(name for name, _ in columns)), buffer)
+
+    def copy_authors(self, records):
+        with self.connection.cursor() as cursor:
+            self.stage(cursor, 'import_author', [
+                ('first_name', 'varchar(100)'), ('last_name', 'varchar(100)'),
+                ('date_of_birth', 'date'), ('date_of_death', 'date'),
+            ], ((r['first_name'], r['last_name'], r['date_of_birth'],
+                 r['date_of_death']) for r in records))
+            cursor.execute(
+                'INSERT INTO catalog_author '
+                '(first_name, last_name, date_of_birth, date_of_death, '
+                'sync_hash, modified) '
+                'SELECT DISTINCT ON (s.first_name, s.last_name) '
+                's.first_name, s.last_name, s.date_of_birth, s.date_of_death, '
+                "'', now() FROM import_author s WHERE NOT EXISTS ("
+                'SELECT 1 FROM catalog_author a WHERE '
+                'a.first_name = s.first_name AND a.last_name = s.last_name) '
+                'ORDER BY s.first_name, s.last_name')
+            created = cursor.rowcount
+        self.count_created(Author, created)
+        return created
+
+    def copy_books(self, records):
+        languages = self.loader.language_map()
+        genres = self.loader.genre_map()
+        with self.connection.cursor() as cursor:
+            self.stage(cursor, 'import_book', [
+                ('title', 'varchar(200)'), ('isbn', 'varchar(13)'),
+                ('summary', 'text'), ('author_first_name', 'varchar(100)'),
+                ('author_last_name', 'varchar(100)'),
+                ('language_id', 'bigint'), ('genre_ids', 'text'),
+            ], ((r['title'], r['isbn'], r['summary'],
+                 (r['author'] or {}).get('first_name'),
+                 (r['author'] or {}).get('last_name'),
+                 languages.get(r['language']),
+                 ' '.join(str(genres[name.lower()]) for name in r['genre']))
+                for r in records))
+            cursor.execute(
+                'INSERT INTO catalog_book '
+                '(title, isbn, summary, author_id, language_id, sync_hash, '
+                'modified) '
+                'SELECT DISTINCT ON (s.isbn) s.title, s.isbn, s.summary, '
+                '(SELECT min(a.id) FROM catalog_author a '
+                'WHERE a.first_name = s.author_first_name '
+                "AND a.last_name = s.author_last_name), s.language_id, '', "
+                'now() FROM import_book s ORDER BY s.isbn '
+                'ON CONFLICT (isbn) DO NOTHING RETURNING id, author_id')
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+            book_ids = [row[0] for row in rows]
+            touch_pages('author', [row[1] for row in rows], self.using)
+            cursor.execute(
+                'INSERT INTO catalog_book_genre (book_id, genre_id) '
+                'SELECT DISTINCT b.id, genre_id::bigint FROM import_book s '
+                'JOIN catalog_book b ON b.isbn = s.isbn, '
+                "unnest(string_to_array(nullif(s.genre_ids, ''), ' ')) "
+                'genre_id WHERE b.id = ANY(%s) ON CONFLICT DO NOTHING',
+                [book_ids])
+        update_index(book_ids, using=self.using)
+        self.count_created(Book, len(book_ids))
+        return len(book_ids)
+
+    def copy_copies(self, records):
+        with self.connection.cursor() as cursor:
+            self.stage(cursor, 'import_bookinstance', [
+                ('id', 'uuid'), ('book', 'varchar(13)'),
+                ('imprint', 'varchar(200)'), ('status', 'varchar(1)'),
+                ('due_back', 'date'), ('borrower_id', 'integer'),
+            ], ((r['id'], r['book'], r['imprint'], r['status'],
+                 r['due_back'], r['borrower_id']) for r in records))
+            cursor.execute(
+                'INSERT INTO catalog_bookinstance '
+                '(id, book_id, imprint, status, due_back, borrower_id, '
+                'modified) '
+                'SELECT DISTINCT ON (s.id) s.id, b.id, s.imprint, s.status, '
+                's.due_back, s.borrower_id, now() FROM import_bookinstance s '
+                'LEFT JOIN catalog_book b ON b.isbn = s.book ORDER BY s.id '
+                'ON CONFLICT (id) DO NOTHING RETURNING status, book_id')
+            rows = cursor.fetchall()
+        statuses = [row[0] for row in rows]
+        touch_pages('book', [row[1] for row in rows], self.using)
+        deltas = {'instances': len(statuses)}
+        for status in statuses:
+            name = CatalogCounter.status_counter(status)
+            deltas[name] = deltas.get(name, 0) + 1
+        CatalogCounter.objects.db_manager(self.using).adjust(deltas)
+        return len(statuses)
+
+    def count_created(self, model, num):
+        """Raw inserts bypass CountedQuerySet: count the new rows."""
+        CatalogCounter.objects.db_manager(self.using).adjust(
+            {CatalogCounter.MODEL_COUNTERS[model._meta.model_name]: num})
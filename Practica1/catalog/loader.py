@@ -0,0 +1,222 @@
+"""
+Bulk, memory-bounded loader for the catalog.
+
+The input records are consumed in chunks of ``batch_size``. For every chunk
+the references (author, language, genres, book) are resolved with one query
+per model into in-memory maps, only the rows that do not exist yet are
+inserted with bulk_create(), and the chunk is committed in its own
+transaction. Loading the same records twice is a no-op.
+
+Natural keys: languages and genres by name (genres case-insensitively),
+authors by (first_name, last_name), books by ISBN and copies by id. Copies
+without an id get a deterministic one derived from the book ISBN and the
+position of the copy among the copies of that book, so re-runs are
+idempotent too.
+"""
+
+import uuid
+from itertools import islice
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .models import Author, Book, BookInstance, Genre, Language
+from .search import update_index
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Namespace of the ids generated for copies without one
+COPY_NAMESPACE = uuid.UUID('5f0d9c3e-7a4b-4c1e-9d2a-3b8e6f1a2c4d')
+
+
+def chunked(iterable, size):
+    """Yields lists of at most ``size`` items of ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _date(value):
+    """Dates in the input may be empty strings."""
+    return value or None
+
+
+def _names(value):
+    """Genre lists may be given as a single name."""
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def author_key(first_name, last_name):
+    return (first_name or '', last_name or '')
+
+
+class CatalogLoader:
+    """Loads languages, genres, authors, books and copies in bulk."""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, using='default'):
+        self.batch_size = batch_size
+        self.using = using
+        self.created = {'languages': 0, 'genres': 0, 'authors': 0,
+                        'books': 0, 'copies': 0}
+        self._languages = None
+        self._genres = None
+        self._copy_positions = {}
+
+    def _manager(self, model):
+        return model.objects.db_manager(self.using)
+
+    # Languages and genres are small: they are mapped whole
+
+    def language_map(self):
+        if self._languages is None:
+            self._languages = {}
+            for name, pk in (self._manager(Language).order_by('-pk')
+                             .values_list('name', 'pk')):
+                self._languages[name] = pk
+        return self._languages
+
+    def genre_map(self):
+        if self._genres is None:
+            self._genres = dict(self._manager(Genre).annotate(
+                key=Lower('name')).values_list('key', 'pk'))
+        return self._genres
+
+    def load_languages(self, names):
+        languages = self.language_map()
+        new = [Language(name=name) for name in dict.fromkeys(names)
+               if name not in languages]
+        if not new:
+            return
+        with transaction.atomic(using=self.using):
+            self._manager(Language).bulk_create(new)
+        languages.update((language.name, language.pk) for language in new)
+        self.created['languages'] += len(new)
+
+    def load_genres(self, names):
+        genres = self.genre_map()
+        new = {}
+        for name in names:
+            if name.lower() not in genres:
+                new.setdefault(name.lower(), Genre(name=name))
+        if not new:
+            return
+        with transaction.atomic(using=self.using):
+            self._manager(Genre).bulk_create(list(new.values()))
+        genres.update((key, genre.pk) for key, genre in new.items())
+        self.created['genres'] += len(new)
+
+    # Authors, books and copies are resolved one chunk at a time
+
+    def author_ids(self, keys):
+        """Returns {(first_name, last_name): id} of the existing authors."""
+        last_names = {last_name for _, last_name in keys}
+        rows = (self._manager(Author).filter(last_name__in=last_names)
+                .order_by('pk').values_list('first_name', 'last_name', 'pk'))
+        found = {}
+        for first_name, last_name, pk in rows:
+            found.setdefault(author_key(first_name, last_name), pk)
+        return {key: found[key] for key in keys if key in found}
+
+    def book_ids(self, isbns):
+        """Returns {isbn: id} of the existing books."""
+        return dict(self._manager(Book).filter(isbn__in=set(isbns))
+                    .values_list('isbn', 'pk'))
+
+    def load_authors(self, records):
+        for chunk in chunked(records, self.batch_size):
+            records_by_key = {
+                author_key(r['first_name'], r['last_name']): r for r in chunk}
+            existing = self.author_ids(records_by_key)
+            new = [
+                Author(first_name=key[0], last_name=key[1],
+                       date_of_birth=_date(record.get('date_of_birth')),
+                       date_of_death=_date(record.get('date_of_death')))
+                for key, record in records_by_key.items()
+                if key not in existing
+            ]
+            with transaction.atomic(using=self.using):
+                self._manager(Author).bulk_create(new)
+            self.created['authors'] += len(new)
+
+    def load_books(self, records):
+        languages = self.language_map()
+        genres = self.genre_map()
+        for chunk in chunked(records, self.batch_size):
+            records_by_isbn = {record['isbn']: record for record in chunk}
+            existing = self.book_ids(records_by_isbn)
+            authors = self.author_ids({
+                author_key(r['author']['first_name'],
+                           r['author']['last_name'])
+                for r in records_by_isbn.values() if r.get('author')})
+            new = []
+            for isbn, record in records_by_isbn.items():
+                if isbn in existing:
+                    continue
+                author = record.get('author')
+                new.append(Book(
+                    title=record['title'], isbn=isbn,
+                    summary=record.get('summary', ''),
+                    author_id=authors.get(author_key(
+                        author['first_name'], author['last_name']))
+                    if author else None,
+                    language_id=languages.get(record.get('language')),
+                ))
+            with transaction.atomic(using=self.using):
+                self._manager(Book).bulk_create(new)
+                self._manager(Book.genre.through).bulk_create([
+                    Book.genre.through(book_id=book.pk,
+                                       genre_id=genres[name.lower()])
+                    for book in new
+                    for name in _names(records_by_isbn[book.isbn].get('genre'))
+                    if name.lower() in genres
+                ], ignore_conflicts=True)
+                update_index([book.pk for book in new], using=self.using)
+            self.created['books'] += len(new)
+
+    def copy_id(self, record):
+        """Id of a copy record, generated if the record has none."""
+        if record.get('id'):
+            return uuid.UUID(str(record['id']))
+        position = self._copy_positions.get(record['book'], 0)
+        self._copy_positions[record['book']] = position + 1
+        return uuid.uuid5(COPY_NAMESPACE, '%s:%d' % (record['book'], position))
+
+    def load_copies(self, records):
+        """Loads copies whose ``book`` is the ISBN of their book."""
+        for chunk in chunked(records, self.batch_size):
+            records_by_id = {self.copy_id(record): record for record in chunk}
+            existing = set(self._manager(BookInstance)
+                           .filter(pk__in=records_by_id)
+                           .values_list('pk', flat=True))
+            books = self.book_ids(r['book'] for r in records_by_id.values())
+            new = [
+                BookInstance(
+                    id=pk, book_id=books.get(record['book']),
+                    imprint=record.get('imprint', ''),
+                    due_back=_date(record.get('due_back')),
+                    status=record.get('status') or 'm',
+                    borrower_id=record.get('borrower_id'),
+                )
+                for pk, record in records_by_id.items() if pk not in existing
+            ]
+            with transaction.atomic(using=self.using):
+                self._manager(BookInstance).bulk_create(new)
+            self.created['copies'] += len(new)
+
+    def load(self, languages=(), genres=(), authors=(), books=(),
+             copies=()):
+        """Loads every kind of record, references first.
+
+        Returns the number of rows created of each kind.
+        """
+        self.load_languages(languages)
+        self.load_genres(genres)
+        self.load_authors(authors)
+        self.load_books(books)
+        self.load_copies(copies)
+        return self.created
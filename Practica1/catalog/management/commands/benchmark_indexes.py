@@ -0,0 +1,139 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from catalog.models import Author, Book, BookInstance
+from catalog.synthetic import SyntheticCatalog
+
+# Indexes whose effect is measured (added by migration 0015)
+BENCHMARKED_INDEXES = {
+    Author: ['author_name_idx'],
+    Book: ['book_title_idx'],
+    BookInstance: ['bookinstance_status_due_idx',
+                   'bookinstance_loan_user_idx',
+                   'bookinstance_loan_due_idx'],
+}
+
+# Loan status shares of the generated copies
+BENCHMARK_STATUS_WEIGHTS = {'m': 0.1, 'o': 0.2, 'a': 0.6, 'r': 0.1}
+
+
+class Command(BaseCommand):
+    help = ('Shows the EXPLAIN plan and timing of the loan and listing hot '
+            'paths without and with the catalog indexes. Runs on a scratch '
+            'database (CATALOG_SCRATCH_DATABASES) in a transaction that is '
+            'rolled back, generated data and dropped indexes included.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', required=True,
+                            help='Alias of the scratch database.')
+        parser.add_argument(
+            '--i-know', action='store_true',
+            help='Run on a database not in CATALOG_SCRATCH_DATABASES.')
+        parser.add_argument('--books', type=int, default=100000,
+                            help='Books of the generated dataset.')
+        parser.add_argument('--copies-per-book', type=int, default=30,
+                            help='Copies of each generated book.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of each query (the best is shown).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if using not in connections:
+            raise CommandError('Unknown database: %s' % using)
+        if using not in getattr(settings, 'CATALOG_SCRATCH_DATABASES', ()) \
+                and not options['i_know']:
+            raise CommandError(
+                '%s is not a scratch database: the benchmark fills it with '
+                'synthetic data and drops its indexes. Use --i-know to run '
+                'it anyway.' % using)
+        self.connection = connections[using]
+        if not self.connection.features.can_rollback_ddl:
+            raise CommandError(
+                'The benchmark drops indexes in a transaction, which %s '
+                'cannot roll back.' % self.connection.vendor)
+        with transaction.atomic(using=using):
+            self.benchmark(using, options)
+            # Leaves the database as it was
+            transaction.set_rollback(True, using=using)
+
+    def benchmark(self, using, options):
+        self.generate(options['books'], options['copies_per_book'],
+                      options['seed'], using)
+        copies = BookInstance.objects.using(using)
+        borrower = (copies.filter(status='o')
+                    .values_list('borrower', flat=True).first())
+        queries = [
+            ('loans of a user', copies.filter(
+                borrower=borrower, status='o').order_by('due_back', 'id')),
+            ('all loans', copies.filter(
+                status='o').order_by('due_back', 'id')),
+            ('overdue loans', copies.filter(
+                status='o', due_back__lt=date.today())
+                .order_by('due_back', 'id')),
+            ('books by title', Book.objects.using(using).order_by(
+                'title', 'id')),
+            ('authors by name', Author.objects.using(using).order_by(
+                'last_name', 'first_name', 'id')),
+        ]
+
+        self.set_indexes(False)
+        before = self.run_queries(queries, options['repeat'], 'without')
+        self.set_indexes(True)
+        after = self.run_queries(queries, options['repeat'], 'with')
+
+        self.stdout.write('\n%-20s %12s %12s' % (
+            'query', 'before (ms)', 'after (ms)'))
+        for name, _ in queries:
+            self.stdout.write('%-20s %12.2f %12.2f' % (
+                name, before[name], after[name]))
+
+    def generate(self, num_books, copies_per_book, seed, using):
+        """Adds books and copies until the dataset has the requested size."""
+        if Book.objects.using(using).count() >= num_books:
+            return
+        self.stdout.write('Generating %d books with %d copies each...' % (
+            num_books, copies_per_book))
+        SyntheticCatalog(authors=max(num_books // 10, 1), books=num_books,
+                         copies_per_book=copies_per_book,
+                         status_weights=BENCHMARK_STATUS_WEIGHTS,
+                         seed=seed).generate(using=using)
+        # Runs the deferred foreign key checks of the new rows, which would
+        # keep PostgreSQL from altering their tables in this transaction
+        self.connection.check_constraints()
+
+    def set_indexes(self, present):
+        """Drops or (re)creates the benchmarked indexes."""
+        # Not entered: the SQLite editor refuses to run in a transaction,
+        # and adding or removing an index needs none of its setup
+        editor = self.connection.schema_editor()
+        for model, names in BENCHMARKED_INDEXES.items():
+            for index in model._meta.indexes:
+                if index.name in names:
+                    if present:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        if self.connection.vendor in ('postgresql', 'sqlite'):
+            with self.connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def run_queries(self, queries, repeat, state):
+        """Prints the plan of each query and returns its best time (ms)."""
+        timings = {}
+        for name, queryset in queries:
+            page = queryset[:10]
+            self.stdout.write('\n== %s (%s indexes)' % (name, state))
+            self.stdout.write(page.explain())
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(page.all())
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+        return timings
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.loader import DEFAULT_BATCH_SIZE
+from catalog.synthetic import SyntheticCatalog, parse_status_weights
+
+
+class Command(BaseCommand):
+    help = ('Generates a deterministic synthetic library of the given '
+            'scale. The same seed and scale always give the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--genres', type=int, default=20)
+        parser.add_argument('--genres-per-book', type=int, default=2)
+        parser.add_argument('--copies-per-book', type=int, default=3)
+        parser.add_argument('--borrowers', type=int, default=100)
+        parser.add_argument(
+            '--status', default='m=0.1,o=0.3,a=0.5,r=0.1',
+            help='Share of copies in each loan status.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        try:
+            weights = parse_status_weights(options['status'])
+        except ValueError:
+            raise CommandError('Invalid --status: %s' % options['status'])
+        catalog = SyntheticCatalog(
+            authors=options['authors'], books=options['books'],
+            genres=options['genres'],
+            genres_per_book=options['genres_per_book'],
+            copies_per_book=options['copies_per_book'],
+            borrowers=options['borrowers'], status_weights=weights,
+            seed=options['seed'])
+        start = time.perf_counter()
+        created = catalog.generate(options['batch_size'],
+                                   using=options['database'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(', '.join(
+            '%d %s' % (num, kind) for kind, num in created.items()))
+        self.stdout.write(self.style.SUCCESS(
+            'Generated in %.1f s.' % elapsed))
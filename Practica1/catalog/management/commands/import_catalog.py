@@ -0,0 +1,69 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importer import KINDS, READERS, CatalogImporter
+from catalog.loader import DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Imports a CSV or JSON Lines dump of authors, books or copies '
+            'in constant memory. See catalog/importer.py for the columns.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument('path', help="Input file ('-' for stdin).")
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Input format (by default, from the file extension).')
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--rejects', help='File where the rejected rows are listed.')
+        parser.add_argument(
+            '--sync', action='store_true',
+            help='Also update the authors or books that changed.')
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='With --sync, delete the authors or books not in the '
+                 'input (skipped if any row is rejected).')
+
+    def handle(self, *args, **options):
+        if options['sync'] and options['kind'] == 'copies':
+            raise CommandError('Only authors and books can be synced.')
+        if options['delete'] and not options['sync']:
+            raise CommandError('--delete requires --sync.')
+        path = options['path']
+        format = options['format']
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip('.').lower()
+            if format not in READERS:
+                raise CommandError('Unknown format of %s: use --format.'
+                                   % path)
+        rejects = (open(options['rejects'], 'w', encoding='utf-8')
+                   if options['rejects'] else None)
+
+        def on_reject(number, reason):
+            if rejects:
+                rejects.write('row %d: %s\n' % (number, reason))
+            if options['verbosity'] > 1:
+                self.stderr.write('Rejected row %d: %s' % (number, reason))
+
+        importer = CatalogImporter(options['kind'], options['batch_size'],
+                                   using=options['database'],
+                                   on_reject=on_reject, sync=options['sync'],
+                                   delete=options['delete'])
+        try:
+            if path == '-':
+                report = importer.import_file(sys.stdin, format)
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    report = importer.import_file(stream, format)
+        finally:
+            if rejects:
+                rejects.close()
+        if options['delete'] and report.rejected:
+            self.stderr.write('Rows were rejected: nothing was deleted.')
+        self.stdout.write(self.style.SUCCESS(str(report)))
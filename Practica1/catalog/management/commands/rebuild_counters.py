@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import CatalogCounter
+from catalog.stats import invalidate_catalog_stats
+
+
+class Command(BaseCommand):
+    help = ('Compares the catalog counters with the real row counts and '
+            'rebuilds them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report drifted counters; fail if there is any.')
+
+    def handle(self, *args, **options):
+        stored = CatalogCounter.objects.snapshot()
+        actual = CatalogCounter.objects.actual()
+        drift = {
+            name: (stored.get(name), value)
+            for name, value in actual.items() if stored.get(name) != value
+        }
+        for name, (old, new) in sorted(drift.items()):
+            self.stdout.write('%s: stored %s, actual %s' % (name, old, new))
+
+        if options['check']:
+            if drift:
+                raise CommandError(
+                    '%d counter(s) drifted from the real counts.' % len(drift))
+            self.stdout.write(self.style.SUCCESS('Counters are up to date.'))
+            return
+
+        CatalogCounter.objects.rebuild()
+        invalidate_catalog_stats()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d counter(s), %d had drifted.' % (len(actual),
+                                                        len(drift))))
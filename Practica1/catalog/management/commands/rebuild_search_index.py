@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database whose search index is rebuilt.')
+
+    def handle(self, *args, **options):
+        rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,149 @@
+"""
+Per-request SQL instrumentation.
+
+QueryInstrumentationMiddleware records every statement run while handling
+a request and reports the number of queries, the total database time, the
+duplicated statements and the slowest one, both as a ``Server-Timing``
+response header and as a JSON log line on the ``catalog.queries`` logger.
+
+Views may declare a query budget (``query_budget`` attribute of a class
+based view, or the @query_budget decorator). A request that exceeds it
+logs a warning, or raises QueryBudgetExceeded when
+CATALOG_QUERY_BUDGET_STRICT is set (as it is when running the tests).
+
+The queries of a database cache (DatabaseCache) are cache lookups, not
+queries of the views: they are counted apart (``cache_queries``) and left
+out of the budgets.
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.db import connections
+
+logger = logging.getLogger('catalog.queries')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its declared budget."""
+
+
+def query_budget(budget):
+    """Declares the maximum number of queries of a function view."""
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    """Returns the query budget of a view function or class, if any."""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view_func, 'view_class', None),
+                         'query_budget', None)
+    return budget
+
+
+def cache_tables():
+    """Names of the tables of the database caches."""
+    return [caches[alias]._table for alias in settings.CACHES
+            if isinstance(caches[alias], BaseDatabaseCache)]
+
+
+class QueryRecorder:
+    """Database execute wrapper that times every statement, keeping those
+    of the database caches apart."""
+
+    def __init__(self):
+        self.queries = []
+        self.cache_queries = 0
+        self.cache_tables = cache_tables()
+        self.cache_savepoints = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.is_cache_query(sql, context['connection']):
+            self.cache_queries += 1
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def is_cache_query(self, sql, connection):
+        """Whether ``sql`` is a query of a database cache, or releases the
+        savepoint a cache opened around its queries."""
+        if any(connection.ops.quote_name(table) in sql
+               for table in self.cache_tables):
+            if self.queries and self.queries[-1][0].startswith('SAVEPOINT '):
+                sql = self.queries.pop()[0]
+                self.cache_queries += 1
+                self.cache_savepoints.add(sql.split(' ', 1)[1])
+            return True
+        return sql.startswith(('RELEASE SAVEPOINT ',
+                               'ROLLBACK TO SAVEPOINT ')) \
+            and sql.rsplit(' ', 1)[1] in self.cache_savepoints
+
+    def stats(self, start=0):
+        """Summary of the queries recorded from position ``start``."""
+        queries = self.queries[start:]
+        repeated = Counter(sql for sql, _ in queries)
+        slowest = max(queries, key=lambda query: query[1], default=('', 0))
+        return {
+            'queries': len(queries),
+            'db_ms': round(sum(d for _, d in queries) * 1000, 2),
+            'duplicates': sum(n - 1 for n in repeated.values()),
+            'slowest_ms': round(slowest[1] * 1000, 2),
+            'slowest_sql': slowest[0][:300],
+        }
+
+
+class QueryInstrumentationMiddleware:
+    """Reports the SQL activity of every request (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._query_recorder = recorder
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        stats = recorder.stats()
+        timing = 'db;dur=%s;desc="%s queries, %s duplicated"' % (
+            stats['db_ms'], stats['queries'], stats['duplicates'])
+        if response.has_header('Server-Timing'):
+            timing = '%s, %s' % (response['Server-Timing'], timing)
+        response['Server-Timing'] = timing
+
+        logger.info(json.dumps(dict(
+            stats, cache_queries=recorder.cache_queries,
+            method=request.method, path=request.path,
+            status=response.status_code)))
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None:
+            used = recorder.stats(request._query_mark)['queries']
+            if used > budget:
+                message = '%s ran %d queries, over its budget of %d.' % (
+                    request.path, used, budget)
+                if getattr(settings, 'CATALOG_QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = get_query_budget(view_func)
+        if budget is not None and hasattr(request, '_query_recorder'):
+            request._query_budget = budget
+            request._query_mark = len(request._query_recorder.queries)
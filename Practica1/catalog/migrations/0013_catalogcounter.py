@@ -0,0 +1,44 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    """Initialises the counters with the real number of rows."""
+    db = schema_editor.connection.alias
+    CatalogCounter = apps.get_model('catalog', 'CatalogCounter')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    counts = {
+        'books': apps.get_model('catalog', 'Book').objects.using(db).count(),
+        'instances': BookInstance.objects.using(db).count(),
+        'authors': apps.get_model('catalog', 'Author').objects.using(db).count(),
+        'genres': apps.get_model('catalog', 'Genre').objects.using(db).count(),
+    }
+    for status in 'moar':
+        counts['instances_%s' % status] = 0
+    by_status = (BookInstance.objects.using(db).order_by()
+                 .values_list('status').annotate(Count('pk')))
+    for status, num in by_status:
+        counts['instances_%s' % status] = num
+    CatalogCounter.objects.using(db).bulk_create(
+        [CatalogCounter(name=name, value=value)
+         for name, value in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_alter_author_date_of_death'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCounter',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
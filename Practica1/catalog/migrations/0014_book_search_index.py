@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# The statements are copied from catalog/search.py as it was when this
+# migration was written, so later changes to the application code do not
+# change what the migration does.
+
+POSTGRES_CREATE = [
+    'CREATE TABLE IF NOT EXISTS catalog_booksearch ('
+    'book_id bigint PRIMARY KEY, document tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS catalog_booksearch_document_gin '
+    'ON catalog_booksearch USING gin (document)',
+    "INSERT INTO catalog_booksearch (book_id, document) SELECT b.id, "
+    "setweight(to_tsvector('simple', coalesce(b.title, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(a.first_name, '') || ' ' "
+    "|| coalesce(a.last_name, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce("
+    "(SELECT string_agg(g.name, ' ') FROM catalog_book_genre bg "
+    "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id), "
+    "'') || ' ' || b.isbn), 'C')"
+    " || setweight(to_tsvector('simple', b.summary), 'D') "
+    'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id '
+    'ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document',
+]
+
+SQLITE_CREATE = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS catalog_booksearch USING fts5('
+    'title, author, genres, isbn, summary, '
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    'INSERT INTO catalog_booksearch (rowid, title, author, genres, isbn, '
+    "summary) SELECT b.id, b.title, coalesce(a.first_name, '') || ' ' || "
+    "coalesce(a.last_name, ''), coalesce("
+    "(SELECT group_concat(g.name, ' ') FROM catalog_book_genre bg "
+    "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id), "
+    "''), b.isbn, b.summary "
+    'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id',
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Creates and fills the full-text search table of the database."""
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRES_CREATE,
+                  'sqlite': SQLITE_CREATE}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS catalog_booksearch',
+                              params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_catalogcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_sync_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='language',
+            index=models.Index(fields=['name'], name='language_name_idx'),
+        ),
+    ]
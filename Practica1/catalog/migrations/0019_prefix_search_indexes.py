@@ -0,0 +1,39 @@
+# Generated by Django 4.2.2 on 2026-10-18 20:50
+
+import catalog.models
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_modified'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='author',
+            name='author_last_name_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=catalog.models.PrefixIndex(django.db.models.functions.text.Lower('last_name'), name='author_last_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=catalog.models.PrefixIndex(django.db.models.functions.text.Lower('first_name'), name='author_first_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=catalog.models.PrefixIndex(django.db.models.functions.text.Lower('title'), name='book_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=catalog.models.PrefixIndex(django.db.models.functions.text.Lower('name'), name='genre_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='language',
+            index=catalog.models.PrefixIndex(django.db.models.functions.text.Lower('name'), name='language_name_lower_idx'),
+        ),
+    ]
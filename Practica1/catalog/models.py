@@ -1,13 +1,404 @@
 import uuid  # Required for unique book instances
+from collections import Counter
+from functools import partial
 # Returns lower cased value of field
 from django.db.models.functions import Lower
 # Constrains fields to unique values
 from django.db.models import UniqueConstraint
+# Used to maintain the catalog counters
+from django.db.models import Case, Count, F, Min, Q, Value, When
+from django.db.models import DurationField, ExpressionWrapper
 # Used in get_absolute_url() to get URL for specified ID
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from datetime import date
+from django.utils import timezone
+from datetime import date, timedelta
+
+from .caching import (
+    INVALIDATE_ALL_OVER, invalidate_all_details, invalidate_details
+)
+
+
+class CatalogCounterManager(models.Manager):
+    """Reads and updates the precomputed catalog counters."""
+
+    def snapshot(self):
+        """Returns a {name: value} dict with every counter (one query)."""
+        return dict(self.values_list('name', 'value'))
+
+    def adjust(self, deltas):
+        """Adds ``deltas`` ({name: increment}) to the counters.
+
+        Runs as a single UPDATE in the caller's transaction; counters that
+        do not exist yet are created. The cached home page statistics are
+        dropped once the transaction commits.
+        """
+        # stats.py imports the models
+        from .stats import invalidate_catalog_stats
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        after_commit(self.db, invalidate_catalog_stats)
+        updated = self.filter(name__in=deltas).update(value=F('value') + Case(
+            *[When(name=name, then=Value(delta))
+              for name, delta in deltas.items()],
+            output_field=models.BigIntegerField(),
+        ))
+        if updated < len(deltas):
+            existing = set(self.filter(name__in=deltas)
+                           .values_list('name', flat=True))
+            self.bulk_create(
+                [CatalogCounter(name=name, value=delta)
+                 for name, delta in deltas.items() if name not in existing],
+                ignore_conflicts=True,
+            )
+
+    def actual(self):
+        """Computes the real value of every counter with COUNT queries."""
+        counts = {
+            'books': Book.objects.count(),
+            'instances': BookInstance.objects.count(),
+            'authors': Author.objects.count(),
+            'genres': Genre.objects.count(),
+        }
+        for status, _ in BookInstance.LOAN_STATUS:
+            counts[CatalogCounter.status_counter(status)] = 0
+        by_status = (BookInstance.objects.order_by()
+                     .values_list('status').annotate(Count('pk')))
+        for status, num in by_status:
+            counts[CatalogCounter.status_counter(status)] = num
+        return counts
+
+    def rebuild(self):
+        """Replaces the stored counters with the real counts.
+
+        Returns the real counts.
+        """
+        with transaction.atomic(using=self.db):
+            # Lock the counters so concurrent writers wait for the rebuild
+            list(self.select_for_update().values_list('name', flat=True))
+            counts = self.actual()
+            self.all().delete()
+            self.bulk_create([CatalogCounter(name=name, value=value)
+                              for name, value in counts.items()])
+        return counts
+
+
+class CatalogCounter(models.Model):
+    """
+    Number of rows of the catalog tables, maintained incrementally so the
+    statistics pages never need to scan them.
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = CatalogCounterManager()
+
+    # Counter maintained for each counted model
+    MODEL_COUNTERS = {
+        'book': 'books',
+        'bookinstance': 'instances',
+        'author': 'authors',
+        'genre': 'genres',
+    }
+
+    @staticmethod
+    def status_counter(status):
+        """Name of the counter of copies with the given loan status."""
+        return 'instances_%s' % status
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return '%s=%s' % (self.name, self.value)
+
+
+def counter_deltas(model, objs, sign=1):
+    """Returns the counter increments caused by adding (or removing, with
+    ``sign=-1``) the instances ``objs`` of ``model``."""
+    deltas = Counter()
+    name = CatalogCounter.MODEL_COUNTERS.get(model._meta.model_name)
+    if name is None:
+        return deltas
+    for obj in objs:
+        deltas[name] += sign
+        if model is BookInstance:
+            deltas[CatalogCounter.status_counter(obj.status)] += sign
+    return deltas
+
+
+# Fields shown by the search documents of the books (see search.py)
+INDEXED_FIELDS = {
+    'book': {'title', 'summary', 'isbn', 'author'},
+    'author': {'first_name', 'last_name'},
+    'genre': {'name'},
+}
+
+
+def after_commit(using, func, *args):
+    """Calls ``func(*args)`` once the transaction of ``using`` commits (at
+    once outside a transaction), so no reader caches the pages again from
+    rows that are not committed yet."""
+    transaction.on_commit(partial(func, *args), using=using)
+
+
+def _page_models(kind, using=None):
+    """The base manager of the pages of ``kind``, which writes without
+    invalidating anything else."""
+    model = Book if kind == 'book' else Author
+    return model._base_manager.db_manager(using)
+
+
+def _page_pks(pages):
+    """The primary keys of the ``pages`` queryset to invalidate: no more
+    than invalidate_details() reads."""
+    return list(pages.order_by().values_list('pk', flat=True).distinct()
+                [:INVALIDATE_ALL_OVER + 1])
+
+
+def touch_pages(kind, pks, using=None):
+    """Makes the cached detail pages of the objects ``pks`` of ``kind``
+    ('book' or 'author') stale and sets their modification time, which the
+    HTTP validators of the pages are made of, to now.
+
+    ``pks`` may be a queryset of primary keys, which the UPDATE then uses
+    as a subquery instead of loading them.
+    """
+    if isinstance(pks, models.QuerySet):
+        pages = _page_models(kind, using).filter(pk__in=pks)
+        after_commit(using, invalidate_details, kind, _page_pks(pages))
+    else:
+        pks = {pk for pk in pks if pk is not None}
+        after_commit(using, invalidate_details, kind, pks)
+        if not pks:
+            return
+        pages = _page_models(kind, using).filter(pk__in=pks)
+    pages.update(modified=timezone.now())
+
+
+def invalidate_pages(model, objs, using=None):
+    """Makes the cached detail pages showing ``objs`` stale once the
+    transaction commits."""
+    if model is Book:
+        after_commit(using, invalidate_details, 'book',
+                     [obj.pk for obj in objs])
+        touch_pages('author', [obj.author_id for obj in objs], using)
+    elif model is BookInstance:
+        touch_pages('book', [obj.book_id for obj in objs], using)
+    elif model is Author:
+        after_commit(using, invalidate_details, 'author',
+                     [obj.pk for obj in objs])
+
+
+class CountedQuerySet(models.QuerySet):
+    """
+    QuerySet whose bulk writes keep the catalog counters, the search index
+    and the cached detail pages up to date. Single object saves and deletes
+    are handled by the signals.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Inserts ``objs`` and counts them in the same transaction.
+
+        With ``ignore_conflicts`` or ``update_conflicts`` the number of new
+        rows is unknown, so the caller has to adjust the counters.
+        """
+        if kwargs.get('update_fields') and self._stamped:
+            kwargs['update_fields'] = list(kwargs['update_fields']) + [
+                'modified']
+        if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            invalidate_pages(self.model, objs, self.db)
+            return objs
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            CatalogCounter.objects.db_manager(self.db).adjust(
+                counter_deltas(self.model, objs))
+        invalidate_pages(self.model, objs, self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if self._stamped:
+            # auto_now is only applied by save()
+            now = timezone.now()
+            for obj in objs:
+                obj.modified = now
+            fields = list(fields) + ['modified']
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        self._reindex(self._indexed_books(fields, [obj.pk for obj in objs]))
+        invalidate_pages(self.model, objs, self.db)
+        return rows
+
+    @property
+    def _stamped(self):
+        """Whether the rows have a modification time."""
+        return any(field.name == 'modified'
+                   for field in self.model._meta.concrete_fields)
+
+    def _shown_on(self):
+        """Returns the detail pages ({kind: queryset}) showing the rows."""
+        rows = self.order_by().values('pk')
+        if self.model is Book:
+            return {'book': _page_models('book', self.db).filter(pk__in=rows),
+                    'author': _page_models('author', self.db).filter(
+                        book__in=rows)}
+        if self.model is BookInstance:
+            return {'book': _page_models('book', self.db).filter(
+                bookinstance__in=rows)}
+        if self.model is Author:
+            return {'author': _page_models('author', self.db).filter(
+                        pk__in=rows),
+                    'book': _page_models('book', self.db).filter(
+                        author__in=rows)}
+        if self.model is Genre:
+            return {'book': _page_models('book', self.db).filter(
+                genre__in=rows)}
+        if self.model is Language:
+            return {'book': _page_models('book', self.db).filter(
+                language__in=rows)}
+        return {}
+
+    def _indexed_books(self, fields, rows):
+        """Returns the books whose search documents show the changed
+        ``fields`` of the ``rows`` (primary keys)."""
+        fields = {name[:-3] if name.endswith('_id') else name
+                  for name in fields}
+        if not fields & INDEXED_FIELDS.get(self.model._meta.model_name,
+                                           set()):
+            return []
+        lookup = {Book: 'pk__in', Author: 'author__in',
+                  Genre: 'genre__in'}[self.model]
+        return list(Book._base_manager.db_manager(self.db)
+                    .filter(**{lookup: rows}).order_by()
+                    .values_list('pk', flat=True).distinct())
+
+    def _reindex(self, book_ids):
+        """Rebuilds the search documents of the books ``book_ids``."""
+        # search.py imports the models
+        from .search import update_index
+        if book_ids:
+            update_index(book_ids, using=self.db)
+
+    def _moved_to(self, kwargs):
+        """Returns the detail pages ({kind: pks}) the update moves the rows
+        to; pks is None when the new value is an expression."""
+        kind = {Book: 'author', BookInstance: 'book'}.get(self.model)
+        for name in (kind, '%s_id' % kind) if kind else ():
+            if name in kwargs:
+                value = kwargs[name]
+                if hasattr(value, 'resolve_expression'):
+                    return {kind: None}
+                return {kind: [getattr(value, 'pk', value)]}
+        return {}
+
+    def update(self, **kwargs):
+        """Updates the rows, moving copies between the status counters
+        when ``status`` is set to a new value, and rebuilds the search
+        documents showing the changed fields."""
+        now = timezone.now()
+        if self._stamped:
+            # auto_now is only applied by save()
+            kwargs.setdefault('modified', now)
+        own = self.model._meta.model_name
+        moved = self._moved_to(kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            # The update may take the rows out of the queryset and off the
+            # pages showing them, so those are found and touched first
+            stale = {}
+            for kind, pages in self._shown_on().items():
+                stale[kind] = _page_pks(pages)
+                if kind != own:
+                    pages.update(modified=now)
+            indexed = self._indexed_books(kwargs, self.order_by().values('pk'))
+            if self.model is not BookInstance or 'status' not in kwargs:
+                rows = super().update(**kwargs)
+            else:
+                before = (self.order_by().values_list('status')
+                          .annotate(Count('pk')))
+                deltas = Counter()
+                for status, num in before:
+                    deltas[CatalogCounter.status_counter(status)] -= num
+                    deltas[CatalogCounter.status_counter(
+                        kwargs['status'])] += num
+                rows = super().update(**kwargs)
+                CatalogCounter.objects.db_manager(self.db).adjust(deltas)
+            for kind, pks in moved.items():
+                if pks is not None:
+                    _page_models(kind, self.db).filter(pk__in=pks).update(
+                        modified=now)
+            self._reindex(indexed)
+        for kind, pks in stale.items():
+            after_commit(self.db, invalidate_details, kind, pks)
+        for kind, pks in moved.items():
+            if pks is None:
+                # An expression may move the rows to any page
+                after_commit(self.db, invalidate_all_details, kind)
+            else:
+                after_commit(self.db, invalidate_details, kind, pks)
+        return rows
+
+
+class BookInstanceQuerySet(CountedQuerySet):
+    """Loan queries computed by the database."""
+
+    def on_loan(self):
+        return self.filter(status__exact='o')
+
+    def overdue(self, today=None, min_days=0):
+        """Loans at least ``min_days`` past their due date.
+
+        Only compares ``due_back`` with a constant, so the partial loan
+        indexes serve both the filter and the due date ordering.
+        """
+        today = today or date.today()
+        return self.on_loan().filter(
+            due_back__lt=today - timedelta(days=max(min_days, 1) - 1))
+
+    def with_days_overdue(self, today=None):
+        """Annotates ``days_overdue`` (a timedelta, negative if not due
+        yet) and ``is_overdue_db``."""
+        today = today or date.today()
+        return self.annotate(
+            days_overdue=ExpressionWrapper(
+                Value(today) - F('due_back'), output_field=DurationField()),
+            is_overdue_db=Case(
+                When(status='o', due_back__lt=today, then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+
+    def overdue_by_borrower(self, today=None):
+        """Number of overdue loans and oldest due date of every borrower,
+        most overdue loans first."""
+        return (
+            self.overdue(today).order_by()
+            .values('borrower', 'borrower__username')
+            .annotate(num_overdue=Count('pk'), oldest_due=Min('due_back'))
+            .order_by('-num_overdue', 'oldest_due')
+        )
+
+
+class PrefixIndex(models.Index):
+    """
+    Index of lower cased columns, such as ``Lower('name')``, serving the
+    ``Lower('name')__startswith`` prefix searches (``name__istartswith``
+    compiles to UPPER(name) LIKE, which no index serves). On PostgreSQL
+    it uses the text_pattern_ops operator class, without which LIKE can
+    only use it under the C collation.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        index = self
+        if schema_editor.connection.vendor == 'postgresql':
+            # Imported here: django.contrib.postgres needs psycopg2
+            from django.contrib.postgres.indexes import OpClass
+            index = self.clone()
+            index.expressions = tuple(
+                OpClass(expression, name='text_pattern_ops')
+                for expression in self.expressions)
+        return super(PrefixIndex, index).create_sql(
+            model, schema_editor, using, **kwargs)
 
 
 class Language(models.Model):
@@ -17,11 +408,19 @@ class Language(models.Model):
     name = models.CharField(
         max_length=20, help_text='Enter a language name'
     )
+
+    objects = CountedQuerySet.as_manager()
     # …
 
     # Metadata
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Ordered listing of the book form picker
+            models.Index(fields=['name'], name='language_name_idx'),
+            # Prefix search of the book form picker and the admin
+            PrefixIndex(Lower('name'), name='language_name_lower_idx'),
+        ]
 
     # Methods
     def get_absolute_url(self):
@@ -43,6 +442,8 @@ class Genre(models.Model):
         help_text="Enter a book genre (e.g. Science Fiction, French...)"
     )
 
+    objects = CountedQuerySet.as_manager()
+
     def __str__(self):
         """String for representing the Model object."""
         return self.name
@@ -61,6 +462,10 @@ class Genre(models.Model):
                 )
             ),
         ]
+        indexes = [
+            # Prefix search of the book form picker
+            PrefixIndex(Lower('name'), name='genre_name_lower_idx'),
+        ]
 
 
 class Book(models.Model):
@@ -94,6 +499,14 @@ class Book(models.Model):
         Genre, help_text="Select a genre for this book"
     )
 
+    # Content hash of the last catalog feed sync (see sync.py)
+    sync_hash = models.CharField(max_length=32, blank=True, editable=False)
+
+    # Last change of the book or of what its page shows (see touch_pages())
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CountedQuerySet.as_manager()
+
     def __str__(self):
         """String for representing the Model object."""
         return self.title
@@ -106,11 +519,22 @@ class Book(models.Model):
         """
         Creates a string for the Genre.
         """
-        return ', '.join([genre.name for genre in self.genre.all()[:3]])
+        if 'genre' in getattr(self, '_prefetched_objects_cache', {}):
+            # Slicing a prefetched relation would query it again
+            genres = list(self.genre.all())[:3]
+        else:
+            genres = self.genre.all()[:3]
+        return ', '.join([genre.name for genre in genres])
     display_genre.short_description = 'Genre'
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            # Ordered listing and keyset pagination on (title, id)
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+            # Prefix search of the admin
+            PrefixIndex(Lower('title'), name='book_title_lower_idx'),
+        ]
 
 
 class BookInstance(models.Model):
@@ -143,9 +567,26 @@ class BookInstance(models.Model):
         help_text='Book availability',
     )
 
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = BookInstanceQuerySet.as_manager()
+
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # Copies by status, in due date order (any database)
+            models.Index(fields=['status', 'due_back', 'id'],
+                         name='bookinstance_status_due_idx'),
+            # Loans of a borrower and all loans, in due date order
+            # (partial indexes, only where the database supports them)
+            models.Index(fields=['borrower', 'due_back', 'id'],
+                         condition=Q(status='o'),
+                         name='bookinstance_loan_user_idx'),
+            models.Index(fields=['due_back', 'id'],
+                         condition=Q(status='o'),
+                         name='bookinstance_loan_due_idx'),
+        ]
 
     @property
     def is_overdue(self):
@@ -166,12 +607,33 @@ class Author(models.Model):
     date_of_birth = models.DateField('birth', null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
 
+    # Content hash of the last catalog feed sync (see sync.py)
+    sync_hash = models.CharField(max_length=32, blank=True, editable=False)
+
+    # Last change of the author or of what its page shows
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CountedQuerySet.as_manager()
+
     def get_absolute_url(self):
         """
         Retorna la url para acceder a una instancia particular de un autor.
         """
         return reverse('author-detail', args=[str(self.id)])
 
+    class Meta:
+        ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name', 'id'],
+                         name='author_name_idx'),
+            # Case-insensitive author lookups of the feed sync, and prefix
+            # search of the book form picker and the admin
+            PrefixIndex(Lower('last_name'),
+                        name='author_last_name_lower_idx'),
+            PrefixIndex(Lower('first_name'),
+                        name='author_first_name_lower_idx'),
+        ]
+
     def __str__(self):
         """
         String para representar el Objeto Modelo
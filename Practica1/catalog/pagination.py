@@ -0,0 +1,250 @@
+"""
+Keyset (cursor) pagination for the catalog list views.
+
+Instead of ``OFFSET n`` and a ``COUNT(*)`` per page, each page is fetched
+with a ``WHERE (keys) > (last row keys) ORDER BY keys LIMIT n`` query, which
+costs the same on the first page and on the millionth. The position is
+carried in an opaque, URL-safe cursor token. Nullable keys sort last.
+
+EstimatedCountPaginator keeps OFFSET pages (for the admin) but avoids
+exact counts of huge tables.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from .models import CatalogCounter
+
+# Filtered lists estimated above this many rows are not counted exactly
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def ordering_expressions(model, keys, reverse=False):
+    """Returns the order_by() expressions of ``keys``, with nulls last
+    (first if ``reverse``, which is the exact opposite ordering)."""
+    expressions = []
+    for key in keys:
+        name = key.lstrip('-')
+        descending = key.startswith('-') != reverse
+        nulls = {}
+        if model._meta.get_field(name).null:
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        expressions.append(
+            F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+    return expressions
+
+
+def _beyond(model, key, value, reverse):
+    """Rows strictly after (before if ``reverse``) ``value`` on ``key``."""
+    name = key.lstrip('-')
+    greater = key.startswith('-') == reverse
+    lookup = '%s__%s' % (name, 'lt' if not greater else 'gt')
+    if not model._meta.get_field(name).null:
+        return Q(**{lookup: value})
+    # Nulls sort last going forward, first going backward
+    if value is None:
+        return Q(pk__in=[]) if not reverse else Q(**{name + '__isnull': False})
+    if reverse:
+        return Q(**{lookup: value})
+    return Q(**{lookup: value}) | Q(**{name + '__isnull': True})
+
+
+def _equal(key, value):
+    name = key.lstrip('-')
+    if value is None:
+        return Q(**{name + '__isnull': True})
+    return Q(**{name: value})
+
+
+def keyset_filter(model, keys, values, reverse=False):
+    """Returns the Q selecting the rows after the row with ``values``."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for key, value in zip(keys, values):
+        condition |= equal & _beyond(model, key, value, reverse)
+        equal &= _equal(key, value)
+    return condition
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, compatible with the page templates."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginates ``queryset`` over the unique ordering ``keys`` (the last one
+    must be unique, usually ``id``). The total count is only computed when
+    ``count`` is true.
+    """
+
+    def __init__(self, queryset, per_page, keys, count=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.model = queryset.model
+        self.with_count = count
+        self._count = None
+
+    @property
+    def count(self):
+        """Total number of rows, or None if counting is disabled."""
+        if self.with_count and self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+
+    def encode_cursor(self, obj, reverse=False):
+        values = [
+            self.model._meta.get_field(key.lstrip('-')).value_from_object(obj)
+            for key in self.keys
+        ]
+        data = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder,
+                          separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Returns the (values, reverse) of a cursor; Http404 if invalid."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(data['v']) != len(self.keys):
+                raise ValueError(cursor)
+            values = [
+                None if value is None else
+                self.model._meta.get_field(key.lstrip('-')).to_python(value)
+                for key, value in zip(self.keys, data['v'])
+            ]
+            return values, bool(data['r'])
+        except Exception:
+            raise Http404('Invalid cursor.')
+
+    def page(self, cursor=None):
+        """Returns the page after (or before) the position of ``cursor``."""
+        values, reverse = (self.decode_cursor(cursor) if cursor
+                           else (None, False))
+        queryset = self.queryset.order_by(
+            *ordering_expressions(self.model, self.keys, reverse))
+        if values is not None:
+            queryset = queryset.filter(
+                keyset_filter(self.model, self.keys, values, reverse))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        # Going forward there is a previous page iff we came from a cursor;
+        # going backward there is always a next page.
+        has_next = (more or values is not None) if reverse else more
+        has_previous = more if reverse else values is not None
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin adding a cursor pagination mode over ``keyset_ordering``.
+
+    The mode is ``pagination_mode`` ('page' or 'cursor', by default the
+    CATALOG_PAGINATION_MODE setting); a ``cursor`` GET parameter always
+    selects cursor mode. ``paginate_count = False`` skips the total count.
+    """
+    keyset_ordering = ('id',)
+    pagination_mode = None
+    paginate_count = True
+    cursor_kwarg = 'cursor'
+
+    def get_pagination_mode(self):
+        if self.cursor_kwarg in self.request.GET:
+            return 'cursor'
+        return self.pagination_mode or getattr(
+            settings, 'CATALOG_PAGINATION_MODE', 'page')
+
+    def get_ordering(self):
+        return ordering_expressions(self.model, self.keyset_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'cursor':
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering,
+                                    count=self.paginate_count)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = (
+            self.get_pagination_mode() == 'cursor')
+        return context
+
+
+def planner_estimate(queryset):
+    """Number of rows of ``queryset`` estimated by the PostgreSQL planner
+    (EXPLAIN, the query is not run)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count never scans a whole table: an unfiltered list
+    of a counted model reads its catalog counter and, on PostgreSQL, a
+    filtered list the planner estimates above ESTIMATED_COUNT_THRESHOLD
+    rows reports that estimate. Smaller lists are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        counter = CatalogCounter.MODEL_COUNTERS.get(
+            queryset.model._meta.model_name)
+        if counter and not queryset.query.where:
+            value = (CatalogCounter.objects.using(queryset.db)
+                     .filter(name=counter)
+                     .values_list('value', flat=True).first())
+            if value is not None:
+                return value
+        elif connections[queryset.db].vendor == 'postgresql':
+            estimate = planner_estimate(queryset)
+            if estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,305 @@
+"""
+Full-text search over the book catalog.
+
+Every Book has a search document (title, author name, genre names, ISBN
+and summary) stored in the ``catalog_booksearch`` table: a weighted
+tsvector column with a GIN index on PostgreSQL, and an FTS5 virtual table
+on SQLite. The documents are built by the database itself with
+INSERT ... SELECT, so indexing any number of books is a single statement.
+The signals (see signals.py) keep the index up to date; bulk loaders call
+update_index() themselves.
+
+Other database backends fall back to an ``icontains`` scan.
+"""
+
+import re
+
+from django.db import connections, models
+
+from .models import Book
+
+SEARCH_TABLE = 'catalog_booksearch'
+
+# Maximum number of words of a search query
+MAX_QUERY_WORDS = 10
+
+# Maximum number of book ids sent in a single statement
+BATCH_SIZE = 500
+
+
+def query_words(query):
+    """Splits a user query into the words that are searched for."""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_QUERY_WORDS]
+
+
+class SearchBackend:
+    """Search index stored in the catalog_booksearch table. Subclasses
+    implement create(), index() and match_query() for their database."""
+
+    # SQL of the concatenated genre names of the book ``b``
+    genres_sql = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _where(self, book_ids=None, author_id=None, genre_id=None):
+        """Returns the WHERE clause selecting the books to (re)index."""
+        if book_ids is not None:
+            return 'WHERE b.id IN (%s)' % ', '.join(
+                ['%s'] * len(book_ids)), list(book_ids)
+        if author_id is not None:
+            return 'WHERE b.author_id = %s', [author_id]
+        if genre_id is not None:
+            return ('WHERE b.id IN (SELECT book_id FROM catalog_book_genre '
+                    'WHERE genre_id = %s)', [genre_id])
+        return '', []
+
+    def _document_from(self):
+        return (
+            'FROM catalog_book b '
+            'LEFT JOIN catalog_author a ON a.id = b.author_id'
+        )
+
+    def create(self):
+        """Creates the search table and its indexes."""
+        raise NotImplementedError
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % SEARCH_TABLE)
+
+    def index(self, **selection):
+        """(Re)builds the documents of the books selected as in
+        _where()."""
+        raise NotImplementedError
+
+    def match_query(self, words):
+        """Returns the full-text query matching every word as a prefix."""
+        raise NotImplementedError
+
+    def remove(self, book_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE %s IN (%s)' % (
+                    SEARCH_TABLE, self.id_column,
+                    ', '.join(['%s'] * len(book_ids))),
+                list(book_ids))
+
+    def count(self, words):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.count_sql, [self.match_query(words)])
+            return cursor.fetchone()[0]
+
+    def search(self, words, limit, offset):
+        """Returns the ids of the matching books, best ranked first."""
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.search_sql,
+                           [self.match_query(words), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector documents with a GIN index."""
+
+    id_column = 'book_id'
+    genres_sql = (
+        "(SELECT string_agg(g.name, ' ') FROM catalog_book_genre bg "
+        "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id)"
+    )
+    count_sql = (
+        'SELECT COUNT(*) FROM %s '
+        "WHERE document @@ to_tsquery('simple', %%s)" % SEARCH_TABLE
+    )
+    search_sql = (
+        'SELECT book_id FROM %s, '
+        "to_tsquery('simple', %%s) query WHERE document @@ query "
+        'ORDER BY ts_rank(document, query) DESC, book_id '
+        'LIMIT %%s OFFSET %%s' % SEARCH_TABLE
+    )
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS %s ('
+                'book_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+                % SEARCH_TABLE)
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS %s_document_gin '
+                'ON %s USING gin (document)' % (SEARCH_TABLE, SEARCH_TABLE))
+
+    def index(self, **selection):
+        where, params = self._where(**selection)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (book_id, document) SELECT b.id, '
+                "setweight(to_tsvector('simple', coalesce(b.title, '')), 'A')"
+                " || setweight(to_tsvector('simple', coalesce(a.first_name, "
+                "'') || ' ' || coalesce(a.last_name, '')), 'B')"
+                " || setweight(to_tsvector('simple', coalesce(%s, '') || ' ' "
+                "|| b.isbn), 'C')"
+                " || setweight(to_tsvector('simple', b.summary), 'D') "
+                '%s %s ON CONFLICT (book_id) '
+                'DO UPDATE SET document = EXCLUDED.document'
+                % (SEARCH_TABLE, self.genres_sql, self._document_from(),
+                   where),
+                params)
+
+    def match_query(self, words):
+        return ' & '.join('%s:*' % word for word in words)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 virtual table whose rowid is the book id."""
+
+    id_column = 'rowid'
+    genres_sql = (
+        "(SELECT group_concat(g.name, ' ') FROM catalog_book_genre bg "
+        "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id)"
+    )
+    count_sql = (
+        'SELECT COUNT(*) FROM %s WHERE %s MATCH %%s'
+        % (SEARCH_TABLE, SEARCH_TABLE)
+    )
+    # Column weights: title, author, genres, isbn, summary
+    search_sql = (
+        'SELECT rowid FROM %s WHERE %s MATCH %%s '
+        'ORDER BY bm25(%s, 10.0, 5.0, 2.0, 2.0, 1.0), rowid '
+        'LIMIT %%s OFFSET %%s' % (SEARCH_TABLE, SEARCH_TABLE, SEARCH_TABLE)
+    )
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5('
+                'title, author, genres, isbn, summary, '
+                "tokenize = 'unicode61 remove_diacritics 2')" % SEARCH_TABLE)
+
+    def index(self, **selection):
+        where, params = self._where(**selection)
+        with self.connection.cursor() as cursor:
+            # FTS5 tables have no upsert: replace the documents
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid IN (SELECT b.id FROM '
+                'catalog_book b %s)' % (SEARCH_TABLE, where), params)
+            cursor.execute(
+                'INSERT INTO %s (rowid, title, author, genres, isbn, summary)'
+                " SELECT b.id, b.title, coalesce(a.first_name, '') || ' ' || "
+                "coalesce(a.last_name, ''), coalesce(%s, ''), b.isbn, "
+                'b.summary %s %s'
+                % (SEARCH_TABLE, self.genres_sql, self._document_from(),
+                   where),
+                params)
+
+    def match_query(self, words):
+        return ' '.join('"%s"*' % word for word in words)
+
+
+class FallbackSearchBackend:
+    """Unindexed search for databases without full-text support."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def index(self, **selection):
+        pass
+
+    def remove(self, book_ids):
+        pass
+
+    def _queryset(self, words):
+        queryset = Book.objects.using(self.connection.alias)
+        for word in words:
+            queryset = queryset.filter(
+                models.Q(title__icontains=word)
+                | models.Q(author__first_name__icontains=word)
+                | models.Q(author__last_name__icontains=word)
+                | models.Q(summary__icontains=word)
+                | models.Q(isbn__icontains=word)
+            )
+        return queryset
+
+    def count(self, words):
+        return self._queryset(words).count()
+
+    def search(self, words, limit, offset):
+        return list(self._queryset(words).order_by('title', 'id')
+                    .values_list('id', flat=True)[offset:offset + limit])
+
+
+def get_backend(using='default'):
+    """Returns the search backend of the ``using`` database."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend(connection)
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend(connection)
+    return FallbackSearchBackend(connection)
+
+
+def update_index(book_ids=None, author_id=None, genre_id=None,
+                 using='default'):
+    """(Re)builds the search documents of the given books, of the books of
+    an author or genre, or of every book if no selection is given."""
+    backend = get_backend(using)
+    if book_ids is None:
+        backend.index(author_id=author_id, genre_id=genre_id)
+        return
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        backend.index(book_ids=book_ids[start:start + BATCH_SIZE])
+
+
+def remove_from_index(book_ids, using='default'):
+    """Removes the search documents of the given books."""
+    book_ids = list(book_ids)
+    backend = get_backend(using)
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        backend.remove(book_ids[start:start + BATCH_SIZE])
+
+
+def rebuild_index(using='default'):
+    """Drops and rebuilds the whole search index."""
+    backend = get_backend(using)
+    backend.drop()
+    backend.create()
+    backend.index()
+
+
+class SearchResults:
+    """
+    Ranked results of a search, evaluated lazily one page at a time so they
+    can be handed to Django's Paginator.
+    """
+    model = Book
+
+    def __init__(self, query, using='default'):
+        self.query = query
+        self.words = query_words(query)
+        self.backend = get_backend(using)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.words) if self.words else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if not self.words or stop <= start:
+            return []
+        ids = self.backend.search(self.words, stop - start, start)
+        books = (Book.objects.using(self.backend.connection.alias)
+                 .select_related('author').in_bulk(ids))
+        return [books[pk] for pk in ids if pk in books]
@@ -0,0 +1,190 @@
+"""
+Signal receivers that keep the catalog counters and caches coherent with
+the database.
+"""
+
+from django.db.models.signals import (
+    m2m_changed, post_init, post_save, post_delete, pre_delete
+)
+from django.dispatch import receiver
+
+from .autocomplete import MODEL_SOURCES, invalidate_autocomplete
+from .caching import invalidate_details
+from .models import (
+    Book, BookInstance, Author, Genre, Language, CatalogCounter,
+    after_commit, counter_deltas, touch_pages
+)
+from .search import remove_from_index, update_index
+
+
+@receiver(post_init, sender=BookInstance)
+def remember_status(sender, instance, **kwargs):
+    """Keeps the loaded status so a later save can move the copy between
+    the status counters, and the loaded book, whose page shows the copy."""
+    instance._counted_status = instance.__dict__.get('status')
+    instance._shown_on = instance.__dict__.get('book_id')
+
+
+@receiver(post_init, sender=Book)
+def remember_author(sender, instance, **kwargs):
+    """Keeps the loaded author, whose page lists the book."""
+    instance._shown_on = instance.__dict__.get('author_id')
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def count_saved(sender, instance, created, **kwargs):
+    """Updates the counters after an object is created or changes status."""
+    if created:
+        deltas = counter_deltas(sender, [instance])
+    elif sender is BookInstance and instance._counted_status is not None:
+        deltas = {
+            CatalogCounter.status_counter(instance._counted_status): -1,
+        }
+        new = CatalogCounter.status_counter(instance.status)
+        deltas[new] = deltas.get(new, 0) + 1
+    else:
+        deltas = {}
+    CatalogCounter.objects.db_manager(kwargs['using']).adjust(deltas)
+    if sender is BookInstance:
+        instance._counted_status = instance.status
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def count_deleted(sender, instance, **kwargs):
+    """Updates the counters after an object is deleted."""
+    CatalogCounter.objects.db_manager(kwargs['using']).adjust(
+        counter_deltas(sender, [instance], sign=-1))
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using='default', **kwargs):
+    """Rebuilds the search document of a saved book."""
+    update_index([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using='default', **kwargs):
+    """Removes the search document of a deleted book."""
+    remove_from_index([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Author)
+def index_author_books(sender, instance, created, using='default', **kwargs):
+    """Rebuilds the documents of the books of a renamed author."""
+    if not created:
+        update_index(author_id=instance.pk, using=using)
+
+
+@receiver(post_save, sender=Genre)
+def index_genre_books(sender, instance, created, using='default', **kwargs):
+    """Rebuilds the documents of the books of a renamed genre."""
+    if not created:
+        update_index(genre_id=instance.pk, using=using)
+
+
+@receiver(pre_delete, sender=Genre)
+def remember_genre_books(sender, instance, **kwargs):
+    """Keeps the books of a genre about to be deleted."""
+    instance._indexed_books = list(
+        instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def index_deleted_genre_books(sender, instance, using='default', **kwargs):
+    """Rebuilds the documents of the books of a deleted genre."""
+    update_index(instance._indexed_books, using=using)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def index_book_genres(sender, instance, action, reverse, pk_set,
+                      using='default', **kwargs):
+    """Rebuilds the documents of books whose genres changed."""
+    if action == 'pre_clear' and reverse:
+        instance._indexed_books = list(
+            instance.book_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        update_index([instance.pk], using=using)
+    elif action == 'post_clear':
+        update_index(instance._indexed_books, using=using)
+    else:
+        update_index(pk_set, using=using)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def refresh_autocomplete(sender, **kwargs):
+    """Drops the cached picker options of a changed author, genre or
+    language."""
+    invalidate_autocomplete(MODEL_SOURCES[sender])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def refresh_book_pages(sender, instance, **kwargs):
+    """Drops the cached pages of a changed book and touches its authors."""
+    after_commit(kwargs['using'], invalidate_details, 'book', [instance.pk])
+    touch_pages('author', [instance.author_id, instance._shown_on],
+                kwargs['using'])
+    instance._shown_on = instance.author_id
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def refresh_copy_pages(sender, instance, **kwargs):
+    """Touches the books of a changed copy."""
+    touch_pages('book', [instance.book_id, instance._shown_on],
+                kwargs['using'])
+    instance._shown_on = instance.book_id
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def refresh_author_pages(sender, instance, created=None, **kwargs):
+    """Drops the cached pages of a changed author and touches its books."""
+    after_commit(kwargs['using'], invalidate_details, 'author',
+                 [instance.pk])
+    # A deleted author (created is None) has no books left
+    if created is False:
+        touch_pages('book', instance.book_set.values_list('pk', flat=True),
+                    kwargs['using'])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+def refresh_renamed_pages(sender, instance, created, **kwargs):
+    """Touches the books of a changed genre or language."""
+    if not created:
+        touch_pages('book', instance.book_set.values_list('pk', flat=True),
+                    kwargs['using'])
+
+
+@receiver(post_delete, sender=Genre)
+def refresh_deleted_genre_pages(sender, instance, **kwargs):
+    """Touches the books of a deleted genre."""
+    touch_pages('book', instance._indexed_books, kwargs['using'])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def refresh_genre_pages(sender, instance, action, reverse, pk_set,
+                        using='default', **kwargs):
+    """Touches the books whose genres changed."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_pages('book', [instance.pk], using)
+    elif action == 'post_clear':
+        touch_pages('book', instance._indexed_books, using)
+    else:
+        touch_pages('book', pk_set, using)
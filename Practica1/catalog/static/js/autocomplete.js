@@ -0,0 +1,35 @@
+// Pickers of selects with a data-autocomplete-url: a search box above the
+// select fetches the options starting with what is typed.
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('select[data-autocomplete-url]').forEach(function (select) {
+    var search = document.createElement('input');
+    var timer = null;
+    search.type = 'search';
+    search.placeholder = 'Search...';
+    select.parentNode.insertBefore(search, select);
+    search.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(search.value);
+        fetch(url).then(function (response) {
+          return response.json();
+        }).then(function (data) {
+          // Keep the selected options (and the empty one), replace the rest
+          Array.from(select.options).forEach(function (option) {
+            if (!option.selected && option.value !== '') {
+              option.remove();
+            }
+          });
+          var present = Array.from(select.options).map(function (option) {
+            return option.value;
+          });
+          data.results.forEach(function (result) {
+            if (present.indexOf(String(result.id)) === -1) {
+              select.add(new Option(result.text, result.id));
+            }
+          });
+        });
+      }, 200);
+    });
+  });
+});
@@ -0,0 +1,55 @@
+"""
+Dashboard statistics shown on the catalog home page.
+
+The counters are read from the incrementally maintained CatalogCounter
+table (a handful of rows, one query) and kept in the cache for a short time
+(``CATALOG_STATS_TIMEOUT`` seconds), under a key with a version token.
+Every change of the counters (CatalogCounterManager.adjust()) drops the
+token once committed, so the next request misses.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import cache_fill
+from .models import BookInstance, CatalogCounter
+
+STATS_CACHE_KEY = 'catalog:stats'
+STATS_VERSION_KEY = 'catalog:stats:version'
+
+
+def compute_catalog_stats():
+    """Reads every home page counter with one query."""
+    counters = CatalogCounter.objects.snapshot()
+    return {
+        'num_books': counters.get('books', 0),
+        'num_instances': counters.get('instances', 0),
+        'num_instances_available': counters.get(
+            CatalogCounter.status_counter('a'), 0),
+        'num_authors': counters.get('authors', 0),
+        'num_genres': counters.get('genres', 0),
+        'num_instances_by_status': {
+            status: counters.get(CatalogCounter.status_counter(status), 0)
+            for status, _ in BookInstance.LOAN_STATUS
+        },
+    }
+
+
+def get_catalog_stats():
+    """Returns the cached counters, computing them on a cache miss (once
+    among concurrent requests, see caching.cache_fill)."""
+    version = cache.get(STATS_VERSION_KEY)
+    if version is None:
+        cache.add(STATS_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(STATS_VERSION_KEY)
+    return cache_fill('%s:%s' % (STATS_CACHE_KEY, version),
+                      compute_catalog_stats,
+                      getattr(settings, 'CATALOG_STATS_TIMEOUT', 60))
+
+
+def invalidate_catalog_stats():
+    """Makes the cached counters stale so the next request recomputes
+    them."""
+    cache.delete(STATS_VERSION_KEY)
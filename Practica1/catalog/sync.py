@@ -0,0 +1,219 @@
+"""
+Incremental (delta) sync of authors and books from a catalog feed.
+
+Books are keyed on their ISBN and authors on their normalized name
+(case-insensitive, with the whitespace collapsed). Every synced row stores
+the hash of its feed content in ``sync_hash``; a feed row whose hash
+matches the stored one is not written at all, so a nightly feed with few
+changes only writes those few rows. Changed rows are written with
+bulk_create(update_conflicts=True) where the database supports it, and
+bulk_update() elsewhere.
+
+With ``delete``, the rows absent from the feed are deleted afterwards,
+except the books that still have copies and the authors that still have
+books. The keys seen in the feed are kept in memory for that.
+
+Rows synced for the first time (with an empty ``sync_hash``) are
+rewritten once.
+"""
+
+import hashlib
+import json
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .loader import CatalogLoader, chunked
+from .models import Author, Book, touch_pages
+from .search import update_index
+
+AUTHOR_FIELDS = ['first_name', 'last_name', 'date_of_birth', 'date_of_death',
+                 'sync_hash']
+BOOK_FIELDS = ['title', 'summary', 'author', 'language', 'sync_hash']
+
+
+def normalize(name):
+    return ' '.join((name or '').split()).lower()
+
+
+def name_key(first_name, last_name):
+    """Key of an author in the feed: its normalized name."""
+    return (normalize(first_name), normalize(last_name))
+
+
+def content_hash(values):
+    data = json.dumps(values, default=str, separators=(',', ':'))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def author_hash(record):
+    return content_hash([record['first_name'], record['last_name'],
+                         record['date_of_birth'], record['date_of_death']])
+
+
+def book_hash(record, author_id):
+    """Includes the resolved author, so a book synced before its author
+    is linked to it by a later sync."""
+    return content_hash([
+        record['title'], record['summary'], author_id, record['language'],
+        sorted(normalize(name) for name in record['genre']),
+    ])
+
+
+class SyncCounts:
+    """Rows inserted, updated, left unchanged and deleted by a sync."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+
+class CatalogSync:
+    """Syncs chunks of validated author or book records (see importer.py).
+    Each ``sync_*`` call must run inside a transaction."""
+
+    def __init__(self, using='default', delete=False, loader=None):
+        self.using = using
+        self.delete = delete
+        self.loader = loader or CatalogLoader(using=using)
+        self.counts = SyncCounts()
+        self.seen_authors = set()
+        self.seen_books = set()
+
+    def _manager(self, model):
+        return model.objects.db_manager(self.using)
+
+    def upsert(self, model, objs, unique_field, fields):
+        """Writes ``fields`` of the existing rows ``objs``."""
+        if not objs:
+            return
+        features = connections[self.using].features
+        if features.supports_update_conflicts_with_target:
+            self._manager(model).bulk_create(
+                objs, update_conflicts=True, unique_fields=[unique_field],
+                update_fields=[f for f in fields if f != unique_field])
+        else:
+            self._manager(model).bulk_update(objs, fields)
+
+    def authors_by_key(self, keys):
+        """Returns {name key: (id, sync_hash)} of the existing authors."""
+        last_names = {last_name for _, last_name in keys}
+        rows = (self._manager(Author)
+                .annotate(last_name_lower=Lower('last_name'))
+                .filter(Q(last_name_lower__in=last_names)
+                        | Q(last_name__in=[key[1] for key in keys]))
+                .order_by('pk')
+                .values_list('first_name', 'last_name', 'pk', 'sync_hash'))
+        found = {}
+        for first_name, last_name, pk, digest in rows:
+            found.setdefault(name_key(first_name, last_name), (pk, digest))
+        return {key: found[key] for key in keys if key in found}
+
+    def sync_authors(self, records):
+        by_key = {name_key(r['first_name'], r['last_name']): r
+                  for r in records}
+        existing = self.authors_by_key(by_key)
+        new, changed = [], []
+        for key, record in by_key.items():
+            digest = author_hash(record)
+            author = Author(
+                first_name=record['first_name'],
+                last_name=record['last_name'],
+                date_of_birth=record['date_of_birth'],
+                date_of_death=record['date_of_death'], sync_hash=digest)
+            if key not in existing:
+                new.append(author)
+            elif existing[key][1] != digest:
+                author.pk = existing[key][0]
+                changed.append(author)
+            else:
+                self.counts.unchanged += 1
+        self._manager(Author).bulk_create(new)
+        self.upsert(Author, changed, 'id', AUTHOR_FIELDS)
+        if changed:
+            # The author name is part of the search documents and of the
+            # book pages
+            book_ids = list(self._manager(Book).filter(
+                author__in=[author.pk for author in changed])
+                .values_list('pk', flat=True))
+            update_index(book_ids, using=self.using)
+            touch_pages('book', book_ids, self.using)
+        self.counts.inserted += len(new)
+        self.counts.updated += len(changed)
+        if self.delete:
+            self.seen_authors.update(by_key)
+
+    def sync_books(self, records):
+        languages = self.loader.language_map()
+        genres = self.loader.genre_map()
+        by_isbn = {record['isbn']: record for record in records}
+        existing = {
+            isbn: (pk, digest, author_id) for isbn, pk, digest, author_id in
+            self._manager(Book).filter(isbn__in=by_isbn)
+            .values_list('isbn', 'pk', 'sync_hash', 'author_id')
+        }
+        authors = self.authors_by_key({
+            name_key(r['author']['first_name'], r['author']['last_name'])
+            for r in by_isbn.values() if r['author']})
+        new, changed = [], []
+        for isbn, record in by_isbn.items():
+            author = record['author']
+            author_id = authors.get(name_key(
+                author['first_name'], author['last_name']),
+                (None,))[0] if author else None
+            digest = book_hash(record, author_id)
+            if isbn in existing and existing[isbn][1] == digest:
+                self.counts.unchanged += 1
+                continue
+            book = Book(
+                title=record['title'], isbn=isbn, summary=record['summary'],
+                author_id=author_id,
+                language_id=languages.get(record['language']),
+                sync_hash=digest)
+            if isbn in existing:
+                book.pk = existing[isbn][0]
+                changed.append(book)
+            else:
+                new.append(book)
+        self._manager(Book).bulk_create(new)
+        self.upsert(Book, changed, 'isbn', BOOK_FIELDS)
+        # The pages of the previous authors list the changed books
+        touch_pages('author', [existing[book.isbn][2] for book in changed],
+                    self.using)
+
+        through = self._manager(Book.genre.through)
+        through.filter(book__in=[book.pk for book in changed]).delete()
+        through.bulk_create([
+            Book.genre.through(book_id=book.pk,
+                               genre_id=genres[name.lower()])
+            for book in new + changed
+            for name in by_isbn[book.isbn]['genre']
+            if name.lower() in genres
+        ], ignore_conflicts=True)
+        update_index([book.pk for book in new + changed], using=self.using)
+        self.counts.inserted += len(new)
+        self.counts.updated += len(changed)
+        if self.delete:
+            self.seen_books.update(by_isbn)
+
+    def delete_unseen(self, kind, batch_size):
+        """Deletes the rows of ``kind`` that were not in the feed."""
+        if kind == 'books':
+            model, seen = Book, self.seen_books
+            rows = (self._manager(Book).filter(bookinstance__isnull=True)
+                    .values_list('pk', 'isbn'))
+            key = (lambda row: row[1])
+        else:
+            model, seen = Author, self.seen_authors
+            rows = (self._manager(Author).filter(book__isnull=True)
+                    .values_list('pk', 'first_name', 'last_name'))
+            key = (lambda row: name_key(row[1], row[2]))
+        unseen = [row[0] for row in rows.iterator(chunk_size=batch_size)
+                  if key(row) not in seen]
+        for chunk in chunked(unseen, batch_size):
+            # Signals keep the counters and the search index up to date
+            _, deleted = self._manager(model).filter(pk__in=chunk).delete()
+            self.counts.deleted += deleted.get(model._meta.label, 0)
@@ -0,0 +1,165 @@
+"""
+Deterministic synthetic catalog for performance tests.
+
+SyntheticCatalog describes a library by its scale factors and yields the
+records of CatalogLoader lazily, so datasets of any size are generated in
+constant memory and inserted in bulk. Every kind of record is drawn from
+its own random generator seeded from ``seed``, so the same seed and scale
+always produce the same library, and raising the number of books with the
+other factors unchanged only adds rows to an existing one.
+"""
+
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+
+from .loader import DEFAULT_BATCH_SIZE, CatalogLoader, chunked
+from .models import BookInstance
+
+FIRST_NAMES = ['Ana', 'Carlos', 'Elena', 'Javier', 'Lucía', 'Mario',
+               'Nuria', 'Pablo', 'Rosa', 'Tomás']
+LAST_NAMES = ['García', 'López', 'Martín', 'Navarro', 'Ortega', 'Ruiz',
+              'Sanz', 'Torres', 'Vega', 'Zamora']
+GENRE_NAMES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance',
+               'Horror', 'History', 'Poetry', 'Drama', 'Biography',
+               'Adventure']
+LANGUAGE_NAMES = ['English', 'Spanish', 'French', 'German', 'Italian']
+WORDS = ['night', 'river', 'shadow', 'garden', 'empire', 'stone', 'winter',
+         'letter', 'island', 'mirror', 'storm', 'silence', 'city', 'fire',
+         'journey', 'crown', 'forest', 'memory', 'sea', 'glass']
+
+# Share of copies in each loan status
+DEFAULT_STATUS_WEIGHTS = {'m': 0.1, 'o': 0.3, 'a': 0.5, 'r': 0.1}
+
+
+def parse_status_weights(value):
+    """Parses a 'm=0.1,o=0.3,a=0.5,r=0.1' status distribution."""
+    statuses = dict(BookInstance.LOAN_STATUS)
+    weights = {}
+    for item in value.split(','):
+        status, _, weight = item.partition('=')
+        if status.strip() not in statuses:
+            raise ValueError('Unknown loan status: %r' % status)
+        weights[status.strip()] = float(weight)
+    return weights
+
+
+class SyntheticCatalog:
+    """Records of a synthetic library of the given scale."""
+
+    def __init__(self, authors=1000, books=10000, genres=20,
+                 genres_per_book=2, copies_per_book=3, borrowers=100,
+                 status_weights=None, seed=0, today=None):
+        self.num_authors = max(authors, 1)
+        self.num_books = books
+        self.num_genres = max(genres, 1)
+        self.genres_per_book = min(genres_per_book, self.num_genres)
+        self.copies_per_book = copies_per_book
+        self.num_borrowers = borrowers
+        self.status_weights = status_weights or DEFAULT_STATUS_WEIGHTS
+        self.seed = seed
+        self.today = today or date.today()
+
+    def random(self, kind):
+        """Independent generator of the records of one kind."""
+        return random.Random('%s:%s' % (self.seed, kind))
+
+    def borrower_name(self, num):
+        return 'reader%d' % num
+
+    def isbn(self, num):
+        return 'S%012d' % num
+
+    def author_name(self, num):
+        """Unique (first_name, last_name) of author ``num``."""
+        first = FIRST_NAMES[num % len(FIRST_NAMES)]
+        last = LAST_NAMES[num // len(FIRST_NAMES) % len(LAST_NAMES)]
+        return first, '%s %d' % (last, num)
+
+    def genre_name(self, num):
+        name = GENRE_NAMES[num % len(GENRE_NAMES)]
+        if num >= len(GENRE_NAMES):
+            name = '%s %d' % (name, num // len(GENRE_NAMES))
+        return name
+
+    def languages(self):
+        return LANGUAGE_NAMES
+
+    def genres(self):
+        return [self.genre_name(num) for num in range(self.num_genres)]
+
+    def authors(self):
+        rng = self.random('authors')
+        for num in range(self.num_authors):
+            first_name, last_name = self.author_name(num)
+            born = date(1900, 1, 1) + timedelta(days=rng.randrange(36500))
+            yield {
+                'first_name': first_name,
+                'last_name': last_name,
+                'date_of_birth': born,
+                'date_of_death': (born + timedelta(days=rng.randrange(
+                    20000, 36500)) if rng.random() < 0.3 else None),
+            }
+
+    def books(self):
+        rng = self.random('books')
+        for num in range(self.num_books):
+            first_name, last_name = self.author_name(
+                rng.randrange(self.num_authors))
+            yield {
+                'title': ' '.join(rng.choice(WORDS) for _ in range(
+                    rng.randint(1, 4))).capitalize(),
+                'isbn': self.isbn(num),
+                'summary': ' '.join(rng.choice(WORDS) for _ in range(
+                    rng.randint(10, 40))),
+                'author': {'first_name': first_name,
+                           'last_name': last_name},
+                'genre': [self.genre_name(genre) for genre in rng.sample(
+                    range(self.num_genres), self.genres_per_book)],
+                'language': rng.choice(LANGUAGE_NAMES),
+            }
+
+    def copies(self, borrower_ids=None):
+        """Copies of every book; ``borrower_ids`` maps borrower names to
+        user ids (loans have no borrower without it)."""
+        rng = self.random('copies')
+        statuses = list(self.status_weights)
+        weights = list(self.status_weights.values())
+        for num in range(self.num_books):
+            for _ in range(self.copies_per_book):
+                status = rng.choices(statuses, weights)[0]
+                record = {'book': self.isbn(num), 'imprint': '',
+                          'status': status, 'due_back': None}
+                if status == 'o':
+                    record['due_back'] = self.today + timedelta(
+                        days=rng.randrange(-60, 30))
+                    if self.num_borrowers:
+                        borrower = self.borrower_name(
+                            rng.randrange(self.num_borrowers))
+                        record['borrower_id'] = (borrower_ids or {}).get(
+                            borrower)
+                yield record
+
+    def create_borrowers(self, using='default'):
+        """Creates the borrower users; returns {username: id}."""
+        names = [self.borrower_name(num)
+                 for num in range(self.num_borrowers)]
+        manager = User.objects.db_manager(using)
+        ids = {}
+        for chunk in chunked(names, DEFAULT_BATCH_SIZE // 5):
+            # '!' is an unusable password: borrowers cannot log in
+            manager.bulk_create(
+                [User(username=name, password='!') for name in chunk],
+                ignore_conflicts=True)
+            ids.update(manager.filter(username__in=chunk)
+                       .values_list('username', 'id'))
+        return ids
+
+    def generate(self, batch_size=DEFAULT_BATCH_SIZE, using='default'):
+        """Inserts the library; returns the number of rows created."""
+        borrower_ids = self.create_borrowers(using)
+        return CatalogLoader(batch_size, using).load(
+            languages=self.languages(), genres=self.genres(),
+            authors=self.authors(), books=self.books(),
+            copies=self.copies(borrower_ids))
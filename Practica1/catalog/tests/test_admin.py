@@ -0,0 +1,140 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.admin import INLINE_LIMIT
+from catalog.models import Author, Book, BookInstance, CatalogCounter
+from catalog.pagination import EstimatedCountPaginator
+
+
+class AdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin',
+                                                  password='pass')
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.book = Book.objects.create(title='Saga', isbn='0000000000001',
+                                       author=cls.author)
+        cls.copies = BookInstance.objects.bulk_create([
+            BookInstance(book=cls.book, imprint='I %d' % n, status='o',
+                         borrower=cls.admin,
+                         due_back=datetime.date(2030, 1, 1) +
+                         datetime.timedelta(days=n))
+            for n in range(INLINE_LIMIT + 5)
+        ])
+
+    def setUp(self):
+        self.client.login(username='admin', password='pass')
+
+    def test_inline_is_limited(self):
+        response = self.client.get(
+            reverse('admin:catalog_book_change', args=[self.book.pk]))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), INLINE_LIMIT)
+        self.assertContains(response, '%s?book__id__exact=%s' % (
+            reverse('admin:catalog_bookinstance_changelist'), self.book.pk))
+        self.assertContains(response, '%d book instances' % (
+            INLINE_LIMIT + 5))
+
+    def test_foreign_keys_are_not_listed(self):
+        Book.objects.create(title='Other', isbn='0000000000002')
+        response = self.client.get(
+            reverse('admin:catalog_bookinstance_change',
+                    args=[self.copies[0].pk]))
+        # Only the current book is rendered; others come from the
+        # autocomplete view
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, 'Saga')
+        self.assertNotContains(response, 'Other')
+        response = self.client.get(
+            reverse('admin:autocomplete'),
+            {'term': 'sa', 'app_label': 'catalog', 'model_name':
+             'bookinstance', 'field_name': 'book'})
+        self.assertEqual([result['text'] for result in
+                          response.json()['results']], ['Saga'])
+
+    def test_search_by_prefix(self):
+        url = reverse('admin:catalog_author_changelist')
+        self.assertContains(self.client.get(url, {'q': 'ma'}), 'Mar')
+        self.assertNotContains(self.client.get(url, {'q': 'ar'}),
+                               'catalog/author/%d/' % self.author.pk)
+        url = reverse('admin:catalog_book_changelist')
+        for term in ('SAG', '0000000000001', '"saga"'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list),
+                             [self.book])
+        # Matched on the indexed LOWER(title), not UPPER(title)
+        self.assertFalse(any('UPPER("catalog_book"."title"' in query['sql']
+                             for query in queries))
+
+    def test_changelist_is_not_counted(self):
+        url = reverse('admin:catalog_bookinstance_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+        self.assertContains(response, '%d book instances' % (
+            INLINE_LIMIT + 5))
+        self.assertContains(response, 'On loan (%d)' % (INLINE_LIMIT + 5))
+        self.assertContains(response, 'Available (0)')
+        # Filtered lists are counted (or estimated on PostgreSQL)
+        response = self.client.get(url, {'status__exact': 'a'})
+        self.assertContains(response, '0 book instances')
+        self.assertContains(response, 'On loan (%d)' % (INLINE_LIMIT + 5))
+        # The catalog totals are not the counts of a narrowed list
+        response = self.client.get(url, {'due_back__isnull': 'True'})
+        self.assertContains(response, '0 book instances')
+        self.assertContains(response, 'On loan')
+        self.assertNotContains(response, 'On loan (')
+
+    def test_planner_estimate_above_threshold(self):
+        queryset = BookInstance.objects.filter(status='o')
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch('catalog.pagination.planner_estimate',
+                           side_effect=[50000, 100]):
+            self.assertEqual(
+                EstimatedCountPaginator(queryset, 10).count, 50000)
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count,
+                             INLINE_LIMIT + 5)
+
+    def act(self, action, **data):
+        url = reverse('admin:catalog_bookinstance_changelist')
+        data.setdefault('_selected_action',
+                        [copy.pk for copy in self.copies[:3]])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, dict(data, action=action),
+                                        follow=True)
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE "catalog_bookinstance"')]
+        self.assertEqual(len(updates), 1)
+        return [str(message) for message in response.context['messages']]
+
+    def test_mark_returned(self):
+        messages = self.act('mark_returned', select_across=1)
+        self.assertEqual(messages, ['%d copies marked as returned.' % (
+            INLINE_LIMIT + 5)])
+        self.assertFalse(BookInstance.objects.exclude(
+            status='a', borrower=None, due_back=None).exists())
+        self.assertEqual(CatalogCounter.objects.snapshot()['instances_a'],
+                         INLINE_LIMIT + 5)
+
+    def test_extend_and_set_status(self):
+        self.act('extend_due_back', days=7)
+        self.assertEqual(
+            BookInstance.objects.get(pk=self.copies[2].pk).due_back,
+            datetime.date(2030, 1, 10))
+        self.assertEqual(
+            BookInstance.objects.get(pk=self.copies[3].pk).due_back,
+            datetime.date(2030, 1, 4))
+        self.assertEqual(self.act('set_status', status='m'),
+                         ['3 copies updated.'])
+        self.assertEqual(BookInstance.objects.filter(status='m').count(), 3)
+        self.assertEqual(CatalogCounter.objects.snapshot()['instances_o'],
+                         INLINE_LIMIT + 2)
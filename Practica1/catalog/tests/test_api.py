@@ -0,0 +1,132 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class ApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        language = Language.objects.create(name='Spanish')
+        drama = Genre.objects.create(name='Drama')
+        for num in range(5):
+            book = Book.objects.create(
+                title='Libro %d' % num, isbn='%013d' % num,
+                summary='Summary %d' % num, author=cls.author,
+                language=language)
+            book.genre.add(drama)
+            for status in 'oa'[:num % 3]:
+                BookInstance.objects.create(book=book, imprint='I',
+                                            status=status)
+        cls.book = Book.objects.get(isbn='0000000000002')
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_default_fields(self):
+        data = self.get('api-list', 'books', limit=2).json()
+        self.assertEqual(data['results'][0], {
+            'id': Book.objects.get(isbn='0000000000000').id,
+            'title': 'Libro 0', 'isbn': '0000000000000',
+            'author': {'id': self.author.id, 'first_name': 'Ana',
+                       'last_name': 'Mar'},
+            'url': reverse('book-detail', args=[
+                Book.objects.get(isbn='0000000000000').id]),
+        })
+        self.assertIsNone(data['previous'])
+        titles = []
+        url = reverse('api-list', args=['books']) + '?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            titles += [book['title'] for book in data['results']]
+            url = data['next']
+        self.assertEqual(titles, ['Libro %d' % n for n in range(5)])
+
+    def test_projection(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get('api-list', 'books', fields='title').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+        self.assertNotIn('summary', queries[0]['sql'])
+        self.assertNotIn('catalog_author', queries[0]['sql'])
+        data = self.get('api-detail', 'books', self.book.pk,
+                        fields='summary,genres,availability,language').json()
+        self.assertEqual(data, {
+            'id': self.book.pk, 'summary': 'Summary 2', 'genres': ['Drama'],
+            'availability': {'total': 2, 'available': 1},
+            'language': 'Spanish'})
+        response = self.get('api-list', 'books', fields='title,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_embedded_data_in_fixed_queries(self):
+        fields = 'title,author,language,genres,availability'
+        with self.assertNumQueries(3):
+            self.get('api-list', 'books', fields=fields, limit=2)
+        with self.assertNumQueries(3):
+            self.get('api-list', 'books', fields=fields, limit=5)
+        with self.assertNumQueries(2):
+            self.get('api-list', 'authors', fields='books')
+        with self.assertNumQueries(1):
+            self.get('api-list', 'copies', fields='book,status')
+
+    def test_etag(self):
+        response = self.get('api-detail', 'authors', self.author.pk)
+        self.assertEqual(response.json()['last_name'], 'Mar')
+        etag = response['ETag']
+        response = self.client.get(
+            reverse('api-detail', args=['authors', self.author.pk]),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Author.objects.filter(pk=self.author.pk).update(last_name='Sol')
+        response = self.client.get(
+            reverse('api-detail', args=['authors', self.author.pk]),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_found(self):
+        self.assertEqual(self.get('api-detail', 'copies', 'xyz').status_code,
+                         404)
+        self.assertEqual(self.get('api-detail', 'books', 0).status_code, 404)
+        self.assertEqual(self.get('api-list', 'users').status_code, 404)
+        self.assertEqual(self.get('api-list', 'books', cursor='x')
+                         .status_code, 400)
+        copy = BookInstance.objects.first()
+        data = self.get('api-detail', 'copies', copy.pk).json()
+        self.assertEqual(data['book']['isbn'], copy.book.isbn)
+
+
+class BatchLookupTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Libro', isbn='1234567890123')
+        cls.copies = [
+            BookInstance.objects.create(book=book, imprint='I', status=status,
+                                        due_back='2030-01-01')
+            for status in 'oaa'
+        ]
+
+    def test_lookup(self):
+        url = reverse('api-lookup')
+        with self.assertNumQueries(2):
+            data = self.client.get(url, {
+                'isbn': ['1234567890123,0000000000000'],
+                'copy': [str(self.copies[0].pk), 'not-a-uuid'],
+            }).json()
+        self.assertEqual(data['books']['1234567890123']['availability'],
+                         {'total': 3, 'available': 2})
+        self.assertIsNone(data['books']['0000000000000'])
+        copy = data['copies'][str(self.copies[0].pk)]
+        self.assertEqual((copy['status'], copy['due_back']),
+                         ('o', '2030-01-01'))
+        self.assertEqual(copy['book']['isbn'], '1234567890123')
+        self.assertIsNone(data['copies']['not-a-uuid'])
+
+    def test_lookup_limit(self):
+        isbns = ','.join('%013d' % n for n in range(101))
+        response = self.client.get(reverse('api-lookup'), {'isbn': isbns})
+        self.assertEqual(response.status_code, 400)
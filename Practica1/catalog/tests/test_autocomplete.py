@@ -0,0 +1,83 @@
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.autocomplete import AUTOCOMPLETE_LIMIT
+from catalog.models import Author, Book, Genre, Language
+
+
+class AutocompleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Author.objects.bulk_create([
+            Author(first_name='Ana %02d' % n, last_name='Mar')
+            for n in range(AUTOCOMPLETE_LIMIT + 5)
+        ])
+        cls.author = Author.objects.create(first_name='Luis',
+                                           last_name='Sol')
+        Genre.objects.create(name='Science fiction')
+        Genre.objects.create(name='Poetry')
+        Language.objects.create(name='Spanish')
+
+    def setUp(self):
+        cache.clear()
+
+    def options(self, source, prefix):
+        response = self.client.get(
+            reverse('catalog-autocomplete', args=[source]), {'q': prefix})
+        return [result['text'] for result in response.json()['results']]
+
+    def test_prefix_search(self):
+        authors = self.options('author', 'ma')
+        self.assertEqual(len(authors), AUTOCOMPLETE_LIMIT)
+        self.assertEqual(authors[0], 'Mar, Ana 00')
+        self.assertEqual(self.options('author', 'sol lu'), ['Sol, Luis'])
+        self.assertEqual(self.options('author', 'ar'), [])
+        self.assertEqual(self.options('genre', 'SCIENCE F'),
+                         ['Science fiction'])
+        self.assertEqual(self.options('language', 's'), ['Spanish'])
+        response = self.client.get(
+            reverse('catalog-autocomplete', args=['user']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_results_are_cached_until_a_change(self):
+        self.assertEqual(self.options('genre', 'p'), ['Poetry'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.options('genre', ' P '), ['Poetry'])
+        Genre.objects.create(name='Prose')
+        self.assertEqual(self.options('genre', 'p'), ['Poetry', 'Prose'])
+
+    def test_book_form_lists_selected_options_only(self):
+        user = User.objects.create_user(username='librarian',
+                                        password='pass')
+        user.user_permissions.add(
+            Permission.objects.get(codename='change_book'))
+        self.client.login(username='librarian', password='pass')
+        book = Book.objects.create(title='Saga', isbn='0000000000001',
+                                   author=self.author)
+        book.genre.add(Genre.objects.get(name='Poetry'))
+        response = self.client.get(reverse('book-update', args=[book.pk]))
+        self.assertContains(response, 'Sol, Luis')
+        self.assertNotContains(response, 'Mar, Ana')
+        self.assertNotContains(response, 'Science fiction')
+        self.assertContains(response, '/static/js/autocomplete.')
+        self.assertContains(response, reverse('catalog-autocomplete',
+                                              args=['language']))
+        response = self.client.post(
+            reverse('book-update', args=[book.pk]), {
+                'title': 'Saga', 'isbn': '0000000000001',
+                'summary': 'Sea', 'author': self.author.pk,
+                'language': Language.objects.get().pk,
+                'genre': [genre.pk for genre in Genre.objects.all()]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(book.genre.count(), 2)
+        response = self.client.post(
+            reverse('book-update', args=[book.pk]), {
+                'title': 'Saga', 'isbn': '0000000000001', 'summary': 'Sea',
+                'author': 'abc', 'language': '', 'genre': ['zz', '1.5']})
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context['form'], 'author',
+                             'Select a valid choice. That choice is not one '
+                             'of the available choices.')
@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance, CatalogCounter, Genre
+
+
+class CatalogCounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Libro', isbn='1234567890123')
+        Author.objects.create(first_name='Ana', last_name='Mar')
+        Genre.objects.create(name='Drama')
+
+    def assertCounters(self, **expected):
+        counters = CatalogCounter.objects.snapshot()
+        for name, value in expected.items():
+            self.assertEqual(counters.get(name), value, name)
+
+    def test_save_and_delete(self):
+        copy = BookInstance.objects.create(book=self.book, status='a')
+        self.assertCounters(books=1, authors=1, genres=1, instances=1,
+                            instances_a=1, instances_m=0)
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(instances=1, instances_a=0, instances_o=1)
+        copy.delete()
+        self.assertCounters(instances=0, instances_o=0)
+
+    def test_status_change_of_fetched_copy(self):
+        BookInstance.objects.create(book=self.book, status='a')
+        copy = BookInstance.objects.get()
+        copy.status = 'r'
+        copy.save()
+        self.assertCounters(instances_a=0, instances_r=1)
+
+    def test_bulk_create(self):
+        BookInstance.objects.bulk_create(
+            [BookInstance(book=self.book, status='a') for _ in range(5)]
+            + [BookInstance(book=self.book, status='m') for _ in range(3)])
+        self.assertCounters(instances=8, instances_a=5, instances_m=3)
+
+    def test_bulk_update_and_delete(self):
+        BookInstance.objects.bulk_create(
+            [BookInstance(book=self.book, status='a') for _ in range(5)])
+        BookInstance.objects.filter(status='a').update(status='o')
+        self.assertCounters(instances=5, instances_a=0, instances_o=5)
+        BookInstance.objects.all().delete()
+        self.assertCounters(instances=0, instances_o=0)
+
+    def test_check_and_rebuild_command(self):
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+        CatalogCounter.objects.filter(name='books').update(value=42)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_counters', stdout=out)
+        self.assertIn('books: stored 42, actual 1', out.getvalue())
+        self.assertCounters(books=1)
@@ -0,0 +1,207 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+
+from catalog import caching
+from catalog.caching import LOCK_TIMEOUT, cache_fill, detail_cache_metrics
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class DetailCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.language = Language.objects.create(name='Spanish')
+        cls.genre = Genre.objects.create(name='Drama')
+        cls.book = Book.objects.create(
+            title='Saga', isbn='0000000000001', summary='Sea',
+            author=cls.author, language=cls.language)
+        cls.book.genre.add(cls.genre)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='I',
+                                               status='a')
+
+    def setUp(self):
+        cache.clear()
+        caching._metrics.clear()
+
+    def get(self, obj):
+        response = self.client.get(obj.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertFresh(self, obj, text):
+        response = self.get(obj)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, text)
+
+    def test_hits_do_not_query(self):
+        first = self.get(self.book)
+        with self.assertNumQueries(0):
+            second = self.get(self.book)
+        self.assertEqual((first['X-Cache'], second['X-Cache']),
+                         ('MISS', 'HIT'))
+        self.assertEqual(first.content, second.content)
+        self.assertContains(second, 'Drama')
+        self.get(self.author)
+        self.get(self.author)
+        self.assertEqual(detail_cache_metrics(), {
+            'book': {'hits': 1, 'misses': 1},
+            'author': {'hits': 1, 'misses': 1}})
+
+    def test_book_changes(self):
+        self.get(self.book)
+        self.copy.status = 'o'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.save()
+        self.assertFresh(self.book, 'On loan')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(pk=self.copy.pk).update(status='m')
+        self.assertFresh(self.book, 'Maintenance')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.genre.add(Genre.objects.create(name='Poetry'))
+        self.assertFresh(self.book, 'Poetry')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.genre.save()
+        self.assertEqual(self.get(self.book)['X-Cache'], 'MISS')
+        self.language.name = 'Castilian'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.language.save()
+        self.assertFresh(self.book, 'Castilian')
+        self.author.last_name = 'Sol'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        self.assertFresh(self.book, 'Sol, Ana')
+
+    def test_author_changes(self):
+        other = Author.objects.create(first_name='Luis', last_name='Sol')
+        self.get(self.author)
+        self.get(other)
+        book = Book.objects.get(pk=self.book.pk)
+        book.author = other
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertNotContains(self.get(self.author), 'Saga')
+        self.assertFresh(other, 'Saga')
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(pk=book.pk).update(title='Sunrise')
+        self.assertFresh(other, 'Sunrise')
+
+    def test_queryset_updates(self):
+        other = Author.objects.create(first_name='Luis', last_name='Sol')
+        self.get(self.author)
+        self.get(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(pk=self.book.pk).update(author=other)
+        self.assertNotContains(self.get(self.author), 'Saga')
+        self.assertFresh(other, 'Saga')
+        self.get(self.book)
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.filter(pk=self.genre.pk).update(name='Tragedy')
+        self.assertFresh(self.book, 'Tragedy')
+        with self.captureOnCommitCallbacks(execute=True):
+            Language.objects.filter(pk=self.language.pk).update(
+                name='Catalan')
+        self.assertFresh(self.book, 'Catalan')
+        copy = BookInstance.objects.create(book=None, imprint='J')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(pk=copy.pk).update(book=self.book)
+        self.assertFresh(self.book, 'J')
+
+    def test_changes_drop_pages_on_commit(self):
+        self.get(self.book)
+        self.get(self.author)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                Book.objects.filter(pk=self.book.pk).update(title='Sunrise')
+                self.author.last_name = 'Sol'
+                self.author.save()
+            # Until the commit, readers keep the committed pages
+            self.assertEqual(self.get(self.book)['X-Cache'], 'HIT')
+            self.assertEqual(self.get(self.author)['X-Cache'], 'HIT')
+        self.assertTrue(callbacks)
+        self.assertFresh(self.book, 'Sunrise')
+        self.assertFresh(self.author, 'Sol')
+
+    def test_many_changes_drop_every_page(self):
+        self.get(self.book)
+        self.get(self.author)
+        with mock.patch('catalog.caching.INVALIDATE_ALL_OVER', 0), \
+                self.captureOnCommitCallbacks(execute=True):
+            Author.objects.filter(pk=self.author.pk).update(first_name='Eva')
+        self.assertFresh(self.author, 'Eva')
+        self.assertFresh(self.book, 'Mar, Eva')
+
+    def test_permission_variants(self):
+        user = User.objects.create_user(username='librarian',
+                                        password='pass')
+        user.user_permissions.add(
+            Permission.objects.get(codename='change_book'))
+        self.assertNotContains(self.get(self.book), 'Update book')
+        self.client.login(username='librarian', password='pass')
+        response = self.get(self.book)
+        # The content is shared, only the sidebar depends on permissions
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertContains(response, 'Update book')
+        self.assertNotContains(response, 'Delete book')
+        self.client.logout()
+        self.assertNotContains(self.get(self.book), 'Update book')
+
+
+class CacheFillTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def fail(self):
+        raise AssertionError('Recomputed')
+
+    def test_fills_once(self):
+        self.assertEqual(cache_fill('key', lambda: 1, 60), 1)
+        self.assertEqual(cache_fill('key', self.fail, 60), 1)
+
+    def test_keeps_a_lock_taken_after_expiry(self):
+        def slow_fill():
+            # The lock expired during the fill and another worker took it
+            cache.set('key:lock', 'other')
+            return 1
+
+        self.assertEqual(cache_fill('key', slow_fill, 60), 1)
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+    def test_lock_expires(self):
+        with mock.patch('catalog.caching.cache.add',
+                        wraps=cache.add) as add:
+            cache_fill('key', lambda: 1, 60)
+        add.assert_called_once_with('key:lock', 1, LOCK_TIMEOUT)
+        self.assertEqual(cache.get('key:lock'), 1)
+
+    def test_stale_value_served_while_locked(self):
+        cache.set('key', ('old', time.time() - 1, 0.1))
+        cache.add('key:lock', 1)
+        self.assertEqual(cache_fill('key', self.fail, 60), 'old')
+        cache.delete('key:lock')
+        self.assertEqual(cache_fill('key', lambda: 'new', 60), 'new')
+
+    def test_early_refresh(self):
+        cache.set('key', ('old', time.time() + 5, 1.0))
+        with mock.patch('catalog.caching.random.random', return_value=0.5):
+            self.assertEqual(cache_fill('key', self.fail, 60), 'old')
+        # -ln(1 - 0.999) * 1s is over the 5s left
+        with mock.patch('catalog.caching.random.random', return_value=0.999):
+            self.assertEqual(cache_fill('key', lambda: 'new', 60), 'new')
+
+    def test_waits_for_missing_value(self):
+        cache.add('key:lock', 1)
+
+        def other_worker_fills(seconds):
+            cache.set('key', ('filled', time.time() + 60, 0.1))
+
+        with mock.patch('catalog.caching.time.sleep',
+                        side_effect=other_worker_fills) as sleep:
+            self.assertEqual(cache_fill('key', self.fail, 60), 'filled')
+        self.assertEqual(sleep.call_count, 1)
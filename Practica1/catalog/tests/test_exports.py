@@ -0,0 +1,89 @@
+import csv
+import datetime
+import io
+import json
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.importer import CatalogImporter
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(
+            username='librarian', password='pass')
+        cls.librarian.user_permissions.add(
+            Permission.objects.get(codename='can_mark_returned'))
+        author = Author.objects.create(first_name='Ana', last_name='Mar')
+        language = Language.objects.create(name='Spanish')
+        drama = Genre.objects.create(name='Drama')
+        poetry = Genre.objects.create(name='Poetry')
+        for num in range(5):
+            book = Book.objects.create(
+                title='Libro %d' % num, isbn='%013d' % num, summary='S',
+                author=author if num else None, language=language)
+            book.genre.set([drama, poetry] if num % 2 else [drama])
+            BookInstance.objects.create(
+                book=book, imprint='I', status='oa'[num % 2],
+                borrower=cls.librarian if num % 2 == 0 else None,
+                due_back=datetime.date(2030, 1, 1 + num))
+
+    def export(self, kind, format):
+        self.client.login(username='librarian', password='pass')
+        response = self.client.get(reverse('catalog-export',
+                                           args=[kind, format]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_requires_permission(self):
+        url = reverse('catalog-export', args=['books', 'csv'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user(username='reader', password='pass')
+        self.client.login(username='reader', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.login(username='librarian', password='pass')
+        self.assertEqual(self.client.get(reverse(
+            'catalog-export', args=['users', 'csv'])).status_code, 404)
+
+    def test_books_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('books', 'csv'))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], {
+            'title': 'Libro 1', 'isbn': '0000000000001', 'summary': 'S',
+            'author_first_name': 'Ana', 'author_last_name': 'Mar',
+            'language': 'Spanish', 'genre': 'Drama;Poetry'})
+        self.assertEqual(rows[0]['author_last_name'], '')
+
+    def test_loans_jsonl(self):
+        lines = self.export('loans', 'jsonl').splitlines()
+        loans = [json.loads(line) for line in lines]
+        self.assertEqual([loan['book'] for loan in loans],
+                         ['0000000000000', '0000000000002', '0000000000004'])
+        self.assertEqual(loans[0]['borrower'], 'librarian')
+        self.assertEqual(loans[0]['due_back'], '2030-01-01')
+
+    def test_round_trip(self):
+        data = self.export('copies', 'jsonl')
+        BookInstance.objects.all().delete()
+        report = CatalogImporter('copies').import_file(io.StringIO(data),
+                                                       'jsonl')
+        self.assertEqual((report.imported, report.rejected), (5, 0))
+        self.assertEqual(BookInstance.objects.on_loan().filter(
+            borrower=self.librarian).count(), 3)
+
+    def test_reads_in_chunks(self):
+        # One cursor over the books, plus the genres of every chunk
+        with mock.patch('catalog.exports.EXPORT_CHUNK_SIZE', 2):
+            self.client.login(username='librarian', password='pass')
+            response = self.client.get(reverse('catalog-export',
+                                               args=['books', 'jsonl']))
+            with self.assertNumQueries(4):
+                lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import uuid
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.importer import CatalogImporter
+from catalog.models import Author, Book, BookInstance, CatalogCounter, Genre
+
+AUTHORS_CSV = """first_name,last_name,date_of_birth,date_of_death
+Ana,Mar,1950-02-03,
+Luis,Sol,,
+Luis,Sol,,
+,Nameless,,
+Eva,Río,not a date,
+"""
+
+BOOKS_CSV = """title,isbn,summary,author_first_name,author_last_name,\
+language,genre
+Saga,0000000000001,Sea,Ana,Mar,Spanish,Drama;poetry
+Saga 2,0000000000002,Sun,Luis,Sol,,Drama
+Short,123,Too short,Ana,Mar,,
+Anon,0000000000003,,,,English,
+"""
+
+
+def copy_lines(book, num, status='a'):
+    for _ in range(num):
+        yield json.dumps({'id': str(uuid.uuid4()), 'book': book,
+                          'status': status, 'imprint': 'Imprint'})
+
+
+class CatalogImporterTest(TestCase):
+
+    def import_csv(self, kind, text, **kwargs):
+        rejected = []
+        importer = CatalogImporter(
+            kind, on_reject=lambda *row: rejected.append(row), **kwargs)
+        return importer.import_file(StringIO(text), 'csv'), rejected
+
+    def test_csv(self):
+        report, rejected = self.import_csv('authors', AUTHORS_CSV)
+        self.assertEqual((report.rows, report.imported, report.rejected),
+                         (5, 2, 2))
+        self.assertEqual([number for number, _ in rejected], [4, 5])
+        report, rejected = self.import_csv('books', BOOKS_CSV, batch_size=2)
+        self.assertEqual((report.imported, report.rejected), (3, 1))
+        self.assertIn('exactly 13 characters', rejected[0][1])
+        book = Book.objects.get(isbn='0000000000001')
+        self.assertEqual(book.author.last_name, 'Mar')
+        self.assertEqual(book.language.name, 'Spanish')
+        self.assertEqual(sorted(book.genre.values_list('name', flat=True)),
+                         ['Drama', 'poetry'])
+        self.assertIsNone(Book.objects.get(isbn='0000000000003').author)
+        self.assertEqual(Genre.objects.count(), 2)
+
+    def test_jsonl_copies(self):
+        self.import_csv('books', BOOKS_CSV)
+        User.objects.create_user('reader', password='x')
+        lines = list(copy_lines('0000000000001', 3))
+        lines.append(json.dumps({'id': str(uuid.uuid4()),
+                                 'book': '0000000000002', 'status': 'o',
+                                 'due_back': '2030-01-01',
+                                 'borrower': 'reader'}))
+        lines += ['not json', json.dumps({'id': 'x', 'book': 'y'}),
+                  json.dumps({'id': str(uuid.uuid4()), 'status': 'z',
+                              'book': '0000000000001'})]
+        report = CatalogImporter('copies', batch_size=2).import_file(
+            StringIO('\n'.join(lines)), 'jsonl')
+        self.assertEqual((report.imported, report.rejected), (4, 3))
+        loan = BookInstance.objects.on_loan().get()
+        self.assertEqual(loan.borrower.username, 'reader')
+        self.assertEqual(loan.book.isbn, '0000000000002')
+
+    def test_jsonl_genres(self):
+        lines = [json.dumps(dict(book, isbn='%013d' % num))
+                 for num, book in enumerate([
+                     {'title': 'Saga', 'genre': ['Drama', ' Poetry ']},
+                     {'title': 'Number', 'genre': 5},
+                     {'title': 'Numbers', 'genre': [1]},
+                     {'title': 'Object', 'genre': {'name': 'Drama'}}])]
+        rejected = []
+        report = CatalogImporter(
+            'books', on_reject=lambda *row: rejected.append(row)
+        ).import_file(StringIO('\n'.join(lines)), 'jsonl')
+        self.assertEqual((report.imported, report.rejected), (1, 3))
+        self.assertIn('genre must be a text or a list of texts',
+                      rejected[0][1])
+        self.assertEqual(sorted(Genre.objects.values_list('name', flat=True)),
+                         ['Drama', 'Poetry'])
+
+    def test_reimport_skips_existing_rows(self):
+        self.import_csv('authors', AUTHORS_CSV)
+        self.import_csv('books', BOOKS_CSV)
+        lines = '\n'.join(copy_lines('0000000000001', 5))
+        CatalogImporter('copies').import_file(StringIO(lines), 'jsonl')
+        self.assertEqual(self.import_csv('authors', AUTHORS_CSV)[0].imported,
+                         0)
+        self.assertEqual(self.import_csv('books', BOOKS_CSV)[0].imported, 0)
+        report = CatalogImporter('copies').import_file(StringIO(lines),
+                                                       'jsonl')
+        self.assertEqual(report.imported, 0)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(BookInstance.objects.count(), 5)
+        stored = CatalogCounter.objects.snapshot()
+        for name, value in CatalogCounter.objects.actual().items():
+            self.assertEqual(stored.get(name, 0), value, name)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.csv')
+            rejects = os.path.join(directory, 'rejects.txt')
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write(BOOKS_CSV)
+            out = StringIO()
+            call_command('import_catalog', 'books', path,
+                         '--rejects', rejects, stdout=out)
+            with open(rejects, encoding='utf-8') as stream:
+                self.assertIn('row 3:', stream.read())
+        self.assertIn('4 rows read, 3 imported, 1 rejected', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
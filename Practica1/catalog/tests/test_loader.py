@@ -0,0 +1,83 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.loader import CatalogLoader
+from catalog.models import Author, Book, BookInstance, CatalogCounter, Genre
+from catalog.search import SearchResults
+
+
+def books(num, start=0):
+    for n in range(start, start + num):
+        yield {
+            'title': 'Saga %s' % n,
+            'isbn': '%013d' % n,
+            'summary': 'Summary',
+            'author': {'first_name': 'Ana', 'last_name': 'Mar %s' % (n % 3)},
+            'genre': ['drama', 'Poesía'] if n % 2 else 'Drama',
+            'language': 'Spanish',
+        }
+
+
+def copies(num):
+    for n in range(num):
+        yield {'book': '%013d' % (n % 10), 'imprint': 'Imprint',
+               'due_back': '' if n % 2 else '2030-01-01',
+               'status': 'oa'[n % 2]}
+
+
+def load(loader):
+    return loader.load(
+        languages=['Spanish'], genres=['Drama', 'Poesía'],
+        authors=({'first_name': 'Ana', 'last_name': 'Mar %s' % n,
+                  'date_of_birth': '', 'date_of_death': ''}
+                 for n in range(3)),
+        books=books(10), copies=copies(25))
+
+
+class CatalogLoaderTest(TestCase):
+
+    def test_load(self):
+        created = load(CatalogLoader(batch_size=4))
+        self.assertEqual(created, {'languages': 1, 'genres': 2, 'authors': 3,
+                                   'books': 10, 'copies': 25})
+        book = Book.objects.get(isbn='0000000000001')
+        self.assertEqual(str(book.author), 'Mar 1, Ana')
+        self.assertEqual(book.language.name, 'Spanish')
+        self.assertEqual(sorted(str(genre) for genre in book.genre.all()),
+                         ['Drama', 'Poesía'])
+        self.assertEqual(Book.objects.get(isbn='0000000000000')
+                         .genre.get().name, 'Drama')
+        self.assertEqual(BookInstance.objects.filter(
+            book__isbn='0000000000003').count(), 3)
+        self.assertEqual(BookInstance.objects.on_loan().count(), 13)
+
+    def test_idempotent(self):
+        load(CatalogLoader(batch_size=4))
+        created = load(CatalogLoader(batch_size=7))
+        self.assertEqual(set(created.values()), {0})
+        self.assertEqual(Author.objects.count(), 3)
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(BookInstance.objects.count(), 25)
+
+    def test_round_trips_per_chunk(self):
+        loader = CatalogLoader(batch_size=1000)
+        loader.load(languages=['Spanish'], genres=['Drama', 'Poesía'],
+                    authors=[{'first_name': 'Ana', 'last_name': 'Mar %s' % n}
+                             for n in range(3)])
+        # A chunk costs the same number of statements whatever its size
+        # (below the 999 parameters of a SQLite statement)
+        with CaptureQueriesContext(connection) as small:
+            loader.load_books(books(50))
+        with CaptureQueriesContext(connection) as large:
+            loader.load_books(books(100, start=50))
+        self.assertEqual(len(small), len(large))
+        self.assertLess(len(large), 15)
+
+    def test_counters_and_search_index(self):
+        load(CatalogLoader(batch_size=4))
+        counters = CatalogCounter.objects.snapshot()
+        self.assertEqual(counters['books'], 10)
+        self.assertEqual(counters['instances'], 25)
+        self.assertEqual(counters['instances_o'], 13)
+        self.assertEqual(SearchResults('saga').count(), 10)
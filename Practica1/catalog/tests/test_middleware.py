@@ -0,0 +1,44 @@
+import json
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import views
+from catalog.middleware import QueryBudgetExceeded
+from catalog.models import Book
+
+
+class QueryInstrumentationMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.create(title='Libro', isbn='1234567890123')
+
+    def test_server_timing_header(self):
+        resp = self.client.get(reverse('books'))
+        self.assertRegex(resp['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicated"$')
+
+    def test_log_line(self):
+        with self.assertLogs('catalog.queries', 'INFO') as logs:
+            self.client.get(reverse('books'))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], reverse('books'))
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertIn('slowest_sql', line)
+        self.assertIn('duplicates', line)
+
+    def test_budget_fails_in_tests(self):
+        with patch.object(views.BookListView, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('books'))
+
+    @override_settings(CATALOG_QUERY_BUDGET_STRICT=False)
+    def test_budget_warns_in_production(self):
+        with patch.object(views.BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.queries', 'WARNING') as logs:
+                resp = self.client.get(reverse('books'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('over its budget of 1', logs.output[0])
@@ -0,0 +1,70 @@
+import datetime
+
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Book, BookInstance
+
+
+class OverdueLoansTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.ana = User.objects.create_user(username='ana', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+        cls.librarian = User.objects.create_user(
+            username='librarian', password='pass')
+        cls.librarian.user_permissions.add(
+            Permission.objects.get(codename='can_mark_returned'))
+        book = Book.objects.create(title='Libro', isbn='1234567890123')
+        for days, borrower, status in [(10, cls.ana, 'o'), (3, cls.ana, 'o'),
+                                       (1, cls.bob, 'o'), (0, cls.bob, 'o'),
+                                       (-5, cls.bob, 'o'), (20, None, 'a')]:
+            BookInstance.objects.create(
+                book=book, borrower=borrower, status=status,
+                due_back=cls.today - datetime.timedelta(days=days))
+
+    def test_overdue(self):
+        self.assertEqual(BookInstance.objects.overdue().count(), 3)
+        self.assertEqual(
+            BookInstance.objects.overdue(min_days=3).count(), 2)
+
+    def test_days_overdue_annotation(self):
+        copies = (BookInstance.objects.on_loan().with_days_overdue()
+                  .order_by('due_back'))
+        self.assertEqual([copy.days_overdue.days for copy in copies],
+                         [10, 3, 1, 0, -5])
+        self.assertEqual([copy.is_overdue_db for copy in copies],
+                         [copy.is_overdue for copy in copies])
+
+    def test_overdue_by_borrower(self):
+        rows = list(BookInstance.objects.overdue_by_borrower())
+        self.assertEqual(
+            [(row['borrower__username'], row['num_overdue']) for row in rows],
+            [('ana', 2), ('bob', 1)])
+        self.assertEqual(rows[0]['oldest_due'],
+                         self.today - datetime.timedelta(days=10))
+
+    def test_report_requires_permission(self):
+        self.client.login(username='ana', password='pass')
+        resp = self.client.get(reverse('overdue-loans'))
+        self.assertEqual(resp.status_code, 403)
+
+    def test_report(self):
+        self.client.login(username='librarian', password='pass')
+        resp = self.client.get(reverse('overdue-loans'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [copy.days_overdue.days for copy in resp.context['object_list']],
+            [10, 3, 1])
+        resp = self.client.get(reverse('overdue-loans'),
+                               {'sort': 'least', 'min_days': 2})
+        self.assertEqual(
+            [copy.days_overdue.days for copy in resp.context['object_list']],
+            [3, 10])
+        resp = self.client.get(reverse('overdue-loans'),
+                               {'borrower': self.bob.pk})
+        self.assertEqual(len(resp.context['object_list']), 1)
+        self.assertContains(resp, '10 days overdue', count=0)
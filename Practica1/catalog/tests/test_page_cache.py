@@ -0,0 +1,209 @@
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.views import generic
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.views import PageCacheMixin
+
+
+@override_settings(CATALOG_PAGE_CACHE=True, CATALOG_PAGE_MAX_AGE=0)
+class PageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.language = Language.objects.create(name='Spanish')
+        cls.book = Book.objects.create(
+            title='Saga', isbn='0000000000001', summary='Sea',
+            author=cls.author, language=cls.language)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='I',
+                                               status='a')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages(self):
+        url = self.book.get_absolute_url()
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(first['Cache-Control'], 'public, max-age=0')
+        self.assertEqual(first['Vary'], 'Cookie')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Last-Modified'], first['Last-Modified'])
+
+    def test_conditional_get(self):
+        for url in (self.book.get_absolute_url(), reverse('books'),
+                    self.author.get_absolute_url(), reverse('authors')):
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.assertEqual(self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                .status_code, 304)
+
+    def test_changes_update_validators(self):
+        url = self.book.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.copy.status = 'o'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'On loan')
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.genre.add(Genre.objects.create(name='Poetry'))
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag),
+                            'Poetry')
+        other = Book.objects.create(title='Other', isbn='0000000000002',
+                                    summary='S')
+        list_etag = self.client.get(reverse('books'))['ETag']
+        # A deletion does not move the latest modification time
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.client.get(
+            reverse('books'), HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_list_validators_follow_moved_rows(self):
+        other = Book.objects.create(title='Other', isbn='0000000000002',
+                                    summary='S')
+        Book.objects.create(title='Third', isbn='0000000000003',
+                            summary='S')
+        etag = self.client.get(reverse('books'))['ETag']
+        # Moves a book to the first page, keeping its modification time:
+        # neither the latest one nor the number of books change
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(pk=other.pk).update(title='Aaa',
+                                                    modified=F('modified'))
+        response = self.client.get(reverse('books'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Aaa')
+
+    def test_logged_in_users_share_the_page(self):
+        url = self.book.get_absolute_url()
+        self.client.get(url)
+        User.objects.create_user(username='reader', password='pass')
+        self.client.login(username='reader', password='pass')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertContains(response, 'User: reader')
+        self.assertContains(response, 'Logout')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response['Cache-Control'], 'private')
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_user_sidebar_is_not_shared(self):
+        librarian = User.objects.create_user(username='librarian',
+                                             password='pass')
+        librarian.user_permissions.add(*Permission.objects.filter(
+            codename__in=['change_book', 'can_mark_returned']))
+        self.client.login(username='librarian', password='pass')
+        for url in (self.book.get_absolute_url(), reverse('books')):
+            response = self.client.get(url)
+            self.assertContains(response, 'User: librarian')
+            self.assertContains(response, 'All borrowed')
+        self.assertContains(self.client.get(self.book.get_absolute_url()),
+                            'Update book')
+        self.client.logout()
+        for url in (self.book.get_absolute_url(), reverse('books')):
+            response = self.client.get(url)
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertNotContains(response, 'librarian')
+            self.assertNotContains(response, 'All borrowed')
+            self.assertNotContains(response, 'Update book')
+            self.assertNotContains(response, 'user-sidebar')
+
+
+@override_settings(
+    CATALOG_PAGE_CACHE=True,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'test_catalog_cache'}})
+class DatabaseCacheTest(TestCase):
+    """The pages keep their query budgets (checked by the middleware) and
+    their hits run no query but the cache ones on a database cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('createcachetable')
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.book = Book.objects.create(title='Saga', isbn='0000000000001',
+                                       summary='Sea', author=cls.author)
+        BookInstance.objects.create(book=cls.book, imprint='I', status='a')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries
+                          if 'test_catalog_cache' not in query['sql']]
+
+    def test_budgets_and_hits(self):
+        for url in (reverse('index'), reverse('books'), reverse('authors')):
+            self.get(url)
+        self.client.cookies.clear()
+        for url in (self.book.get_absolute_url(),
+                    self.author.get_absolute_url()):
+            self.assertEqual(self.get(url)[0]['X-Cache'], 'MISS')
+            response, queries = self.get(url)
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertEqual(queries, [])
+
+
+class ModifiedTimestampTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.book = Book.objects.create(title='Saga', isbn='0000000000001',
+                                       summary='Sea', author=cls.author)
+
+    def modified(self, obj):
+        return type(obj).objects.values_list('modified', flat=True).get(
+            pk=obj.pk)
+
+    def assertTouched(self, obj, change):
+        before = self.modified(obj)
+        change()
+        self.assertGreater(self.modified(obj), before)
+
+    def test_writes_touch_the_pages_showing_them(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='I')
+        self.assertTouched(self.book, lambda: BookInstance.objects.filter(
+            pk=copy.pk).update(status='a'))
+        self.assertTouched(self.book, copy.delete)
+        self.assertTouched(self.author, lambda: Book.objects.filter(
+            pk=self.book.pk).update(title='Sunrise'))
+        self.assertTouched(self.book, lambda: self.book.genre.add(
+            Genre.objects.create(name='Drama')))
+        self.author.last_name = 'Sol'
+        self.assertTouched(self.book, self.author.save)
+
+    def test_bulk_update_sets_modified(self):
+        self.book.title = 'Sunrise'
+        self.assertTouched(self.book, lambda: Book.objects.bulk_update(
+            [self.book], ['title']))
+
+
+@override_settings(CATALOG_PAGE_CACHE=True)
+class PageCacheMixinTest(TestCase):
+
+    def test_requires_last_modified(self):
+        class PageView(PageCacheMixin, generic.View):
+            pass
+
+        request = RequestFactory().get('/page/')
+        with self.assertRaisesMessage(ImproperlyConfigured,
+                                      'Define PageView.get_last_modified()'):
+            PageView.as_view()(request)
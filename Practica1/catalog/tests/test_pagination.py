@@ -0,0 +1,80 @@
+import datetime
+
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import KeysetPaginator, ordering_expressions
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Libro', isbn='1234567890123')
+        today = datetime.date.today()
+        for num in range(23):
+            # Repeated and missing dates exercise ties and nulls
+            due_back = None if num % 7 == 0 else today + datetime.timedelta(
+                days=num % 4)
+            BookInstance.objects.create(book=book, due_back=due_back)
+
+    def expected(self):
+        keys = ('due_back', 'id')
+        return list(BookInstance.objects.order_by(
+            *ordering_expressions(BookInstance, keys)))
+
+    def test_forward_and_backward(self):
+        paginator = KeysetPaginator(
+            BookInstance.objects.all(), 5, ('due_back', 'id'))
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual(len(pages), 5)
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual(
+            [copy for page in pages for copy in page], self.expected())
+
+        page = pages[-1]
+        for previous in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), list(previous))
+        self.assertFalse(page.has_previous())
+
+    def test_optional_count(self):
+        queryset = BookInstance.objects.all()
+        self.assertEqual(KeysetPaginator(queryset, 5, ('id',)).count, 23)
+        paginator = KeysetPaginator(queryset, 5, ('id',), count=False)
+        with self.assertNumQueries(1):
+            paginator.page()
+            self.assertIsNone(paginator.count)
+
+
+class CursorListViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for num in range(13):
+            Author.objects.create(first_name='Ana %02d' % num,
+                                  last_name='Mar')
+
+    def test_cursor_mode(self):
+        resp = self.client.get(reverse('authors') + '?cursor=')
+        self.assertTrue(resp.context['cursor_pagination'])
+        self.assertEqual(len(resp.context['author_list']), 10)
+        self.assertContains(resp, '13 results.')
+        cursor = resp.context['page_obj'].next_cursor
+        resp = self.client.get(reverse('authors'), {'cursor': cursor})
+        self.assertEqual(
+            [author.first_name for author in resp.context['author_list']],
+            ['Ana 10', 'Ana 11', 'Ana 12'])
+        self.assertFalse(resp.context['page_obj'].has_next())
+
+    def test_page_mode_is_default(self):
+        resp = self.client.get(reverse('authors'))
+        self.assertFalse(resp.context['cursor_pagination'])
+        self.assertContains(resp, 'Page 1 of 2.')
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(reverse('authors'), {'cursor': 'nonsense'})
+        self.assertEqual(resp.status_code, 404)
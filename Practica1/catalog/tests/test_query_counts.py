@@ -0,0 +1,160 @@
+"""
+Every catalog page must render in a fixed number of queries, whatever the
+number of rows it shows. Each test renders a page, grows the data it
+displays from SMALL to LARGE rows and checks the query count is unchanged.
+"""
+
+import datetime
+from unittest.mock import patch
+
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import views
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import update_index
+
+SMALL = 10
+LARGE = 10000
+
+
+class ConstantQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='librarian', password='some_password')
+        cls.user.user_permissions.add(
+            *Permission.objects.filter(codename__in=[
+                'can_mark_returned', 'change_book', 'delete_book',
+                'change_author', 'delete_author']))
+        cls.author = Author.objects.create(first_name='Ana', last_name='Mar')
+        cls.language = Language.objects.create(name='English')
+        cls.genres = [Genre.objects.create(name='Genre %s' % num)
+                      for num in range(3)]
+        cls.book = cls.add_books(1)[0]
+
+    @classmethod
+    def add_books(cls, num):
+        start = Book.objects.count()
+        books = Book.objects.bulk_create([
+            Book(title='Saga %s' % (start + n), isbn='%013d' % (start + n),
+                 author=Author(pk=cls.author.pk), language=cls.language,
+                 summary='Summary')
+            for n in range(num)
+        ])
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=genre.pk)
+            for book in books for genre in cls.genres
+        ])
+        update_index([book.pk for book in books])
+        return books
+
+    def add_copies(self, num):
+        due_back = datetime.date.today()
+        BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, status='o', borrower=self.user,
+                         due_back=due_back + datetime.timedelta(days=n % 30))
+            for n in range(num)
+        ])
+
+    def count_queries(self, url):
+        cache.clear()
+        ContentType.objects.clear_cache()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, grow):
+        grow(SMALL)
+        small = self.count_queries(url)
+        grow(LARGE - SMALL)
+        self.assertEqual(self.count_queries(url), small)
+
+    def setUp(self):
+        self.client.login(username='librarian', password='some_password')
+
+    # Buffered visit counts save the session every few visits only
+    @override_settings(CATALOG_VISIT_COUNTER='session')
+    def test_index(self):
+        self.assertConstantQueries(reverse('index'), self.add_books)
+
+    def test_book_list(self):
+        with patch.object(views.BookListView, 'paginate_by', LARGE):
+            self.assertConstantQueries(reverse('books'), self.add_books)
+
+    def test_book_search(self):
+        # in_bulk() splits the ids of a page by the backend's parameter
+        # limit (999 on SQLite), so keep the page below it
+        with patch.object(views.BookSearchView, 'paginate_by', 500):
+            self.assertConstantQueries(
+                reverse('book-search') + '?q=saga', self.add_books)
+
+    def test_book_detail(self):
+        self.assertConstantQueries(self.book.get_absolute_url(),
+                                   self.add_copies)
+
+    def test_author_list(self):
+        def add_authors(num):
+            Author.objects.bulk_create([
+                Author(first_name='Ana', last_name='Mar %s' % n)
+                for n in range(num)
+            ])
+        with patch.object(views.AuthorListView, 'paginate_by', LARGE):
+            self.assertConstantQueries(reverse('authors'), add_authors)
+
+    def test_author_detail(self):
+        self.assertConstantQueries(self.author.get_absolute_url(),
+                                   self.add_books)
+
+    def test_author_delete_confirmation(self):
+        self.assertConstantQueries(
+            reverse('author-delete', args=[self.author.pk]), self.add_books)
+
+    def test_book_delete_confirmation(self):
+        self.assertConstantQueries(
+            reverse('book-delete', args=[self.book.pk]), self.add_copies)
+
+    def test_loans_of_user(self):
+        with patch.object(views.LoanedBooksByUserListView, 'paginate_by',
+                          LARGE):
+            self.assertConstantQueries(reverse('my-borrowed'),
+                                       self.add_copies)
+
+    def test_loans_of_staff(self):
+        with patch.object(views.LoanedBooksStaffListView, 'paginate_by',
+                          LARGE):
+            self.assertConstantQueries(reverse('all-borrowed'),
+                                       self.add_copies)
+
+    def login_admin(self):
+        User.objects.create_superuser(username='admin', password='pass')
+        self.client.login(username='admin', password='pass')
+
+    def test_admin_book_changelist(self):
+        self.login_admin()
+        self.assertConstantQueries(reverse('admin:catalog_book_changelist'),
+                                   self.add_books)
+
+    def test_admin_bookinstance_changelist(self):
+        self.login_admin()
+        self.assertConstantQueries(
+            reverse('admin:catalog_bookinstance_changelist'), self.add_copies)
+
+    def test_admin_book_change(self):
+        self.login_admin()
+        self.assertConstantQueries(
+            reverse('admin:catalog_book_change', args=[self.book.pk]),
+            self.add_copies)
+
+    def test_admin_author_change(self):
+        self.login_admin()
+        self.assertConstantQueries(
+            reverse('admin:catalog_author_change', args=[self.author.pk]),
+            self.add_books)
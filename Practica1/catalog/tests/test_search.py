@@ -0,0 +1,76 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, Genre
+from catalog.search import SearchResults
+
+
+class BookSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.king = Author.objects.create(
+            first_name='Stephen', last_name='King')
+        cls.horror = Genre.objects.create(name='Horror')
+        cls.shining = Book.objects.create(
+            title='The Shining', author=cls.king, isbn='9780345806789',
+            summary='A writer becomes caretaker of the Overlook Hotel.')
+        cls.shining.genre.add(cls.horror)
+        cls.robot = Book.objects.create(
+            title='I Robot', isbn='9780194242363',
+            summary='Short stories about a robot and a shining future.')
+
+    def titles(self, query):
+        return [book.title for book in SearchResults(query)[:10]]
+
+    def test_search_fields(self):
+        self.assertEqual(self.titles('overlook'), ['The Shining'])
+        self.assertEqual(self.titles('king'), ['The Shining'])
+        self.assertEqual(self.titles('horror'), ['The Shining'])
+        self.assertEqual(self.titles('9780194242363'), ['I Robot'])
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(self.titles('rob'), ['I Robot'])
+        self.assertEqual(self.titles('shining robot'), ['I Robot'])
+        self.assertEqual(self.titles(''), [])
+
+    def test_title_ranked_first(self):
+        self.assertEqual(self.titles('shining'), ['The Shining', 'I Robot'])
+
+    def test_incremental_updates(self):
+        self.king.last_name = 'Bachman'
+        self.king.save()
+        self.assertEqual(self.titles('bachman'), ['The Shining'])
+        self.robot.genre.add(self.horror)
+        self.assertEqual(len(self.titles('horror')), 2)
+        self.horror.name = 'Terror'
+        self.horror.save()
+        self.assertEqual(len(self.titles('terror')), 2)
+        self.robot.delete()
+        self.assertEqual(self.titles('robot'), [])
+
+    def test_queryset_updates(self):
+        Book.objects.filter(title='The Shining').update(title='Carrie')
+        self.assertEqual(self.titles('carrie'), ['Carrie'])
+        self.assertEqual(self.titles('overlook'), ['Carrie'])
+        self.robot.title = 'Misery'
+        Book.objects.bulk_update([self.robot], ['title'])
+        self.assertEqual(self.titles('misery'), ['Misery'])
+        Author.objects.filter(pk=self.king.pk).update(last_name='Bachman')
+        self.assertEqual(self.titles('bachman'), ['Carrie'])
+        Genre.objects.filter(pk=self.horror.pk).update(name='Terror')
+        self.assertEqual(self.titles('terror'), ['Carrie'])
+        Book.objects.filter(pk=self.robot.pk).update(author=self.king)
+        self.assertEqual(self.titles('bachman'), ['Carrie', 'Misery'])
+
+    def test_search_view(self):
+        for num in range(12):
+            Book.objects.create(title='Dune %s' % num, isbn='%013d' % num)
+        resp = self.client.get(reverse('book-search'), {'q': 'dune'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'catalog/book_search.html')
+        self.assertEqual(len(resp.context['book_list']), 10)
+        self.assertEqual(resp.context['paginator'].count, 12)
+        resp = self.client.get(reverse('book-search'),
+                               {'q': 'dune', 'page': 2})
+        self.assertEqual(len(resp.context['book_list']), 2)
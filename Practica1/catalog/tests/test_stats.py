@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.stats import get_catalog_stats, invalidate_catalog_stats
+
+
+class CatalogStatsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Ana', last_name='Mar')
+        Genre.objects.create(name='Drama')
+        for num in range(15):
+            book = Book.objects.create(
+                title='Casa %s' % num, isbn='%013d' % num, author=author)
+            BookInstance.objects.create(book=book, status='a')
+            BookInstance.objects.create(book=book, status='o')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts(self):
+        stats = get_catalog_stats()
+        self.assertEqual(stats['num_books'], 15)
+        self.assertEqual(stats['num_instances'], 30)
+        self.assertEqual(stats['num_instances_available'], 15)
+        self.assertEqual(stats['num_authors'], 1)
+        self.assertEqual(stats['num_genres'], 1)
+
+    def test_single_query_then_cached(self):
+        with self.assertNumQueries(1):
+            get_catalog_stats()
+        with self.assertNumQueries(0):
+            get_catalog_stats()
+
+    def test_invalidated_on_write(self):
+        get_catalog_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.create(name='Poesía')
+        self.assertEqual(get_catalog_stats()['num_genres'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.bulk_create([Genre(name='Teatro')])
+            # Until the commit, the committed counters are kept
+            self.assertEqual(get_catalog_stats()['num_genres'], 2)
+        self.assertEqual(get_catalog_stats()['num_genres'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(status='o').update(status='a')
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 30)
+
+    def test_explicit_invalidation(self):
+        get_catalog_stats()
+        invalidate_catalog_stats()
+        with self.assertNumQueries(1):
+            get_catalog_stats()
+
+    def test_index_books_with_a_paginated(self):
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(len(resp.context['num_books_with_a']), 10)
+        resp = self.client.get(reverse('index') + '?a_page=2')
+        self.assertEqual(len(resp.context['num_books_with_a']), 5)
@@ -0,0 +1,81 @@
+from io import StringIO
+
+from django.test import TestCase
+
+from catalog.importer import CatalogImporter
+from catalog.models import Author, Book, BookInstance, CatalogCounter
+from catalog.search import SearchResults
+
+AUTHORS = """first_name,last_name,date_of_birth,date_of_death
+Ana,Mar,1950-02-03,
+Luis,Sol,,
+Eva,Río,,
+"""
+
+BOOKS = """title,isbn,summary,author_first_name,author_last_name,\
+language,genre
+Saga,0000000000001,Sea,Ana,Mar,Spanish,Drama;Poetry
+Sun,0000000000002,Sun,Luis,Sol,,Drama
+Moon,0000000000003,Moon,Eva,Río,,
+"""
+
+
+def sync(kind, text, delete=False, batch_size=2):
+    importer = CatalogImporter(kind, batch_size, sync=True, delete=delete)
+    return importer.import_file(StringIO(text), 'csv').counts
+
+
+def counts(result):
+    return (result.inserted, result.updated, result.unchanged,
+            result.deleted)
+
+
+class CatalogSyncTest(TestCase):
+
+    def setUp(self):
+        sync('authors', AUTHORS)
+        sync('books', BOOKS)
+
+    def test_unchanged_rows_are_not_written(self):
+        with self.assertNumQueries(6):
+            # Language and genre maps, then per chunk: savepoint, book and
+            # author lookups, release
+            result = sync('books', BOOKS, batch_size=3)
+        self.assertEqual(counts(result), (0, 0, 3, 0))
+        self.assertEqual(counts(sync('authors', AUTHORS)), (0, 0, 3, 0))
+
+    def test_changed_rows_are_updated(self):
+        books = BOOKS.replace('Sun,0000000000002,Sun,Luis,Sol,,Drama',
+                              'Sunrise,0000000000002,Sun,Ana,Mar,,Poetry')
+        books += 'New,0000000000004,New,Luis,Sol,,\n'
+        self.assertEqual(counts(sync('books', books)), (1, 1, 2, 0))
+        book = Book.objects.get(isbn='0000000000002')
+        self.assertEqual(book.title, 'Sunrise')
+        self.assertEqual(book.author.last_name, 'Mar')
+        self.assertEqual([genre.name for genre in book.genre.all()],
+                         ['Poetry'])
+        self.assertEqual([b.isbn for b in SearchResults('sunrise')[:5]],
+                         ['0000000000002'])
+        self.assertEqual(CatalogCounter.objects.snapshot()['books'], 4)
+
+    def test_authors_keyed_on_normalized_name(self):
+        authors = AUTHORS.replace('Luis,Sol,,', 'LUIS , sol,1960-01-01,')
+        self.assertEqual(counts(sync('authors', authors)), (0, 1, 2, 0))
+        author = Author.objects.get(date_of_birth='1960-01-01')
+        self.assertEqual(author.book_set.get().isbn, '0000000000002')
+        self.assertEqual(Author.objects.count(), 3)
+
+    def test_delete_unseen(self):
+        BookInstance.objects.create(
+            book=Book.objects.get(isbn='0000000000003'), imprint='x')
+        books = BOOKS.split('Sun,')[0]
+        result = sync('books', books, delete=True)
+        # The book with a copy is kept
+        self.assertEqual(counts(result), (0, 0, 1, 1))
+        self.assertEqual(sorted(Book.objects.values_list('isbn', flat=True)),
+                         ['0000000000001', '0000000000003'])
+        self.assertEqual(CatalogCounter.objects.snapshot()['books'], 2)
+        # Luis Sol has no books left
+        result = sync('authors', AUTHORS.replace('Luis,Sol,,\n', ''),
+                      delete=True)
+        self.assertEqual(counts(result), (0, 0, 2, 1))
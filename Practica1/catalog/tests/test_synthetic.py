@@ -0,0 +1,85 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.synthetic import SyntheticCatalog, parse_status_weights
+
+
+def catalog(**scale):
+    options = dict(authors=5, books=40, genres=4, genres_per_book=2,
+                   copies_per_book=3, borrowers=6, seed=7,
+                   today=date(2030, 1, 1))
+    options.update(scale)
+    return SyntheticCatalog(**options)
+
+
+class SyntheticCatalogTest(TestCase):
+
+    def test_same_seed_same_records(self):
+        self.assertEqual(list(catalog().books()), list(catalog().books()))
+        self.assertEqual(list(catalog().copies()), list(catalog().copies()))
+        self.assertNotEqual(list(catalog(seed=8).books()),
+                            list(catalog().books()))
+
+    def test_larger_scale_extends_smaller(self):
+        small = list(catalog().books())
+        self.assertEqual(list(catalog(books=80).books())[:40], small)
+
+    def test_generate(self):
+        created = catalog().generate(batch_size=16)
+        self.assertEqual(created['books'], 40)
+        self.assertEqual(created['copies'], 120)
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(Genre.objects.count(), 4)
+        self.assertEqual(User.objects.filter(
+            username__startswith='reader').count(), 6)
+        for book in Book.objects.prefetch_related('genre'):
+            self.assertEqual(len(book.genre.all()), 2)
+        self.assertFalse(BookInstance.objects.on_loan().filter(
+            borrower=None).exists())
+        # Generating again adds nothing
+        self.assertEqual(set(catalog().generate().values()), {0})
+
+    def test_status_distribution(self):
+        catalog(books=200, status_weights={'o': 1, 'a': 3}).generate()
+        loans = BookInstance.objects.filter(status='o').count()
+        self.assertEqual(BookInstance.objects.exclude(
+            status__in='oa').count(), 0)
+        self.assertTrue(100 < loans < 200, loans)
+        self.assertEqual(parse_status_weights('m=0.5,o=0.5'),
+                         {'m': 0.5, 'o': 0.5})
+        with self.assertRaises(ValueError):
+            parse_status_weights('x=1')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_catalog', '--books=10', '--authors=2',
+                     '--copies-per-book=1', '--borrowers=1', stdout=out)
+        self.assertIn('10 books', out.getvalue())
+        self.assertEqual(BookInstance.objects.count(), 10)
+
+
+class BenchmarkCommandTest(TestCase):
+
+    def test_refuses_other_databases(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_indexes', '--database=default',
+                         stdout=StringIO())
+        self.assertFalse(Book.objects.exists())
+
+    def test_leaves_the_database_as_it_was(self):
+        out = StringIO()
+        call_command('benchmark_indexes', '--database=default', '--i-know',
+                     '--books=20', '--copies-per-book=2', '--repeat=1',
+                     stdout=out)
+        self.assertIn('authors by name', out.getvalue())
+        self.assertFalse(Book.objects.exists())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, BookInstance._meta.db_table)
+        self.assertIn('bookinstance_loan_due_idx', constraints)
@@ -0,0 +1,76 @@
+import time
+from importlib import import_module
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import visits
+
+
+class VisitCounterTest(TestCase):
+
+    def setUp(self):
+        visits._buffer.clear()
+        visits._flushed_at = time.monotonic()
+        self.addCleanup(visits._buffer.clear)
+
+    def visit(self, client=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(reverse('index'))
+        session_writes = [q for q in queries if 'django_session' in q['sql']
+                          and not q['sql'].startswith('SELECT')]
+        return response.context['num_visits'], len(session_writes)
+
+    @override_settings(CATALOG_VISIT_COUNTER='session')
+    def test_session(self):
+        self.assertEqual([self.visit() for _ in range(3)],
+                         [(1, 1), (2, 1), (3, 1)])
+
+    @override_settings(CATALOG_VISIT_COUNTER='buffered')
+    def test_buffered(self):
+        with mock.patch('catalog.visits.VISIT_FLUSH_EVERY', 3):
+            counts = [self.visit() for _ in range(5)]
+        # The first visit creates the session, the fourth flushes 3 visits
+        self.assertEqual(counts, [(1, 1), (2, 0), (3, 0), (4, 1), (5, 0)])
+        self.assertEqual(self.client.session['num_visits'], 4)
+
+    def stored_visits(self, client):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        return store(client.session.session_key)['num_visits']
+
+    @override_settings(CATALOG_VISIT_COUNTER='buffered')
+    def test_buffered_flush_interval(self):
+        other = self.client_class()
+        self.visit()
+        self.visit(other)
+        self.assertEqual(self.visit(), (2, 0))
+        with mock.patch('catalog.visits.time') as clock:
+            clock.monotonic.return_value = (visits._flushed_at +
+                                            visits.VISIT_FLUSH_INTERVAL)
+            # Writes the visits buffered for every session
+            self.assertEqual(self.visit(other), (2, 2))
+        self.assertEqual((self.stored_visits(self.client),
+                          self.stored_visits(other)), (2, 2))
+
+    @override_settings(CATALOG_VISIT_COUNTER='buffered')
+    def test_full_buffer_is_flushed(self):
+        other = self.client_class()
+        self.visit()
+        self.visit(other)
+        self.visit()
+        with mock.patch('catalog.visits.VISIT_BUFFER_SIZE', 1):
+            self.assertEqual(self.visit(other), (2, 2))
+        self.assertEqual((self.stored_visits(self.client),
+                          self.stored_visits(other)), (2, 2))
+
+    @override_settings(CATALOG_VISIT_COUNTER='cookie')
+    def test_cookie(self):
+        self.assertEqual([self.visit() for _ in range(3)],
+                         [(1, 0), (2, 0), (3, 0)])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.client.cookies['num_visits'] = '41'
+        self.assertEqual(self.visit(), (1, 0))
@@ -1,10 +1,11 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.BookSearchView.as_view(), name='book-search'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>',
          views.AuthorDetailView.as_view(),
@@ -15,10 +16,17 @@ urlpatterns = [
     path('allbooks/',
          views.LoanedBooksStaffListView.as_view(),
          name='all-borrowed'),
+    path('overdue/',
+         views.OverdueLoansView.as_view(),
+         name='overdue-loans'),
 ]
 urlpatterns += [
     path('book/<uuid:pk>/renew/', views.renew_book_librarian,
          name='renew-book-librarian'),
+    path('autocomplete/<slug:source>/', views.autocomplete_options,
+         name='catalog-autocomplete'),
+    path('export/<slug:kind>.<slug:format>', views.export_catalog,
+         name='catalog-export'),
 ]
 urlpatterns += [
     path('author/create/', views.AuthorCreate.as_view(),
@@ -36,3 +44,9 @@ urlpatterns += [
     path('book/<int:pk>/delete/', views.BookDelete.as_view(),
          name='book-delete'),
 ]
+urlpatterns += [
+    path('api/', api.api_root, name='api-root'),
+    path('api/lookup/', api.api_lookup, name='api-lookup'),
+    path('api/<slug:resource>/', api.api_list, name='api-list'),
+    path('api/<slug:resource>/<str:pk>', api.api_detail, name='api-detail'),
+]
@@ -1,106 +1,411 @@
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
 # Create your views here.
-from .models import Book, Author, BookInstance, Genre
+from .models import Book, Author, BookInstance, CatalogCounter
 from django.views import generic
 from django.urls import reverse
 import datetime
+import hashlib
 from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
-from catalog.forms import RenewBookForm
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.http import HttpResponse, JsonResponse
+from catalog.forms import BookForm, RenewBookForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-
-
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.db.models import Count, Max, Prefetch
+from catalog.stats import get_catalog_stats
+from catalog.search import SearchResults
+from catalog.pagination import KeysetPaginationMixin
+from catalog.middleware import query_budget
+from catalog.exports import CONTENT_TYPES, EXPORTS, export_lines
+from catalog.autocomplete import SOURCES, autocomplete
+from catalog.caching import (
+    cache_fill, cached_detail, detail_key, list_changed
+)
+from catalog.visits import count_visit, remember_visits
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date
+
+# Maximum number of "books containing 'a'" listed on the home page
+BOOKS_WITH_A_LIMIT = 100
+BOOKS_WITH_A_PAGE_SIZE = 10
+
+
+@query_budget(12)
 def index(request):
     """View function for home page of site."""
 
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(
-        status__exact='a').count()
+    # Counts of the main objects, computed in one query and cached
+    stats = get_catalog_stats()
 
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
-    num_genres = Genre.objects.count()
-    num_books_with_a = Book.objects.filter(title__icontains='a')
+    # Books with an 'a' in the title, capped and paginated
+    books_with_a = (
+        Book.objects.filter(title__icontains='a')
+        .only('id', 'title')[:BOOKS_WITH_A_LIMIT]
+    )
+    paginator = Paginator(books_with_a, BOOKS_WITH_A_PAGE_SIZE)
+    num_books_with_a = paginator.get_page(request.GET.get('a_page'))
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
-    num_visits += 1
-    request.session['num_visits'] = num_visits
+    # Number of visits to this view (see visits.py)
+    num_visits = count_visit(request)
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genres': num_genres,
+        **stats,
         'num_books_with_a': num_books_with_a,
         'num_visits': num_visits,
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
-
-
-class BookListView(generic.ListView):
+    return remember_visits(render(request, 'index.html', context=context),
+                           num_visits)
+
+
+# Where the user sidebar goes in a page shared by every user
+USER_SIDEBAR = '<!-- user-sidebar -->'
+
+
+class PageCacheMixin:
+    """
+    Caches whole pages, when the CATALOG_PAGE_CACHE setting is on.
+
+    A page is rendered once for every user, with USER_SIDEBAR in place of
+    the user sidebar (``shared_page`` is set while rendering), and the
+    sidebar of each user, from ``get_user_sidebar()``, is put in its place
+    when the page is served.
+
+    Anonymous visitors also get validators and a 304 for their conditional
+    GETs (``If-None-Match``, ``If-Modified-Since``). The validators are
+    made of ``get_last_modified()``, the modification time of what the page
+    shows, and of ``get_page_version()``, for the changes a timestamp
+    misses (deleted rows). Their pages are public and revalidated after
+    ``CATALOG_PAGE_MAX_AGE`` seconds; pages of logged-in users are private,
+    and both vary on the cookie.
+    """
+    shared_page = False
+
+    def get_last_modified(self):
+        """Modification time of what the page shows, or None."""
+        raise ImproperlyConfigured(
+            '%s is missing the modification time of its page. Define '
+            '%s.get_last_modified().' % ((self.__class__.__name__,) * 2))
+
+    def get_page_version(self):
+        return ''
+
+    def get_page_path(self):
+        return self.request.get_full_path()
+
+    def get_page_key(self):
+        """Cache key of the current version of the page."""
+        self.validators = self.get_validators()
+        return 'catalog:page:%s' % self.validators[0].strip('"')
+
+    def get_validators(self):
+        """Returns the (ETag, Last-Modified timestamp) of the page."""
+        last_modified = self.get_last_modified()
+        etag = hashlib.md5(('%s|%s|%s' % (
+            self.get_page_path(), last_modified and last_modified.isoformat(),
+            self.get_page_version())).encode()).hexdigest()
+        return ('"%s"' % etag,
+                last_modified and int(last_modified.timestamp()))
+
+    def get_user_sidebar(self):
+        """Sidebar of the current user."""
+        return render_to_string('catalog/user_sidebar.html', {}, self.request)
+
+    def render_page(self):
+        self.shared_page = True
+        try:
+            response = super().dispatch(self.request, *self.args,
+                                        **self.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        finally:
+            self.shared_page = False
+        self.rendered = response
+        etag, last_modified = self.validators or self.get_validators()
+        return {'status': response.status_code, 'content': response.content,
+                'content_type': response['Content-Type'], 'etag': etag,
+                'last_modified': last_modified}
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.CATALOG_PAGE_CACHE \
+                or request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        self.rendered = self.validators = None
+        page = cache_fill(
+            self.get_page_key(), self.render_page,
+            settings.CATALOG_PAGE_CACHE_TIMEOUT)
+        anonymous = not request.user.is_authenticated
+        response = None
+        if anonymous:
+            response = get_conditional_response(
+                request, etag=page['etag'],
+                last_modified=page['last_modified'])
+        if response is None:
+            response = HttpResponse(
+                page['content'].replace(USER_SIDEBAR.encode(),
+                                        self.get_user_sidebar().encode(), 1),
+                status=page['status'], content_type=page['content_type'])
+            response['X-Cache'] = self.rendered.get('X-Cache', 'MISS') \
+                if self.rendered else 'HIT'
+        if anonymous:
+            response['ETag'] = page['etag']
+            if page['last_modified'] is not None:
+                response['Last-Modified'] = http_date(page['last_modified'])
+            patch_cache_control(response, public=True,
+                                max_age=settings.CATALOG_PAGE_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class ListPageCacheMixin(PageCacheMixin):
+    """Page cache of a list of a counted model: the validators are the
+    latest modification time and the number of objects, and the last
+    invalidation of their pages (see caching.list_changed()), which also
+    changes when objects move between pages or are deleted."""
+
+    def get_last_modified(self):
+        last_modified = self.model.objects.aggregate(
+            Max('modified'))['modified__max']
+        changed = datetime.datetime.fromtimestamp(
+            list_changed(self.model._meta.model_name),
+            datetime.timezone.utc)
+        return max(last_modified, changed) if last_modified else changed
+
+    def get_page_version(self):
+        name = CatalogCounter.MODEL_COUNTERS[self.model._meta.model_name]
+        return '%s:%s' % (
+            CatalogCounter.objects.filter(name=name).values_list(
+                'value', flat=True).first(),
+            list_changed(self.model._meta.model_name))
+
+
+class DetailPageCacheMixin(PageCacheMixin):
+    """Page cache of a detail page with cached parts (see
+    CachedDetailMixin), kept along them: a hit runs no query."""
+
+    def get_last_modified(self):
+        return self.model.objects.filter(
+            pk=self.kwargs[self.pk_url_kwarg]).values_list(
+            'modified', flat=True).first()
+
+    def get_page_key(self):
+        return detail_key(self.model._meta.model_name,
+                          self.kwargs[self.pk_url_kwarg], 'page')
+
+    def get_page_path(self):
+        # The cached page is shared by every query string
+        return self.request.path
+
+    def get_user_sidebar(self):
+        return super().get_user_sidebar() + ''.join(
+            self.get_user_parts().values())
+
+
+class BookListView(ListPageCacheMixin, KeysetPaginationMixin,
+                   generic.ListView):
     model = Book
+    query_budget = 8
+    queryset = Book.objects.select_related('author')
     paginate_by = 2
+    keyset_ordering = ('title', 'id')
+
+
+class CachedDetailMixin:
+    """
+    DetailView whose object parts are cached (see caching.py): the
+    ``<model>_detail_content.html`` fragment once for every user, and the
+    ``<model>_detail_sidebar.html`` fragment, shown with the user sidebar,
+    per set of ``detail_permissions`` of the user. A hit renders the page
+    without loading the object.
+    """
+    detail_permissions = ()
+    shared_parts = ('content',)
+    user_parts = ('sidebar',)
+
+    def render_parts(self, parts):
+        if getattr(self, 'object', None) is None:
+            self.object = self.get_object()
+        context = self.get_context_data(object=self.object)
+        return {
+            part: render_to_string('catalog/%s_detail_%s.html' % (
+                self.model._meta.model_name, part), context, self.request)
+            for part in parts
+        }
+
+    def get_user_parts(self):
+        """The parts depending on the permissions of the user."""
+        variant = ''.join('1' if self.request.user.has_perm(perm) else '0'
+                          for perm in self.detail_permissions)
+        parts, _ = cached_detail(
+            self.model._meta.model_name, self.kwargs[self.pk_url_kwarg],
+            variant, lambda: self.render_parts(self.user_parts),
+            counted=False)
+        return parts
+
+    def get(self, request, *args, **kwargs):
+        self.object = None
+        parts, hit = cached_detail(
+            self.model._meta.model_name, kwargs[self.pk_url_kwarg], 'shared',
+            lambda: self.render_parts(self.shared_parts))
+        if not getattr(self, 'shared_page', False):
+            parts = {**parts, **self.get_user_parts()}
+        response = self.render_to_response({
+            'view': self,
+            'detail': {part: mark_safe(html) for part, html in parts.items()},
+        })
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+
+class BookDetailView(DetailPageCacheMixin, CachedDetailMixin,
+                     generic.DetailView):
+    model = Book
+    query_budget = 9
+    detail_permissions = ('catalog.change_book', 'catalog.delete_book')
+    queryset = (
+        Book.objects.select_related('author', 'language')
+        .prefetch_related('genre', 'bookinstance_set')
+    )
+
+
+class BookSearchView(generic.ListView):
+    """Ranked full-text search over titles, authors, summaries, genres
+    and ISBNs."""
+    template_name = 'catalog/book_search.html'
+    query_budget = 9
+    paginate_by = 10
 
+    def get_queryset(self):
+        return SearchResults(self.request.GET.get('q', ''))
 
-class BookDetailView(generic.DetailView):
-    model = Book
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
 
 
-class AuthorListView(generic.ListView):
+class AuthorListView(ListPageCacheMixin, KeysetPaginationMixin,
+                     generic.ListView):
     model = Author
+    query_budget = 8
     paginate_by = 10
+    keyset_ordering = ('last_name', 'first_name', 'id')
 
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(DetailPageCacheMixin, CachedDetailMixin,
+                       generic.DetailView):
     model = Author
+    query_budget = 8
+    detail_permissions = ('catalog.change_author', 'catalog.delete_author')
+    queryset = Author.objects.prefetch_related('book_set')
 
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+class LoanedBooksByUserListView(LoginRequiredMixin, KeysetPaginationMixin,
+                                generic.ListView):
     """Generic class-based view listing books on loan to current user."""
     model = BookInstance
+    query_budget = 8
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
         return (
             BookInstance.objects.filter(borrower=self.request.user)
             .filter(status__exact='o')
-            .order_by('due_back')
+            .select_related('book')
+            .order_by(*self.get_ordering())
         )
 
 
-class LoanedBooksStaffListView(PermissionRequiredMixin, generic.ListView):
+class LoanedBooksStaffListView(PermissionRequiredMixin, KeysetPaginationMixin,
+                               generic.ListView):
     permission_required = 'catalog.can_mark_returned'
     model = BookInstance
+    query_budget = 8
     template_name = 'catalog/bookinstance_list_borrowed_staff.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
         return (
             BookInstance.objects
             .filter(status__exact='o')
-            .order_by('due_back')
+            .select_related('book', 'borrower')
+            .order_by(*self.get_ordering())
         )
 
 
+class OverdueLoansView(PermissionRequiredMixin, KeysetPaginationMixin,
+                       generic.ListView):
+    """Staff report of overdue loans, filtered by a minimum number of days
+    overdue and optionally by borrower, with the overdue count of every
+    borrower."""
+    permission_required = 'catalog.can_mark_returned'
+    model = BookInstance
+    query_budget = 10
+    template_name = 'catalog/bookinstance_list_overdue.html'
+    paginate_by = 20
+    # Number of borrowers listed in the summary
+    borrowers_shown = 20
+
+    @property
+    def keyset_ordering(self):
+        # Most overdue (oldest due date) first unless sort=least
+        if self.request.GET.get('sort') == 'least':
+            return ('-due_back', '-id')
+        return ('due_back', 'id')
+
+    def get_min_days(self):
+        try:
+            return max(int(self.request.GET.get('min_days', 1)), 1)
+        except ValueError:
+            return 1
+
+    def get_queryset(self):
+        queryset = (
+            BookInstance.objects.overdue(min_days=self.get_min_days())
+            .with_days_overdue()
+            .select_related('book', 'borrower')
+            .order_by(*self.get_ordering())
+        )
+        if self.request.GET.get('borrower', '').isdigit():
+            queryset = queryset.filter(borrower=self.request.GET['borrower'])
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params.pop(self.cursor_kwarg, None)
+        context['filter_query'] = params.urlencode()
+        context['min_days'] = self.get_min_days()
+        context['overdue_by_borrower'] = (
+            BookInstance.objects.overdue_by_borrower()[:self.borrowers_shown])
+        return context
+
+
+@query_budget(8)
 @login_required
 @permission_required('catalog.can_mark_returned', login_url='/accounts/login/')
 def renew_book_librarian(request, pk):
     """View function for renewing a specific BookInstance by librarian."""
-    book_instance = get_object_or_404(BookInstance, pk=pk)
+    book_instance = get_object_or_404(
+        BookInstance.objects.select_related('book', 'borrower'), pk=pk)
 
     # If this is a POST request then process the Form data
     if request.method == 'POST':
@@ -125,8 +430,32 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context)
 
 
+@query_budget(4)
+@login_required
+@permission_required('catalog.can_mark_returned', login_url='/accounts/login/')
+def export_catalog(request, kind, format):
+    """Streams a CSV or JSON Lines export of books, copies or loans."""
+    if kind not in EXPORTS or format not in CONTENT_TYPES:
+        raise Http404('Unknown export.')
+    response = StreamingHttpResponse(export_lines(kind, format),
+                                     content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = (
+        'attachment; filename="%s.%s"' % (kind, format))
+    return response
+
+
+@query_budget(3)
+def autocomplete_options(request, source):
+    """Options of a book form picker starting with ``?q=`` as JSON."""
+    if source not in SOURCES:
+        raise Http404('Unknown source.')
+    return JsonResponse(
+        {'results': autocomplete(source, request.GET.get('q', ''))})
+
+
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
+    query_budget = 10
     fields = ['first_name', 'last_name', 'date_of_birth', 'date_of_death']
     initial = {'date_of_death': '11/11/2023'}
     permission_required = 'catalog.add_author'
@@ -134,6 +463,7 @@ class AuthorCreate(PermissionRequiredMixin, CreateView):
 
 class AuthorUpdate(PermissionRequiredMixin, UpdateView):
     model = Author
+    query_budget = 10
     # Not recommended (potential security issue if more fields added)
     fields = '__all__'
     permission_required = 'catalog.change_author'
@@ -141,6 +471,11 @@ class AuthorUpdate(PermissionRequiredMixin, UpdateView):
 
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
+    query_budget = 10
+    queryset = Author.objects.prefetch_related(Prefetch(
+        'book_set',
+        queryset=Book.objects.annotate(num_copies=Count('bookinstance')),
+    ))
     success_url = reverse_lazy('authors')
     permission_required = 'catalog.delete_author'
 
@@ -156,7 +491,8 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
 
 class BookCreate(PermissionRequiredMixin, CreateView):
     model = Book
-    fields = ['title', 'author', 'summary', 'isbn', 'language', 'genre']
+    query_budget = 24
+    form_class = BookForm
     permission_required = 'catalog.can_mark_returned'
 
     def form_valid(self, form):
@@ -170,13 +506,14 @@ class BookCreate(PermissionRequiredMixin, CreateView):
 
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     model = Book
-    # Not recommended (potential security issue if more fields added)
-    fields = '__all__'
+    query_budget = 24
+    form_class = BookForm
     permission_required = 'catalog.change_book'
 
 
 class BookDelete(PermissionRequiredMixin, DeleteView):
     model = Book
+    query_budget = 10
     success_url = reverse_lazy('books')
     permission_required = 'catalog.delete_book'
 
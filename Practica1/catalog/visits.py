@@ -0,0 +1,111 @@
+"""
+Visit counter of the home page, counted where CATALOG_VISIT_COUNTER says:
+
+- 'cookie' (the default): in a signed cookie. The session is not touched,
+  so anonymous visitors never get a session row.
+- 'session': in the session, which is saved (an UPDATE of django_session)
+  on every visit.
+- 'buffered': in the session, but only the first visit saves it; the
+  following ones are added up in a buffer of the process. A session gets
+  its visits written on its VISIT_FLUSH_EVERY-th buffered visit, and every
+  session with buffered visits gets them written by the first visit after
+  VISIT_FLUSH_INTERVAL seconds, when the buffer is full, or when the
+  process exits. The number shown includes the visits buffered by the
+  process serving it, so with several processes it may lag behind.
+"""
+
+import atexit
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core import signing
+
+VISIT_COOKIE = 'num_visits'
+VISIT_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+VISIT_FLUSH_EVERY = 10
+VISIT_FLUSH_INTERVAL = 60
+
+# Maximum number of sessions with buffered visits
+VISIT_BUFFER_SIZE = 10000
+
+# {session key: buffered visits}
+_buffer = {}
+_buffer_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _buffer_visit(key):
+    """Adds a visit of session ``key`` to the buffer. Returns the buffered
+    visits and whether they must be written to the session now."""
+    with _buffer_lock:
+        visits = _buffer.pop(key, 0) + 1
+        if visits >= VISIT_FLUSH_EVERY:
+            return visits, True
+        _buffer[key] = visits
+        return visits, False
+
+
+def _take_buffer(force=False):
+    """Empties the buffer when it is due for a flush (or with ``force``)
+    and returns the visits it had."""
+    global _flushed_at
+    now = time.monotonic()
+    with _buffer_lock:
+        if not force and len(_buffer) < VISIT_BUFFER_SIZE \
+                and now - _flushed_at < VISIT_FLUSH_INTERVAL:
+            return {}
+        visits = dict(_buffer)
+        _buffer.clear()
+        _flushed_at = now
+    return visits
+
+
+def flush_visits(force=False):
+    """Writes the buffered visits of every session when the buffer is due
+    for a flush (or with ``force``)."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    for key, visits in _take_buffer(force).items():
+        session = store(session_key=key)
+        # Expired sessions have nothing to add the visits to
+        if VISIT_COOKIE in session:
+            session[VISIT_COOKIE] += visits
+            session.save()
+
+
+atexit.register(flush_visits, force=True)
+
+
+def count_visit(request):
+    """Counts a visit of the current user to the home page and returns
+    the number of visits so far."""
+    mode = getattr(settings, 'CATALOG_VISIT_COUNTER', 'session')
+    if mode == 'cookie':
+        try:
+            visits = int(request.get_signed_cookie(VISIT_COOKIE, 0))
+        except (signing.BadSignature, ValueError):
+            visits = 0
+        return visits + 1
+    session = request.session
+    if mode == 'buffered' and session.session_key \
+            and VISIT_COOKIE in session:
+        visits, flush = _buffer_visit(session.session_key)
+        flush_visits()
+        if not flush:
+            return session[VISIT_COOKIE] + visits
+        session[VISIT_COOKIE] += visits
+        return session[VISIT_COOKIE]
+    session[VISIT_COOKIE] = session.get(VISIT_COOKIE, 0) + 1
+    return session[VISIT_COOKIE]
+
+
+def remember_visits(response, visits):
+    """Keeps the number of ``visits`` in the response, when counted in a
+    cookie."""
+    if getattr(settings, 'CATALOG_VISIT_COUNTER', 'session') == 'cookie':
+        response.set_signed_cookie(VISIT_COOKIE, visits,
+                                   max_age=VISIT_COOKIE_MAX_AGE,
+                                   httponly=True, samesite='Lax')
+    return response
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from dotenv import load_dotenv
 import os
+import sys
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 
@@ -69,6 +71,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Reports the SQL queries of every request (first, so it sees them all)
+    'catalog.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -183,6 +187,71 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Seconds the home page statistics are kept in the cache
+CATALOG_STATS_TIMEOUT = int(os.getenv('CATALOG_STATS_TIMEOUT', 60))
+
+# Pagination of the catalog lists: 'page' (numbered pages, for small
+# tables) or 'cursor' (keyset pagination, constant cost per page)
+CATALOG_PAGINATION_MODE = os.getenv('CATALOG_PAGINATION_MODE', 'page')
+
+# Views over their query budget fail when testing, and only log a warning
+# otherwise
+RUNNING_TESTS = os.getenv('TESTING') == '1' or sys.argv[1:2] == ['test']
+CATALOG_QUERY_BUDGET_STRICT = RUNNING_TESTS
+
+# Cache shared by every worker process: the fill locks of caching.py and
+# the version tokens of the cached pages only work if all workers see them.
+# CACHE_URL is redis://host:port/db, or db://table (a database table, made
+# with `manage.py createcachetable`; it adds cache queries to every request,
+# which the query budgets leave out). Without it each process gets a local
+# memory cache, which the catalog.W001 check warns about outside the tests.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if RUNNING_TESTS or not CACHE_URL:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+elif CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('db://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': CACHE_URL[len('db://'):]}}
+else:
+    raise ImproperlyConfigured('Unsupported CACHE_URL: %s' % CACHE_URL)
+
+# Whole catalog pages cached for anonymous visitors (off when testing, so
+# each test renders its pages), kept CATALOG_PAGE_CACHE_TIMEOUT seconds and
+# revalidated by browsers and proxies after CATALOG_PAGE_MAX_AGE seconds
+CATALOG_PAGE_CACHE = not RUNNING_TESTS
+CATALOG_PAGE_CACHE_TIMEOUT = int(os.getenv('CATALOG_PAGE_CACHE_TIMEOUT', 600))
+CATALOG_PAGE_MAX_AGE = int(os.getenv('CATALOG_PAGE_MAX_AGE', 0))
+
+# Where the home page visits are counted: 'cookie' (a signed cookie,
+# sessions untouched), 'session' (a session save per visit, what the course
+# tests check) or 'buffered' (sessions saved every few visits); see
+# catalog/visits.py
+CATALOG_VISIT_COUNTER = os.getenv(
+    'CATALOG_VISIT_COUNTER', 'session' if RUNNING_TESTS else 'cookie')
+
+# One JSON line per request with its SQL activity (catalog.queries logger)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'catalog.queries': {
+            'handlers': ['console'],
+            'level': os.getenv(
+                'CATALOG_QUERY_LOG_LEVEL',
+                'WARNING' if RUNNING_TESTS else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 
 # Configuración de pruebas
@@ -192,4 +261,17 @@ else:
     DATABASES['default'] = dj_database_url.config(default=os.getenv('NEON_URL'), conn_max_age=500)
 
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Scratch database that benchmark_indexes may fill with synthetic data and
+# strip of its indexes; it refuses to run on any other database alias
+if os.getenv('SCRATCH_DATABASE_URL'):
+    DATABASES['scratch'] = dj_database_url.parse(
+        os.getenv('SCRATCH_DATABASE_URL'))
+CATALOG_SCRATCH_DATABASES = ['scratch']
+
+# Operator classes of the prefix search indexes (see PrefixIndex). The app
+# needs psycopg2, so it is only installed when a database is PostgreSQL
+if any(db.get('ENGINE', '').startswith('django.db.backends.postgresql')
+       for db in DATABASES.values()):
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('catalog.apps.CatalogConfig'),
+                          'django.contrib.postgres')
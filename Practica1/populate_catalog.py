@@ -9,7 +9,7 @@ import os
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
 django.setup()
 
-from catalog.models import Book, BookInstance, Language, Genre, Author
+from catalog.loader import CatalogLoader
 
 def populate():
 
@@ -77,84 +77,46 @@ def populate():
 
     book_instances = [
         {
-            'book': books[0]['title'],
+            'book': books[0]['isbn'],
             'imprint': 'It was restored three years ago.',
             'due_back': '2021-10-10',
             'status': 'o'
         },
         {
-            'book': books[0]['title'],
+            'book': books[0]['isbn'],
             'imprint': 'New purchase.',
             'due_back': '',
             'status': 'a'
         },
         {
-            'book': books[1]['title'],
+            'book': books[1]['isbn'],
             'imprint': 'Nueva edición comprada hace dos años.',
             'due_back': '2021-10-20',
             'status': 'o'
         },
         {
-            'book': books[2]['title'],
+            'book': books[2]['isbn'],
             'imprint': 'It comes from the main library.',
             'due_back': '',
             'status': 'a'
         },
         {
-            'book': books[3]['title'],
+            'book': books[3]['isbn'],
             'imprint': 'It is a non-remunerated donation.',
             'due_back': '',
             'status': 'r'
         }
     ]
 
-    for lan in languages:
-        lang = Language(name=lan['name'])
-        lang.save()
-
-    for gen in genres:
-        genr = Genre(name=gen['name'])
-        genr.save()
-
-    for aut in authors:
-        if not aut['date_of_death']:
-            dod = None
-        else:
-            dod = aut['date_of_death']
-        auth = Author(first_name=aut['first_name'], last_name=aut['last_name'],
-                      date_of_birth=aut['date_of_birth'], date_of_death=dod)
-        auth.save()
-
-    for bo in books:
-        t = bo['title']
-        s = bo['summary']
-        isb = bo['isbn']
-        l = bo['language']
-        g = bo['genre']
-        a_fn = bo['author']['first_name']
-        a_ln = bo['author']['last_name']
-
-        aut = Author.objects.filter(
-            first_name__contains=a_fn, last_name__contains=a_ln).first()
-        lang = Language.objects.filter(name__contains=l).first()
-        new_book = Book(title=t, isbn=isb, summary=s,
-                        author=aut, language=lang)
-        # A first save is convenient to avoid Foreign Key problems with the N-M relation
-        new_book.save()
-        for ge in g:
-            gen = Genre.objects.filter(name__contains=ge).first()
-            new_book.genre.add(gen)
-        new_book.save()
-
-    for bi in book_instances:
-        bok = Book.objects.filter(title__contains=bi['book']).first()
-        if not bi['due_back']:
-            db = None
-        else:
-            db = bi['due_back']
-        new_book_instance = BookInstance(
-            book=bok, imprint=bi['imprint'], due_back=db, status=bi['status'])
-        new_book_instance.save()
+    # References are resolved in memory and rows inserted in bulk; running
+    # the script again does not duplicate anything.
+    return CatalogLoader().load(
+        languages=[lan['name'] for lan in languages],
+        genres=[gen['name'] for gen in genres],
+        authors=authors,
+        books=books,
+        copies=book_instances,
+    )
 
 
 if __name__ == '__main__':
@@ -7,6 +7,8 @@ cd Practica1
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Table of the database cache, when CACHE_URL is db://<table>
+python manage.py createcachetable
 
 echo "Verificando si el superusuario alumnodb ya existe..."
 EXISTING_USER=$(echo "from django.contrib.auth import get_user_model; print(get_user_model().objects.filter(username='alumnodb').exists())" | python manage.py shell)